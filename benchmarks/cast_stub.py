@@ -0,0 +1,52 @@
+"""Local stand-in for cast_service used by the load tests.
+
+Every cast id up to ``CAST_STUB_SIZE`` exists, answers take
+``CAST_STUB_LATENCY`` seconds. Run with ``uvicorn cast_stub:app`` from this
+directory.
+"""
+import asyncio
+import os
+from typing import List
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+CAST_STUB_SIZE = int(os.environ.get("CAST_STUB_SIZE", 1000))
+CAST_STUB_LATENCY = float(os.environ.get("CAST_STUB_LATENCY", 0))
+
+app = FastAPI()
+
+
+class CastBatchIn(BaseModel):
+    ids: List[int]
+
+
+def make_cast(cast_id: int) -> dict:
+    return {"id": cast_id, "name": f"Cast {cast_id}", "nationality": "Stub"}
+
+
+@app.post("/api/v1/casts/_batch")
+async def get_casts_batch(payload: CastBatchIn):
+    if CAST_STUB_LATENCY:
+        await asyncio.sleep(CAST_STUB_LATENCY)
+    unique_ids = list(dict.fromkeys(payload.ids))
+    return {
+        "casts": [make_cast(cast_id) for cast_id in unique_ids if 0 < cast_id <= CAST_STUB_SIZE],
+        "missing": [cast_id for cast_id in unique_ids if not 0 < cast_id <= CAST_STUB_SIZE],
+    }
+
+
+@app.get("/api/v1/casts/_events")
+async def get_cast_events(after_id: int = 0, limit: int = 1000):
+    # No events, so movie_service validates every cast id against the stub.
+    return []
+
+
+@app.get("/api/v1/casts/{cast_id}/")
+async def get_cast_by_id(cast_id: int):
+    if CAST_STUB_LATENCY:
+        await asyncio.sleep(CAST_STUB_LATENCY)
+    if not 0 < cast_id <= CAST_STUB_SIZE:
+        raise HTTPException(status_code=404, detail=f"Cast with given id {cast_id} not found")
+    return make_cast(cast_id)
+
@@ -0,0 +1,94 @@
+"""Requests per second and latency through the nginx gateway.
+
+Drives the read endpoints of an already running stack through the gateway
+(``docker-compose up``), so the effect of the gateway configuration -
+keepalive upstream pools, response caching, replicas - can be compared
+between two runs::
+
+    git stash -- nginx_config.conf && docker-compose restart nginx
+    python benchmarks/gateway.py --output before.json
+    git stash pop && docker-compose restart nginx
+    python benchmarks/gateway.py --baseline before.json
+
+Movie and cast ids are discovered from the first list page, seed the stack
+beforehand, e.g. with ``loadtest.py`` or the ``_bulk`` endpoints. Responses
+served from the gateway cache are counted from the ``X-Cache-Status`` header.
+"""
+import argparse
+import asyncio
+import json
+from collections import Counter
+
+import httpx
+
+from loadtest import DEFAULT_MIX, Workload, drive, git_revision, parse_mix, print_report
+
+READ_MIX = {name: weight for name, weight in DEFAULT_MIX.items()
+            if name not in {"create_movie", "patch_movie"}}
+
+
+class GatewayWorkload(Workload):
+    def __init__(self, url: str, cast_ids: list, movie_ids: list):
+        super().__init__(url, url, cast_ids)
+        self.movie_ids = movie_ids
+        self.cache_status = Counter()
+
+
+async def load_ids(client: httpx.AsyncClient, url: str) -> list:
+    response = await client.get(url, params={"limit": 1000})
+    response.raise_for_status()
+    return [record["id"] for record in response.json()]
+
+
+def count_cache_status(workload: GatewayWorkload):
+    async def record(response: httpx.Response):
+        workload.cache_status[response.headers.get("x-cache-status", "NONE")] += 1
+    return record
+
+
+async def main(args):
+    async with httpx.AsyncClient(timeout=30) as client:
+        movie_ids = await load_ids(client, f"{args.url}/api/v1/movies/")
+        cast_ids = await load_ids(client, f"{args.url}/api/v1/casts/")
+    if not movie_ids or not cast_ids:
+        raise SystemExit("Seed some movies and casts before benchmarking the gateway.")
+
+    workload = GatewayWorkload(args.url, cast_ids, movie_ids)
+    results = await drive(workload, args.mix, args.concurrency, args.duration,
+                          event_hooks={"response": [count_cache_status(workload)]})
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "url": args.url,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mix": args.mix,
+            "cache_status": dict(workload.cache_status),
+        },
+        "results": results,
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+    print_report(results, baseline)
+    print("gateway cache:", ", ".join(f"{status} {count}" for status, count
+                                      in workload.cache_status.most_common()))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8080", help="Gateway base URL.")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of load.")
+    parser.add_argument("--mix", type=parse_mix, default=READ_MIX,
+                        help="Weighted operations, e.g. get_movie=50,list_movies=10")
+    parser.add_argument("--baseline", help="Results JSON of a previous run to compare with.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    asyncio.run(main(parser.parse_args()))
@@ -1,23 +1,86 @@
-from fastapi import APIRouter, HTTPException, Request
-from typing import List
-
-from app.api.models import CastOut, CastIn, CastUpdate
-from app.api import db_manager
+from fastapi import (APIRouter, BackgroundTasks, HTTPException, Query, Request,
+                     Response)
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+from functools import partial
+from typing import List, Literal, Optional
+
+from app.api.models import (BulkOut, CastBatchIn, CastBatchOut, CastEventOut, CastIn,
+                            CastOut, CastPatch, CastUpdate)
+from app.api import db_manager, shared_cache
+from app.api.bulk import insert_chunk, iter_bulk_items, iter_chunks, validate_chunk
+from app.api.export import Export
+from app.api.http_cache import conditional_response, rows_etag
+from app.api.serializers import (CAST, CAST_BATCH, CAST_EVENT_LIST, CAST_LIST, as_dict,
+                                 entry_response, json_response)
+from app.api.shared_cache import Entry
+from app.api.service import notify_cast_changed
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
+BULK_CHUNK_SIZE = 500
+EVENTS_PAGE_SIZE = 1000
+MAX_EVENTS_PAGE_SIZE = 10000
+LIST_QUERY_PARAMS = {"after_id", "limit", "format"}
 
 casts = APIRouter()
 
 
+async def stream_casts(after_id: int):
+    async for cast in db_manager.iterate_casts(after_id, STREAM_CHUNK_SIZE):
+        yield CAST.dump_json(as_dict(cast)) + b"\n"
+
+
+async def load_casts_page(after_id: int, limit: int) -> Entry:
+    page = await db_manager.get_all_casts(after_id=after_id, limit=limit + 1)
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = str(page[-1]["id"])
+    return Entry.render(CAST_LIST, [as_dict(cast) for cast in page],
+                        etag=rows_etag(page, next_cursor), next_cursor=next_cursor)
+
+
+async def load_cast(cast_id: int) -> Optional[Entry]:
+    cast = await db_manager.get_cast_by_id(cast_id)
+    if not cast:
+        return None
+    return Entry.render(CAST, as_dict(cast), etag=rows_etag([cast]),
+                        last_modified=cast["updated_at"].isoformat())
+
+
 @casts.get(path="/", response_model=List[CastOut])
-async def get_all_cast(request: Request):
-    if request.query_params:
+async def get_all_cast(request: Request, response: Response,
+                       after_id: int = Query(default=0, ge=0),
+                       limit: int = Query(default=PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                       output_format: Literal["json", "ndjson"] = Query(default="json",
+                                                                        alias="format")):
+    unsupported = sorted(set(request.query_params) - LIST_QUERY_PARAMS)
+    if unsupported:
         raise HTTPException(status_code=400,
-                            detail="This endpoint does not support query parameters.")
-    return await db_manager.get_all_casts()
+                            detail="This endpoint does not support query parameters: "
+                                   f"{', '.join(unsupported)}.")
+
+    if output_format == "ndjson":
+        return StreamingResponse(stream_casts(after_id),
+                                 media_type="application/x-ndjson")
+
+    entry = await shared_cache.get_list("casts", (after_id, limit),
+                                        lambda: load_casts_page(after_id, limit))
+    if entry.meta["next_cursor"] is not None:
+        response.headers["X-Next-Cursor"] = entry.meta["next_cursor"]
+
+    not_modified = conditional_response(request, response, entry.meta["etag"])
+    if not_modified:
+        return not_modified
+    return entry_response(entry, response)
 
 
 @casts.post(path="/", response_model=CastOut, status_code=201)
-async def create_cast(payload: CastIn):
+async def create_cast(payload: CastIn, background_tasks: BackgroundTasks):
     cast_id = await db_manager.add_cast(payload)
+    background_tasks.add_task(notify_cast_changed, cast_id)
 
     response = {
         "id": cast_id,
@@ -27,30 +90,109 @@ async def create_cast(payload: CastIn):
     return response
 
 
+@casts.post(path="/_bulk", response_model=BulkOut)
+async def bulk_create_casts(request: Request):
+    results = []
+    index = 0
+    async for chunk in iter_chunks(iter_bulk_items(request), BULK_CHUNK_SIZE):
+        valid, failed = validate_chunk(CastIn, chunk, start=index)
+        index += len(chunk)
+        results.extend(failed)
+
+        if valid:
+            results.extend(await insert_chunk(db_manager.add_casts, valid))
+
+    results.sort(key=lambda result: result["index"])
+    created = sum(1 for result in results if result["status"] == 201)
+    return {"created": created, "failed": len(results) - created, "results": results}
+
+
+@casts.post(path="/_batch", response_model=CastBatchOut)
+async def get_casts_batch(payload: CastBatchIn, response: Response):
+    unique_ids = list(dict.fromkeys(payload.ids))
+    found = await db_manager.get_casts_by_ids(unique_ids)
+
+    found_ids = {cast["id"] for cast in found}
+    missing = [cast_id for cast_id in unique_ids if cast_id not in found_ids]
+
+    return json_response(CAST_BATCH, {"casts": [as_dict(cast) for cast in found],
+                                      "missing": missing}, response)
+
+
+@casts.get(path="/_events", response_model=List[CastEventOut])
+async def get_cast_events(response: Response,
+                          after_id: int = Query(default=0, ge=0),
+                          limit: int = Query(default=EVENTS_PAGE_SIZE, ge=1,
+                                             le=MAX_EVENTS_PAGE_SIZE)):
+    events = await db_manager.get_events(after_id=after_id, limit=limit)
+    return json_response(CAST_EVENT_LIST, events, response)
+
+
+@casts.get(path="/_export", response_class=StreamingResponse)
+async def export_casts(output_format: Literal["csv", "arrow"] = Query(default="csv",
+                                                                      alias="format"),
+                       compression: Literal["none", "gzip", "zstd"] = "none",
+                       after_id: int = Query(default=0, ge=0),
+                       until_id: Optional[int] = Query(default=None, ge=1)):
+    export = Export("casts", db_manager.CAST_COLUMNS, output_format, compression)
+    if until_id is None:
+        # Fixed when the export starts, an interrupted export is resumed with the same range.
+        until_id = await db_manager.get_last_cast_id()
+    return export.response(partial(db_manager.copy_casts, output_format=output_format),
+                           after_id, until_id)
+
+
 @casts.get(path="/{cast_id}/", response_model=CastOut)
-async def get_cast_by_id(cast_id: int):
-    cast = await db_manager.get_cast_by_id(cast_id)
-    if not cast:
+async def get_cast_by_id(request: Request, response: Response, cast_id: int):
+    entry = await shared_cache.get_record("casts", cast_id, lambda: load_cast(cast_id))
+    if entry is None:
         raise HTTPException(status_code=404,
                             detail=f"Cast with given id {cast_id} not found")
-    return cast
 
+    not_modified = conditional_response(
+        request, response, entry.meta["etag"],
+        last_modified=datetime.fromisoformat(entry.meta["last_modified"]))
+    if not_modified:
+        return not_modified
+    return entry_response(entry, response)
 
-@casts.put(path="/{cast_id}/", response_model=CastOut)
-async def update_cast(cast_id: int, payload: CastUpdate):
-    cast = await db_manager.get_cast_by_id(cast_id)
+
+async def apply_cast_update(cast_id: int, update_data: dict,
+                            background_tasks: BackgroundTasks):
+    if update_data:
+        cast = await db_manager.update_cast(cast_id, update_data)
+    else:
+        cast = await db_manager.get_cast_by_id(cast_id)
 
     if not cast:
         raise HTTPException(status_code=404,
                             detail=f"Cast with given id {cast_id} not found")
 
+    if update_data:
+        background_tasks.add_task(notify_cast_changed, cast_id)
+
+    return cast
+
+
+@casts.put(path="/{cast_id}/", response_model=CastOut)
+async def update_cast(cast_id: int, payload: CastUpdate,
+                      background_tasks: BackgroundTasks):
     update_data = payload.model_dump(exclude_unset=True)
+    return await apply_cast_update(cast_id, update_data, background_tasks)
 
-    cast_in_db = CastIn(**cast)
 
-    updated_cast = cast_in_db.model_copy(update=update_data)
-    cast_id = await db_manager.update_cast(cast_id, updated_cast)
+@casts.patch(path="/{cast_id}/", response_model=CastOut)
+async def patch_cast(cast_id: int, payload: CastPatch,
+                     background_tasks: BackgroundTasks):
+    update_data = payload.model_dump(exclude_unset=True)
+    return await apply_cast_update(cast_id, update_data, background_tasks)
+
 
-    update_data["id"] = cast_id
+@casts.delete(path="/{cast_id}/", status_code=204)
+async def delete_cast(cast_id: int, background_tasks: BackgroundTasks):
+    cast = await db_manager.delete_cast(cast_id)
+    if not cast:
+        raise HTTPException(status_code=404,
+                            detail=f"Cast with given id {cast_id} not found")
 
-    return update_data
+    background_tasks.add_task(notify_cast_changed, cast_id)
@@ -1,15 +1,49 @@
+import asyncio
+import logging
 import os
+import time
+from typing import Any, Awaitable, Callable, List
 
+import asyncpg
 from dotenv import load_dotenv
-from sqlalchemy import (Column, Integer, MetaData, String, Table,
-                        create_engine)
+from sqlalchemy import (BigInteger, Column, DateTime, Integer, MetaData, String, Table,
+                        func)
 
 from databases import Database
 
+from app.api.metrics import (DB_POOL_ACQUIRE_SECONDS, DB_POOL_ACQUIRE_TIMEOUTS,
+                             DB_POOL_CONNECTIONS, DB_POOL_WAITERS)
+
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 DATABASE_URL = os.getenv("CAST_DATABASE_URL")
+# Read replicas of the database, comma separated, see replicas.py. Each gets a pool
+# sized like the primary's.
+DATABASE_REPLICA_URLS = [url.strip() for url in
+                         os.getenv("CAST_DATABASE_REPLICA_URLS", "").split(",")
+                         if url.strip()]
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 10))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+# Connections the service may open over all its worker processes, split evenly between
+# the workers (WEB_CONCURRENCY, exported by gunicorn.conf.py). 0 keeps DB_POOL_MAX_SIZE.
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", 0))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+if DB_MAX_CONNECTIONS:
+    DB_POOL_MAX_SIZE = max(DB_MAX_CONNECTIONS // WEB_CONCURRENCY, 1)
+DB_POOL_MIN_SIZE = min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE)
+# Seconds to wait for a free connection before answering 503.
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", 10))
+# Seconds after which an idle connection is closed.
+DB_POOL_MAX_IDLE_LIFETIME = float(os.getenv("DB_POOL_MAX_IDLE_LIFETIME", 300))
+# Milliseconds after which PostgreSQL cancels a statement, 0 disables the limit.
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", 0))
+# Startup readiness probe: attempts to reach the database and the first retry delay (seconds),
+# doubled after every failed attempt.
+DB_CONNECT_ATTEMPTS = int(os.getenv("DB_CONNECT_ATTEMPTS", 6))
+DB_CONNECT_BACKOFF = float(os.getenv("DB_CONNECT_BACKOFF", 0.5))
 
-engine = create_engine(DATABASE_URL)
 metadata = MetaData()
 
 casts = Table(
@@ -18,6 +52,127 @@ casts = Table(
     Column('id', Integer, primary_key=True),
     Column('name', String(50)),
     Column('nationality', String(20)),
+    Column('version', Integer, nullable=False, server_default='1'),
+    Column('updated_at', DateTime(timezone=True), nullable=False,
+           server_default=func.now()),
 )
 
-database = Database(DATABASE_URL)
+# Transactional outbox: every write to casts records an event in the same transaction,
+# other services follow them through GET /api/v1/casts/_events.
+cast_events = Table(
+    'cast_events',
+    metadata,
+    Column('id', BigInteger, primary_key=True),
+    Column('cast_id', Integer, nullable=False),
+    Column('type', String(10), nullable=False),
+    Column('created_at', DateTime(timezone=True), nullable=False,
+           server_default=func.now()),
+)
+
+
+def create_database(url: str) -> Database:
+    return Database(url,
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    max_inactive_connection_lifetime=DB_POOL_MAX_IDLE_LIFETIME,
+                    server_settings={"statement_timeout": str(DB_STATEMENT_TIMEOUT)})
+
+
+database = create_database(DATABASE_URL)
+
+
+class PoolAcquireTimeout(Exception):
+    pass
+
+
+class InstrumentedPool:
+    """Proxy of an asyncpg pool recording acquire wait time and pool usage."""
+
+    def __init__(self, pool, acquire_timeout: float, gauges: bool = True):
+        self._pool = pool
+        self._acquire_timeout = acquire_timeout
+        self._gauges = gauges
+        self.waiters = 0
+        self.update_gauges()
+
+    def update_gauges(self):
+        if not self._gauges:
+            return
+        # Set explicitly rather than through Gauge.set_function, which does not work
+        # when the metrics of several worker processes are aggregated.
+        idle = self._pool.get_idle_size()
+        DB_POOL_CONNECTIONS.labels(state="idle").set(idle)
+        DB_POOL_CONNECTIONS.labels(state="in_use").set(self._pool.get_size() - idle)
+        DB_POOL_WAITERS.set(self.waiters)
+
+    async def acquire(self):
+        self.waiters += 1
+        self.update_gauges()
+        started = time.perf_counter()
+        try:
+            return await self._pool.acquire(timeout=self._acquire_timeout)
+        except asyncio.TimeoutError:
+            DB_POOL_ACQUIRE_TIMEOUTS.inc()
+            raise PoolAcquireTimeout(
+                f"No database connection available within {self._acquire_timeout}s")
+        finally:
+            self.waiters -= 1
+            self.update_gauges()
+            DB_POOL_ACQUIRE_SECONDS.observe(time.perf_counter() - started)
+
+    async def release(self, connection, *args, **kwargs):
+        try:
+            return await self._pool.release(connection, *args, **kwargs)
+        finally:
+            self.update_gauges()
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+def instrument_pool(database: Database, gauges: bool = True):
+    """Bound the connection acquire wait of ``database``; only the pool of the primary
+    reports to the db_pool gauges."""
+    # databases has no public access to its pool, hence the exact pin in requirements.txt.
+    backend = database._backend
+    backend._pool = InstrumentedPool(backend._pool, DB_POOL_ACQUIRE_TIMEOUT, gauges)
+
+
+async def copy_query(database: Database, query: str,
+                     output: Callable[[bytes], Awaitable[Any]], **options):
+    """Run ``COPY (query) TO STDOUT``, passing the output to ``output`` as it arrives;
+    nothing more is read while it waits. ``options`` as for asyncpg's
+    ``copy_from_query`` (format, header...)."""
+    async def write(chunk: bytearray):
+        # asyncpg passes bytearrays, responses and compressors expect bytes.
+        await output(bytes(chunk))
+
+    async with database.connection() as connection:
+        await connection.raw_connection.copy_from_query(query, output=write, **options)
+
+
+async def fetch_batches(database: Database, query: str, size: int,
+                        output: Callable[[List[asyncpg.Record]], Awaitable[Any]]):
+    """Pass the rows of ``query`` to ``output`` ``size`` at a time, read through a
+    cursor so only one batch is held."""
+    async with database.connection() as connection:
+        raw_connection = connection.raw_connection
+        async with raw_connection.transaction(readonly=True):
+            cursor = await raw_connection.cursor(query)
+            while rows := await cursor.fetch(size):
+                await output(rows)
+
+
+async def connect_database():
+    for attempt in range(1, DB_CONNECT_ATTEMPTS + 1):
+        try:
+            await database.connect()
+            break
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as error:
+            if attempt == DB_CONNECT_ATTEMPTS:
+                raise
+            delay = DB_CONNECT_BACKOFF * 2 ** (attempt - 1)
+            logger.warning("Database is not ready (%s), retrying in %.1fs", error, delay)
+            await asyncio.sleep(delay)
+
+    instrument_pool(database)
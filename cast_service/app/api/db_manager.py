@@ -1,31 +1,153 @@
+from typing import Any, Awaitable, Callable, List, Optional
+
 from app.api.models import CastIn, CastOut, CastUpdate
-from app.api.db import casts, database
-from sqlalchemy import select
+from app.api.metrics import timed_query
+from app.api.db import cast_events, casts, database
+from app.api import export, shared_cache
+from app.api.replicas import reads
+from app.api.singleflight import single_flight
+from sqlalchemy import ARRAY, Integer, any_, bindparam, func, select
+
+# Advisory lock held by every transaction writing to the outbox until it commits, so
+# event ids become visible in increasing order and a consumer reading the events after
+# the last id it has seen never skips one.
+OUTBOX_LOCK_ID = 7243
+
+# Columns of a cast record, exported in this order.
+CAST_COLUMNS = list(casts.c)
+
+
+async def record_events(cast_ids: List[int], event_type: str):
+    await database.execute(query=select(func.pg_advisory_xact_lock(OUTBOX_LOCK_ID)))
+    query = cast_events.insert().values([{"cast_id": cast_id, "type": event_type}
+                                         for cast_id in cast_ids])
+    await database.execute(query=query)
 
 
+@timed_query
 async def add_cast(payload: CastIn):
     query = casts.insert().values(**payload.dict())
 
-    return await database.execute(query=query)
+    async with database.transaction():
+        cast_id = await database.execute(query=query)
+        await record_events([cast_id], "created")
+    await shared_cache.invalidate("casts")
+    return cast_id
 
 
-async def get_all_casts():
-    query = casts.select()
-    return await database.fetch_all(query=query)
+@timed_query
+async def add_casts(payloads: List[CastIn]) -> List[int]:
+    query = (
+        casts
+        .insert()
+        .values([payload.model_dump() for payload in payloads])
+        .returning(casts.c.id)
+    )
+    async with database.transaction():
+        cast_ids = [row["id"] for row in await database.fetch_all(query=query)]
+        await record_events(cast_ids, "created")
+    await shared_cache.invalidate("casts")
+    return cast_ids
 
 
+@timed_query
+async def get_all_casts(after_id: int = 0, limit: Optional[int] = None):
+    query = (
+        casts
+        .select()
+        .where(casts.c.id > after_id)
+        .order_by(casts.c.id)
+        .limit(limit)
+    )
+    return await reads.fetch_all(query=query)
+
+
+async def iterate_casts(after_id: int = 0, chunk_size: int = 500):
+    while True:
+        chunk = await get_all_casts(after_id=after_id, limit=chunk_size)
+        for cast in chunk:
+            yield cast
+        if len(chunk) < chunk_size:
+            break
+        after_id = chunk[-1]["id"]
+
+
+@single_flight(scope=reads.scope)
+@timed_query
 async def get_cast_by_id(cast_id: int):
     query = casts.select().where(cast_id == casts.c.id)
 
-    return await database.fetch_one(query=query)
+    return await reads.fetch_one(query=query)
+
 
+@timed_query
+async def get_casts_by_ids(cast_ids: List[int]):
+    ids = bindparam("ids", value=cast_ids, type_=ARRAY(Integer))
+    query = casts.select().where(casts.c.id == any_(ids))
 
-async def update_cast(cast_id: int, payload: CastIn):
+    return await reads.fetch_all(query=query)
+
+
+@timed_query
+async def get_last_cast_id() -> int:
+    return await reads.fetch_val(query=select(func.max(casts.c.id))) or 0
+
+
+@timed_query
+async def copy_casts(after_id: int, until_id: int, output: Callable[[Any], Awaitable[Any]],
+                     output_format: str = "csv"):
+    """Pass the casts with ``after_id < id <= until_id`` to ``output`` by id, as CSV
+    without header for csv, as batches of rows for arrow."""
+    query = export.window_query(CAST_COLUMNS, after_id, until_id)
+    if output_format == "arrow":
+        await reads.fetch_batches(query, export.EXPORT_BATCH_ROWS, output)
+    else:
+        await reads.copy(query, output, format="csv")
+
+
+@timed_query
+async def update_cast(cast_id: int, update_data: dict):
     query = (
         casts
         .update()
         .where(casts.c.id == cast_id)
-        .values(**payload.dict())
-        .returning(casts.c.id)
+        .values(**update_data, version=casts.c.version + 1, updated_at=func.now())
+        .returning(*casts.c)
+    )
+    async with database.transaction():
+        cast = await database.fetch_one(query=query)
+        if cast:
+            await record_events([cast_id], "updated")
+    # Reads started before the write must not answer the requests that follow it.
+    get_cast_by_id.forget(cast_id)
+    await shared_cache.invalidate("casts", cast_id)
+    return cast
+
+
+@timed_query
+async def delete_cast(cast_id: int):
+    query = (
+        casts
+        .delete()
+        .where(casts.c.id == cast_id)
+        .returning(*casts.c)
+    )
+    async with database.transaction():
+        cast = await database.fetch_one(query=query)
+        if cast:
+            await record_events([cast_id], "deleted")
+    get_cast_by_id.forget(cast_id)
+    await shared_cache.invalidate("casts", cast_id)
+    return cast
+
+
+@timed_query
+async def get_events(after_id: int = 0, limit: Optional[int] = None):
+    query = (
+        cast_events
+        .select()
+        .where(cast_events.c.id > after_id)
+        .order_by(cast_events.c.id)
+        .limit(limit)
     )
-    return await database.execute(query=query)
+    return await reads.fetch_all(query=query)
@@ -0,0 +1,222 @@
+import asyncio
+import functools
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge,
+                               Histogram, generate_latest, multiprocess)
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+
+
+# Set when several worker processes serve the application, see gunicorn.conf.py.
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+# Seconds between two probes of the event loop lag monitor.
+EVENT_LOOP_LAG_INTERVAL = float(os.environ.get("EVENT_LOOP_LAG_INTERVAL", 0.5))
+
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+DB_POOL_CONNECTIONS = Gauge("db_pool_connections",
+                            "Connections of the database pool by state.",
+                            ["state"],
+                            multiprocess_mode="livesum")
+DB_POOL_WAITERS = Gauge("db_pool_waiters",
+                        "Coroutines waiting to acquire a database connection.",
+                        multiprocess_mode="livesum")
+DB_POOL_ACQUIRE_SECONDS = Histogram("db_pool_acquire_seconds",
+                                    "Time spent waiting for a database connection.",
+                                    buckets=LATENCY_BUCKETS)
+DB_POOL_ACQUIRE_TIMEOUTS = Counter("db_pool_acquire_timeouts",
+                                   "Database connection acquisitions that timed out.")
+DB_READS = Counter("db_reads",
+                   "Reads by the database that answered them: a replica, the primary, or the "
+                   "primary after the chosen replica failed (fallback).",
+                   ["target"])
+DB_REPLICA_HEALTHY = Gauge("db_replica_healthy",
+                           "Whether reads are sent to a read replica: 1 healthy, 0 left out.",
+                           ["replica"],
+                           multiprocess_mode="livemin")
+DB_REPLICA_LAG_SECONDS = Gauge("db_replica_lag_seconds",
+                               "Replay lag of a read replica behind the primary at the last probe.",
+                               ["replica"],
+                               multiprocess_mode="livemax")
+DB_QUERY_SECONDS = Histogram("db_query_seconds",
+                             "Time spent in database calls by db_manager function.",
+                             ["function"],
+                             buckets=LATENCY_BUCKETS)
+HTTP_REQUESTS = Counter("http_requests",
+                        "Handled HTTP requests by route and status.",
+                        ["method", "route", "status"])
+HTTP_REQUEST_SECONDS = Histogram("http_request_seconds",
+                                 "Time to handle an HTTP request by route and status.",
+                                 ["method", "route", "status"],
+                                 buckets=LATENCY_BUCKETS)
+HTTP_CLIENT_SECONDS = Histogram("http_client_seconds",
+                                "Time spent in outbound HTTP calls by target service.",
+                                ["target"],
+                                buckets=LATENCY_BUCKETS)
+HTTP_CLIENT_ERRORS = Counter("http_client_errors",
+                             "Failed outbound HTTP calls by target service and error.",
+                             ["target", "error"])
+SINGLE_FLIGHT_CALLS = Counter("single_flight_calls",
+                              "Keys requested from a single-flight group by group and whether they "
+                              "started a call or joined one already in flight.",
+                              ["name", "result"])
+SHARED_CACHE_CALLS = Counter("shared_cache_calls",
+                             "Shared cache lookups by namespace and result (hit, miss, wait for "
+                             "another build, error).",
+                             ["namespace", "result"])
+HTTP_COMPRESSION_BYTES = Counter("http_compression_bytes",
+                                 "Response body bytes compressed by encoding, before (original) "
+                                 "and after (compressed) compression.",
+                                 ["encoding", "body"])
+EVENT_LOOP_LAG_SECONDS = Histogram("event_loop_lag_seconds",
+                                   "Delay of the event loop in running a scheduled callback.",
+                                   buckets=LATENCY_BUCKETS)
+
+# Time spent per phase (db, http, ...) by the request being handled, used for Server-Timing.
+_phases: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar("phases", default=None)
+_loop_monitor: Optional[asyncio.Task] = None
+
+
+def record_phase(name: str, seconds: float):
+    phases = _phases.get()
+    if phases is not None:
+        phase = phases.setdefault(name, [0.0, 0])
+        phase[0] += seconds
+        phase[1] += 1
+
+
+@contextmanager
+def timed_phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - started)
+
+
+def timed_query(func):
+    """Record the duration of a ``db_manager`` coroutine under its name."""
+    histogram = DB_QUERY_SECONDS.labels(function=func.__name__)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            histogram.observe(elapsed)
+            record_phase("db", elapsed)
+
+    return wrapper
+
+
+@contextmanager
+def track_http_call(target: str):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as error:
+        HTTP_CLIENT_ERRORS.labels(target=target, error=type(error).__name__).inc()
+        raise
+    finally:
+        HTTP_CLIENT_SECONDS.labels(target=target).observe(time.perf_counter() - started)
+
+
+def server_timing(phases: Dict[str, List[float]], total: float) -> str:
+    entries = []
+    spent = 0.0
+    for name, (seconds, count) in phases.items():
+        spent += seconds
+        entries.append(f'{name};desc="x{count}";dur={seconds * 1000:.1f}')
+    entries.append(f"app;dur={max(total - spent, 0) * 1000:.1f}")
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class MetricsMiddleware:
+    """Count and time every HTTP request and add a ``Server-Timing`` header.
+
+    Requests are labelled with the path template of the matched route, unmatched
+    requests share the ``unmatched`` label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[object, str] = {}
+
+    def route_name(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if endpoint not in self._routes:
+            app = scope["app"]
+            self._routes.update((route.endpoint, route.path) for route in app.routes
+                                if hasattr(route, "endpoint"))
+        return self._routes.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        phases: Dict[str, List[float]] = {}
+        token = _phases.set(phases)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing",
+                               server_timing(phases, time.perf_counter() - started))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _phases.reset(token)
+            labels = {"method": scope["method"], "route": self.route_name(scope),
+                      "status": str(status)}
+            HTTP_REQUESTS.labels(**labels).inc()
+            HTTP_REQUEST_SECONDS.labels(**labels).observe(time.perf_counter() - started)
+
+
+async def monitor_event_loop_lag(interval: float):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(loop.time() - expected, 0))
+
+
+def start_loop_monitor():
+    global _loop_monitor
+    if _loop_monitor is None:
+        _loop_monitor = asyncio.create_task(monitor_event_loop_lag(EVENT_LOOP_LAG_INTERVAL))
+
+
+async def stop_loop_monitor():
+    global _loop_monitor
+    if _loop_monitor is not None:
+        _loop_monitor.cancel()
+        try:
+            await _loop_monitor
+        except asyncio.CancelledError:
+            pass
+        _loop_monitor = None
+
+
+async def metrics(request: Request) -> Response:
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,10 +1,16 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Any, List, Literal, Optional
+
+
+# Lengths of the casts table columns.
+NAME_LENGTH = 50
+NATIONALITY_LENGTH = 20
 
 
 class CastIn(BaseModel):
-    name: str
-    nationality: Optional[str] = None
+    name: str = Field(max_length=NAME_LENGTH)
+    nationality: Optional[str] = Field(default=None, max_length=NATIONALITY_LENGTH)
 
 
 class CastOut(CastIn):
@@ -13,3 +19,38 @@ class CastOut(CastIn):
 
 class CastUpdate(CastIn):
     pass
+
+
+class CastPatch(BaseModel):
+    # Omitted fields are left untouched, 'name' can not be cleared.
+    name: str = Field(default=None, max_length=NAME_LENGTH)
+    nationality: Optional[str] = Field(default=None, max_length=NATIONALITY_LENGTH)
+
+
+class CastBatchIn(BaseModel):
+    ids: List[int] = Field(max_length=1000)
+
+
+class CastBatchOut(BaseModel):
+    casts: List[CastOut]
+    missing: List[int]
+
+
+class CastEventOut(BaseModel):
+    id: int
+    cast_id: int
+    type: Literal["created", "updated", "deleted"]
+    created_at: datetime
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    status: int
+    id: Optional[int] = None
+    detail: Optional[Any] = None
+
+
+class BulkOut(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkItemResult]
@@ -0,0 +1,285 @@
+"""Routing of reads to read replicas of the database.
+
+Replicas are listed in ``<SERVICE>_DATABASE_REPLICA_URLS`` (see db.py), without any
+every query goes to the primary. Reads made through ``reads`` are sent to the healthy
+replica with the fewest connections in use, in turn when several are as busy; writes
+and reads that must see them keep using ``database``.
+
+A replica is healthy while it answers the probe run every DB_REPLICA_CHECK_INTERVAL
+seconds and its replay lags behind the primary by at most DB_REPLICA_MAX_LAG seconds.
+A read failing because the replica can not be reached is retried on the primary and
+the replica is left out until a probe succeeds again. A streamed read (an export) is
+only retried while none of its output has been passed on.
+
+Read-your-writes: the response to a successful write sets a cookie that sends the
+reads of the client to the primary for the next DB_READ_YOUR_WRITES_SECONDS, longer
+than the lag a replica is allowed. Reads made while handling a write go to the primary
+as well. Routes that only read although they are not GETs (e.g. a batch lookup sent as
+a POST) are listed in ``read_only_paths`` and are treated as reads. The shared cache
+(shared_cache.py) is skipped by such reads, and the entries it rebuilds shortly after
+a write are read from the primary.
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+import asyncpg
+from databases import Database
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import cookie_parser
+
+from app.api.db import (DATABASE_REPLICA_URLS, PoolAcquireTimeout, copy_query,
+                        create_database, database, fetch_batches, instrument_pool)
+from app.api.metrics import DB_READS, DB_REPLICA_HEALTHY, DB_REPLICA_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Seconds a replica may lag behind the primary and still serve reads.
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 1.0))
+# Seconds between two health probes of the replicas, also the timeout of a probe.
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", 2.0))
+# Seconds the reads of a client go to the primary after one of its writes.
+DB_READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", 5.0))
+
+READ_PRIMARY_COOKIE = "read_primary_until"
+READ_PRIMARY_MAX_AGE = math.ceil(DB_READ_YOUR_WRITES_SECONDS)
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# Replay lag in seconds: 0 once everything received is replayed (an idle primary sends
+# nothing, so the time of the last replayed transaction only says how old it is; after a
+# restart streaming resumes from the start of a segment, before the replayed position),
+# NULL on a server which is not a standby.
+LAG_QUERY = """
+    SELECT CASE WHEN pg_last_wal_receive_lsn() <= pg_last_wal_replay_lsn() THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+"""
+
+# The replica can not serve reads right now, the read is retried on the primary. Class 40
+# includes the queries a standby cancels when they conflict with the replay.
+REPLICA_ERRORS = (OSError, asyncio.TimeoutError, asyncpg.InterfaceError,
+                  asyncpg.PostgresConnectionError, asyncpg.CannotConnectNowError,
+                  asyncpg.TransactionRollbackError)
+
+
+class StreamInterrupted(Exception):
+    """A streamed read failed after passing part of its output, it is not retried."""
+
+
+# Whether the reads of the request being handled must go to the primary.
+_read_primary: ContextVar[bool] = ContextVar("read_primary", default=False)
+
+
+class Replica:
+    def __init__(self, database: Database, name: str):
+        self.database = database
+        self.name = name
+        self.healthy = False
+        self.set_health(False)
+
+    @classmethod
+    def from_url(cls, url: str) -> "Replica":
+        parts = urlsplit(url)
+        return cls(create_database(url), f"{parts.hostname}:{parts.port or 5432}{parts.path}")
+
+    def busy(self) -> int:
+        pool = self.database._backend._pool
+        return pool.get_size() - pool.get_idle_size() + pool.waiters
+
+    def set_health(self, healthy: bool, lag: Optional[float] = None):
+        if self.healthy and not healthy:
+            logger.warning("Read replica %s left out", self.name)
+        elif healthy and not self.healthy:
+            logger.info("Read replica %s serves reads", self.name)
+        self.healthy = healthy
+        DB_REPLICA_HEALTHY.labels(replica=self.name).set(int(healthy))
+        if lag is not None:
+            DB_REPLICA_LAG_SECONDS.labels(replica=self.name).set(lag)
+
+    async def check(self):
+        try:
+            if not self.database.is_connected:
+                await self.database.connect()
+                instrument_pool(self.database, gauges=False)
+            lag = await asyncio.wait_for(self.database.fetch_val(LAG_QUERY),
+                                         DB_REPLICA_CHECK_INTERVAL)
+        except (*REPLICA_ERRORS, PoolAcquireTimeout) as error:
+            if self.healthy:
+                logger.warning("Read replica %s failed its probe: %r", self.name, error)
+            self.set_health(False)
+            return
+        lag = float(lag or 0)
+        if lag > DB_REPLICA_MAX_LAG and self.healthy:
+            logger.warning("Read replica %s lags %.1fs behind", self.name, lag)
+        self.set_health(lag <= DB_REPLICA_MAX_LAG, lag)
+
+
+class ReadRouter:
+    def __init__(self, primary: Database, replicas: List[Replica]):
+        self.primary = primary
+        self.replicas = replicas
+        self._turn = 0
+        self._monitor: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def scope() -> bool:
+        """True when the reads go to the primary, single-flight keys include it so
+        such reads never share the result of a read made on a replica."""
+        return _read_primary.get()
+
+    def choose(self) -> Optional[Replica]:
+        if _read_primary.get():
+            return None
+        busy = {replica: replica.busy() for replica in self.replicas if replica.healthy}
+        if not busy:
+            return None
+        least = min(busy.values())
+        candidates = [replica for replica, in_use in busy.items() if in_use == least]
+        self._turn += 1
+        return candidates[self._turn % len(candidates)]
+
+    async def _read(self, read: Callable[[Database], Awaitable[Any]]):
+        replica = self.choose()
+        if replica is not None:
+            try:
+                result = await read(replica.database)
+            except PoolAcquireTimeout:
+                # Busy rather than broken, it stays in the rotation.
+                DB_READS.labels(target="fallback").inc()
+            except REPLICA_ERRORS as error:
+                logger.warning("Read on replica %s failed: %r", replica.name, error)
+                replica.set_health(False)
+                DB_READS.labels(target="fallback").inc()
+            else:
+                DB_READS.labels(target="replica").inc()
+                return result
+        else:
+            DB_READS.labels(target="primary").inc()
+        return await read(self.primary)
+
+    async def fetch_all(self, query):
+        return await self._read(lambda database: database.fetch_all(query=query))
+
+    async def fetch_one(self, query):
+        return await self._read(lambda database: database.fetch_one(query=query))
+
+    async def fetch_val(self, query):
+        return await self._read(lambda database: database.fetch_val(query=query))
+
+    async def _stream(self, read: Callable[[Database, Callable], Awaitable[Any]],
+                      output: Callable[[Any], Awaitable[Any]]):
+        """``read(database, output)``, retried on the primary only while it has passed
+        nothing to ``output``: what was passed is sent already and would be repeated."""
+        passed = False
+
+        async def passing(data):
+            nonlocal passed
+            passed = True
+            await output(data)
+
+        async def read_once(database: Database):
+            try:
+                return await read(database, passing)
+            except REPLICA_ERRORS as error:
+                if passed:
+                    raise StreamInterrupted(f"Read interrupted: {error!r}") from error
+                raise
+
+        return await self._read(read_once)
+
+    async def copy(self, query: str, output: Callable[[bytes], Awaitable[Any]], **options):
+        await self._stream(
+            lambda database, output: copy_query(database, query, output, **options), output)
+
+    async def fetch_batches(self, query: str, size: int,
+                            output: Callable[[List[asyncpg.Record]], Awaitable[Any]]):
+        await self._stream(
+            lambda database, output: fetch_batches(database, query, size, output), output)
+
+    async def check(self):
+        await asyncio.gather(*(replica.check() for replica in self.replicas))
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(DB_REPLICA_CHECK_INTERVAL)
+            await self.check()
+
+    async def start(self):
+        """Probe the replicas once, so reads use them from the start, and keep probing."""
+        if self.replicas and self._monitor is None:
+            await self.check()
+            self._monitor = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+            self._monitor = None
+        for replica in self.replicas:
+            replica.healthy = False
+            if replica.database.is_connected:
+                await replica.database.disconnect()
+
+
+@contextmanager
+def read_from_primary():
+    """Send the reads made in this block to the primary."""
+    token = _read_primary.set(True)
+    try:
+        yield
+    finally:
+        _read_primary.reset(token)
+
+
+def read_primary_until(headers: Headers) -> float:
+    value = cookie_parser(headers.get("cookie", "")).get(READ_PRIMARY_COOKIE)
+    try:
+        return float(value) if value else 0.0
+    except ValueError:
+        return 0.0
+
+
+class ReadYourWritesMiddleware:
+    """Send the reads of a client that just wrote to the primary, see the module docstring."""
+
+    def __init__(self, app, read_only_paths: Iterable[str] = ()):
+        self.app = app
+        self.read_only_paths = {path.rstrip("/") for path in read_only_paths}
+
+    def writes(self, scope) -> bool:
+        return (scope["method"] in WRITE_METHODS
+                and scope["path"].rstrip("/") not in self.read_only_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not reads.replicas:
+            await self.app(scope, receive, send)
+            return
+
+        writing = self.writes(scope)
+        pinned = writing or read_primary_until(Headers(scope=scope)) > time.time()
+
+        async def send_wrapper(message):
+            if writing and message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + DB_READ_YOUR_WRITES_SECONDS
+                MutableHeaders(scope=message).append(
+                    "set-cookie",
+                    f"{READ_PRIMARY_COOKIE}={until:.3f}; Max-Age={READ_PRIMARY_MAX_AGE}; "
+                    f"Path=/; HttpOnly; SameSite=Lax")
+            await send(message)
+
+        token = _read_primary.set(pinned)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _read_primary.reset(token)
+
+
+reads = ReadRouter(database, [Replica.from_url(url) for url in DATABASE_REPLICA_URLS])
@@ -0,0 +1,47 @@
+import logging
+import os
+from typing import Optional
+
+import httpx
+
+from app.api.metrics import track_http_call
+
+
+logger = logging.getLogger(__name__)
+
+# Comma separated base URLs notified with DELETE <url><cast_id>/ whenever a cast changes.
+CAST_CHANGE_HOOK_URLS = [
+    hook_url.strip()
+    for hook_url in os.environ.get("CAST_CHANGE_HOOK_URLS", "").split(",")
+    if hook_url.strip()
+]
+CAST_CHANGE_HOOK_TIMEOUT = float(os.environ.get("CAST_CHANGE_HOOK_TIMEOUT", 2.0))
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+async def open_client():
+    global _client
+    if _client is None and CAST_CHANGE_HOOK_URLS:
+        _client = httpx.AsyncClient(timeout=CAST_CHANGE_HOOK_TIMEOUT)
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def notify_cast_changed(cast_id: int):
+    if _client is None:
+        return
+
+    for hook_url in CAST_CHANGE_HOOK_URLS:
+        try:
+            with track_http_call("cast_change_hook"):
+                response = await _client.delete(f"{hook_url}{cast_id}/")
+                response.raise_for_status()
+        except httpx.HTTPError as error:
+            logger.warning("Cast change hook %s failed for cast %s: %s",
+                           hook_url, cast_id, error)
@@ -0,0 +1,262 @@
+"""Optional cache of serialized responses shared by every worker and replica.
+
+Selected with ``SHARED_CACHE_URL``:
+
+ - unset: disabled, every read goes to the database;
+ - ``memory://``: a dictionary of the process, for tests and single process runs;
+ - ``redis://host:port/db`` (or ``rediss://``): a Redis compatible server, needs the
+   ``redis`` package.
+
+Reads are cache-aside: on a miss the entry is built from the database and stored
+for ``SHARED_CACHE_TTL`` seconds. A miss is rebuilt once per key at a time: callers
+of the same process share the build, other workers and replicas wait for it while
+the rebuild lock is held. Writes replace the entry of the record with a short lived
+tombstone, so a rebuild that read the record before the write can not store it, and
+move the lists of the namespace to a new generation.
+
+With read replicas, reads pinned to the primary after a client's own write skip the
+cache, and entries of a namespace rebuilt within DB_READ_YOUR_WRITES_SECONDS of a
+write to it are read from the primary: a lagging replica could still return the rows
+from before the write, which would then be served from the cache for SHARED_CACHE_TTL.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from pydantic import TypeAdapter
+
+from app.api.metrics import SHARED_CACHE_CALLS, timed_phase
+from app.api.replicas import DB_READ_YOUR_WRITES_SECONDS, read_from_primary, reads
+from app.api.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_URL = os.environ.get("SHARED_CACHE_URL")
+# Seconds an entry is served before it is rebuilt from the database.
+SHARED_CACHE_TTL = float(os.environ.get("SHARED_CACHE_TTL", 60))
+# Seconds a rebuild may take: how long the rebuild lock is held at most, others wait
+# for the entry that long, and how long an invalidated record can not be stored again.
+SHARED_CACHE_BUILD_TIMEOUT = float(os.environ.get("SHARED_CACHE_BUILD_TIMEOUT", 2.0))
+# Seconds to wait for the cache server before falling back to the database.
+SHARED_CACHE_TIMEOUT = float(os.environ.get("SHARED_CACHE_TIMEOUT", 0.25))
+
+TOMBSTONE = b"-"
+WAIT_INTERVAL = 0.02
+
+_cache: Optional["SharedCache"] = None
+
+
+class Entry:
+    """A serialized response body and the metadata (validators, cursor) sent with it.
+
+    Entries built from the database keep the rows they were rendered from in
+    ``content`` and serialize them only when the body is needed.
+    """
+    __slots__ = ("meta", "adapter", "content", "_body")
+
+    def __init__(self, body: Optional[bytes] = None, meta: Optional[dict] = None,
+                 adapter: Optional[TypeAdapter] = None, content: Any = None):
+        self.meta = meta or {}
+        self.adapter = adapter
+        self.content = content
+        self._body = body
+
+    @classmethod
+    def render(cls, adapter: TypeAdapter, content: Any, **meta) -> "Entry":
+        return cls(meta=meta, adapter=adapter, content=content)
+
+    @property
+    def body(self) -> bytes:
+        if self._body is None:
+            self._body = self.adapter.dump_json(self.content)
+        return self._body
+
+    def encode(self) -> bytes:
+        return json.dumps(self.meta).encode() + b"\n" + self.body
+
+    @classmethod
+    def decode(cls, value: bytes) -> "Entry":
+        meta, body = value.split(b"\n", 1)
+        return cls(body, json.loads(meta))
+
+
+class MemoryBackend:
+    errors: Tuple[type, ...] = ()
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[Optional[float], bytes]] = {}
+
+    def _live(self, key: str) -> Optional[bytes]:
+        item = self._values.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._values[key]
+            return None
+        return value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._live(key)
+
+    async def set(self, key: str, value: bytes, ttl: float, only_new: bool = False) -> bool:
+        if only_new and self._live(key) is not None:
+            return False
+        self._values[key] = (time.monotonic() + ttl, value)
+        return True
+
+    async def delete(self, key: str):
+        self._values.pop(key, None)
+
+    async def incr(self, key: str) -> int:
+        value = int(self._live(key) or 0) + 1
+        self._values[key] = (None, str(value).encode())
+        return value
+
+    async def close(self):
+        self._values.clear()
+
+
+class RedisBackend:
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError(f"SHARED_CACHE_URL is {url!r} but the redis package is not "
+                               f"installed")
+        self.errors = (redis.RedisError, OSError, asyncio.TimeoutError)
+        self._redis = redis.from_url(url, socket_timeout=SHARED_CACHE_TIMEOUT,
+                                     socket_connect_timeout=SHARED_CACHE_TIMEOUT)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._redis.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float, only_new: bool = False) -> bool:
+        return bool(await self._redis.set(key, value, px=int(ttl * 1000), nx=only_new))
+
+    async def delete(self, key: str):
+        await self._redis.delete(key)
+
+    async def incr(self, key: str) -> int:
+        return await self._redis.incr(key)
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+class SharedCache:
+    def __init__(self, backend, ttl: float = SHARED_CACHE_TTL,
+                 build_timeout: float = SHARED_CACHE_BUILD_TIMEOUT):
+        self.backend = backend
+        self.ttl = ttl
+        self.build_timeout = build_timeout
+        self._builds = SingleFlight("shared_cache")
+
+    async def _call(self, namespace: str, operation: str, *args):
+        try:
+            with timed_phase("shared_cache"):
+                return await getattr(self.backend, operation)(*args)
+        except self.backend.errors as error:
+            SHARED_CACHE_CALLS.labels(namespace=namespace, result="error").inc()
+            logger.warning("Shared cache %s failed: %r", operation, error)
+            return None
+
+    async def _lookup(self, namespace: str, key: str) -> Optional[Entry]:
+        value = await self._call(namespace, "get", key)
+        if value is None or value == TOMBSTONE:
+            return None
+        return Entry.decode(value)
+
+    async def list_key(self, namespace: str, *params) -> str:
+        generation = await self._call(namespace, "get", f"{namespace}:generation")
+        digest = hashlib.blake2b(repr(params).encode(), digest_size=16).hexdigest()
+        return f"{namespace}:list:{int(generation or 0)}:{digest}"
+
+    async def get_or_build(self, namespace: str, key: str,
+                           build: Callable[[], Awaitable[Optional[Entry]]]) -> Optional[Entry]:
+        entry = await self._lookup(namespace, key)
+        if entry is not None:
+            SHARED_CACHE_CALLS.labels(namespace=namespace, result="hit").inc()
+            return entry
+        SHARED_CACHE_CALLS.labels(namespace=namespace, result="miss").inc()
+        return await self._builds.do(key, self._build, namespace, key, build)
+
+    async def _build(self, namespace: str, key: str,
+                     build: Callable[[], Awaitable[Optional[Entry]]]) -> Optional[Entry]:
+        lock_key = f"{key}:lock"
+        locked = await self._call(namespace, "set", lock_key, b"1", self.build_timeout, True)
+        if locked is False:
+            # Another worker or replica is building this entry, wait for it instead of
+            # querying the database as well.
+            SHARED_CACHE_CALLS.labels(namespace=namespace, result="wait").inc()
+            deadline = time.monotonic() + self.build_timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(WAIT_INTERVAL)
+                entry = await self._lookup(namespace, key)
+                if entry is not None:
+                    return entry
+
+        try:
+            if reads.replicas and await self._call(namespace, "get", f"{namespace}:written"):
+                with read_from_primary():
+                    entry = await build()
+            else:
+                entry = await build()
+            if entry is not None:
+                # Only stored if the key is free, a tombstone left by a write meanwhile wins.
+                await self._call(namespace, "set", key, entry.encode(), self.ttl, True)
+            return entry
+        finally:
+            if locked:
+                await self._call(namespace, "delete", lock_key)
+
+    async def invalidate(self, namespace: str, *record_ids):
+        for record_id in record_ids:
+            await self._call(namespace, "set", f"{namespace}:{record_id}", TOMBSTONE,
+                             self.build_timeout)
+        await self._call(namespace, "incr", f"{namespace}:generation")
+        if reads.replicas:
+            await self._call(namespace, "set", f"{namespace}:written", b"1",
+                             DB_READ_YOUR_WRITES_SECONDS)
+
+
+async def open_cache():
+    global _cache
+    if _cache is None and SHARED_CACHE_URL:
+        if SHARED_CACHE_URL.startswith("memory://"):
+            backend = MemoryBackend()
+        else:
+            backend = RedisBackend(SHARED_CACHE_URL)
+        _cache = SharedCache(backend)
+
+
+async def close_cache():
+    global _cache
+    if _cache is not None:
+        await _cache.backend.close()
+        _cache = None
+
+
+async def get_record(namespace: str, record_id,
+                     build: Callable[[], Awaitable[Optional[Entry]]]) -> Optional[Entry]:
+    if _cache is None or reads.scope():
+        return await build()
+    return await _cache.get_or_build(namespace, f"{namespace}:{record_id}", build)
+
+
+async def get_list(namespace: str, params: tuple,
+                   build: Callable[[], Awaitable[Optional[Entry]]]) -> Optional[Entry]:
+    if _cache is None or reads.scope():
+        return await build()
+    key = await _cache.list_key(namespace, *params)
+    return await _cache.get_or_build(namespace, key, build)
+
+
+async def invalidate(namespace: str, *record_ids):
+    """Drop the cached records with ``record_ids`` and every cached list of ``namespace``."""
+    if _cache is not None:
+        await _cache.invalidate(namespace, *record_ids)
@@ -1,10 +1,17 @@
+import asyncpg
 import pytest
 import random
+from datetime import datetime, timezone
+from types import SimpleNamespace
 
 from fastapi.testclient import TestClient
 
 from app.main import app
+from app.api import casts as casts_router
 from app.api import db_manager as dbm
+from app.api import replicas, shared_cache
+
+UPDATED_AT = datetime(2023, 10, 1, 12, 0, tzinfo=timezone.utc)
 
 
 @pytest.fixture(scope="module")
@@ -74,7 +81,9 @@ def mock_get_cast_by_id(monkeypatch):
         return {
             "name": "Jane Doe",
             "nationality": "British",
-            "id": cast_id
+            "id": cast_id,
+            "version": 1,
+            "updated_at": UPDATED_AT,
         }
     monkeypatch.setattr(dbm, "get_cast_by_id", mock_get_cast_by_id)
 
@@ -93,14 +102,18 @@ def mock_get_all_casts(monkeypatch):
 
     Returns:
         callable: A callable mock function for 'db_manager.get_all_casts'.
-            The mock function should return a list of predefined cast member data.
+            The mock function should return a list of predefined cast member data,
+            honouring the 'after_id' cursor and the 'limit' of the requested page.
     """
-    async def mock_get_all_casts():
+    async def mock_get_all_casts(after_id=0, limit=None):
         cast_data = [
-            {"name": "John Doe", "nationality": "American", "id": 1},
-            {"name": "Jane Smith", "nationality": "British", "id": 2},
+            {"name": "John Doe", "nationality": "American", "id": 1,
+             "version": 1, "updated_at": UPDATED_AT},
+            {"name": "Jane Smith", "nationality": "British", "id": 2,
+             "version": 3, "updated_at": UPDATED_AT},
         ]
-        return cast_data
+        cast_data = [cast for cast in cast_data if cast["id"] > after_id]
+        return cast_data[:limit]
     monkeypatch.setattr(dbm, "get_all_casts", mock_get_all_casts)
 
 
@@ -119,7 +132,7 @@ def mock_get_all_casts_empty(monkeypatch):
         callable: A callable mock function for 'db_manager.get_all_casts'.
             The mock function should return an empty list.
     """
-    async def mock_get_all_casts_empty():
+    async def mock_get_all_casts_empty(after_id=0, limit=None):
         return []
     monkeypatch.setattr(dbm, "get_all_casts", mock_get_all_casts_empty)
 
@@ -152,15 +165,410 @@ def mock_update_cast(monkeypatch):
     Pytest fixture for mocking 'db_manager.update_cast'.
 
     This fixture replaces the actual 'db_manager.update_cast' function with a mock
-    implementation that returns the updated cast ID (e.g., 1 to indicate success).
+    implementation that applies the update data to a predefined cast member and
+    returns the whole updated record, like 'UPDATE ... RETURNING' does.
 
     Args:
         monkeypatch: Pytest fixture for patching modules and objects during testing.
 
     Returns:
         callable: A callable mock function for 'db_manager.update_cast'.
-            The mock function should return the updated cast ID.
+            The mock function should return the updated cast record.
     """
-    async def mock_update_cast(cast_id: int, updated_cast_data: dict):
-        return cast_id
+    async def mock_update_cast(cast_id: int, update_data: dict):
+        return {"id": cast_id, "name": "Jane Doe", "nationality": "British", **update_data}
     monkeypatch.setattr(dbm, "update_cast", mock_update_cast)
+
+
+@pytest.fixture
+def mock_update_cast_not_found(monkeypatch):
+    """
+    Pytest fixture for mocking 'db_manager.update_cast' to simulate a cast not found scenario.
+
+    This fixture replaces the actual 'db_manager.update_cast' function with a mock
+    implementation that returns None, simulating an update that matched no row.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+
+    Returns:
+        callable: A callable mock function for 'db_manager.update_cast' that returns None.
+    """
+    async def mock_update_cast_not_found(cast_id: int, update_data: dict):
+        return None
+    monkeypatch.setattr(dbm, "update_cast", mock_update_cast_not_found)
+
+
+@pytest.fixture
+def mock_get_casts_by_ids(monkeypatch):
+    """
+    Pytest fixture for mocking 'db_manager.get_casts_by_ids'.
+
+    This fixture replaces the actual 'db_manager.get_casts_by_ids' function with a
+    mock implementation that only knows cast members with IDs 1 and 2, so that the
+    batch endpoint can be tested with a mix of existing and missing IDs.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+
+    Returns:
+        callable: A callable mock function for 'db_manager.get_casts_by_ids'.
+            The mock function returns the predefined cast members whose IDs are
+            present in the provided 'cast_ids' list.
+    """
+    async def mock_get_casts_by_ids(cast_ids):
+        cast_data = [
+            {"name": "John Doe", "nationality": "American", "id": 1},
+            {"name": "Jane Smith", "nationality": "British", "id": 2},
+        ]
+        return [cast for cast in cast_data if cast["id"] in cast_ids]
+    monkeypatch.setattr(dbm, "get_casts_by_ids", mock_get_casts_by_ids)
+
+
+@pytest.fixture
+def mock_notify_cast_changed(monkeypatch):
+    """
+    Pytest fixture for mocking the 'notify_cast_changed' hook used by the casts router.
+
+    This fixture replaces the hook with a mock implementation that records the IDs of
+    the changed cast members instead of sending HTTP requests to the subscribers.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+
+    Returns:
+        list: The list of cast IDs the hook was called with.
+    """
+    notified = []
+
+    async def mock_notify_cast_changed(cast_id: int):
+        notified.append(cast_id)
+    monkeypatch.setattr(casts_router, "notify_cast_changed", mock_notify_cast_changed)
+    return notified
+
+
+@pytest.fixture
+def mock_add_casts(monkeypatch):
+    """
+    Pytest fixture for mocking the 'db_manager.add_casts' function.
+
+    This fixture replaces the actual 'db_manager.add_casts' function with a mock
+    implementation that assigns consecutive IDs, starting from 1, to the inserted
+    cast members.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+
+    Returns:
+        list: The list of payloads passed to every 'add_casts' call.
+    """
+    inserted = []
+
+    async def mock_add_casts(payloads):
+        inserted.append(payloads)
+        first_id = sum(len(batch) for batch in inserted) - len(payloads) + 1
+        return list(range(first_id, first_id + len(payloads)))
+    monkeypatch.setattr(dbm, "add_casts", mock_add_casts)
+    return inserted
+
+
+
+@pytest.fixture
+def mock_add_casts_rejecting(monkeypatch, mock_add_casts):
+    """
+    Pytest fixture for mocking 'db_manager.add_casts' with a database rejecting the
+    cast member named "Rejected".
+
+    Like PostgreSQL, a call inserting that cast member fails as a whole with a
+    'DataError' and inserts nothing; other calls assign consecutive IDs.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+        mock_add_casts: Fixture for mocking 'db_manager.add_casts'.
+
+    Returns:
+        list: The list of payloads passed to every successful 'add_casts' call.
+    """
+    add_casts = dbm.add_casts
+
+    async def mock_add_casts_rejecting(payloads):
+        if any(payload.name == "Rejected" for payload in payloads):
+            raise asyncpg.DataError("value too long for type character varying(50)")
+        return await add_casts(payloads)
+    monkeypatch.setattr(dbm, "add_casts", mock_add_casts_rejecting)
+    return mock_add_casts
+
+@pytest.fixture
+def mock_get_events(monkeypatch):
+    """
+    Pytest fixture for mocking the 'db_manager.get_events' function.
+
+    This fixture replaces the actual 'db_manager.get_events' function with a mock
+    implementation reading from a predefined outbox of three events.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+
+    Returns:
+        callable: A callable mock function for 'db_manager.get_events'.
+            The mock function returns the events whose IDs follow 'after_id',
+            at most 'limit' of them.
+    """
+    async def mock_get_events(after_id=0, limit=None):
+        events = [
+            {"id": 1, "cast_id": 1, "type": "created", "created_at": UPDATED_AT},
+            {"id": 2, "cast_id": 2, "type": "created", "created_at": UPDATED_AT},
+            {"id": 3, "cast_id": 1, "type": "updated", "created_at": UPDATED_AT},
+        ]
+        return [event for event in events if event["id"] > after_id][:limit]
+    monkeypatch.setattr(dbm, "get_events", mock_get_events)
+
+
+@pytest.fixture
+def mock_delete_cast(monkeypatch):
+    """
+    Pytest fixture for mocking the 'db_manager.delete_cast' function.
+
+    This fixture replaces the actual 'db_manager.delete_cast' function with a mock
+    implementation that only knows cast members with IDs 1 and 2.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+
+    Returns:
+        callable: A callable mock function for 'db_manager.delete_cast'.
+            The mock function returns the deleted cast record, or None when the
+            cast does not exist.
+    """
+    async def mock_delete_cast(cast_id: int):
+        if cast_id not in (1, 2):
+            return None
+        return {"id": cast_id, "name": "Jane Doe", "nationality": "British",
+                "version": 1, "updated_at": UPDATED_AT}
+    monkeypatch.setattr(dbm, "delete_cast", mock_delete_cast)
+
+
+@pytest.fixture
+def memory_cache(monkeypatch):
+    """
+    Pytest fixture enabling the shared cache with its in-memory backend.
+
+    This fixture replaces the shared cache of the application, disabled in tests, with
+    a 'SharedCache' storing its entries in a dictionary, so that cache-aside reads can
+    be tested without a Redis server.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+
+    Returns:
+        SharedCache: The cache used by the endpoints for the duration of the test.
+    """
+    cache = shared_cache.SharedCache(shared_cache.MemoryBackend(), ttl=60, build_timeout=0.2)
+    monkeypatch.setattr(shared_cache, "_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def counted_get_cast_by_id(monkeypatch, mock_get_cast_by_id):
+    """
+    Pytest fixture counting the calls of the mocked 'db_manager.get_cast_by_id'.
+
+    This fixture wraps the mock installed by 'mock_get_cast_by_id' to record every
+    cast ID the database is queried for.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+        mock_get_cast_by_id: Fixture for mocking 'db_manager.get_cast_by_id'.
+
+    Returns:
+        list: The cast IDs 'get_cast_by_id' was called with.
+    """
+    calls = []
+    get_cast_by_id = dbm.get_cast_by_id
+
+    async def counted_get_cast_by_id(cast_id: int):
+        calls.append(cast_id)
+        return await get_cast_by_id(cast_id)
+    monkeypatch.setattr(dbm, "get_cast_by_id", counted_get_cast_by_id)
+    return calls
+
+
+class FakeDatabase:
+    """
+    Stand-in for a 'databases.Database' answering every read with its own name.
+
+    Args:
+        name: Returned as {"database": name} by every read.
+        in_use: Connections its pool reports as in use.
+        error: Raised by every read instead, when given.
+    """
+    def __init__(self, name: str, in_use: int = 0, error: Exception = None):
+        self.name = name
+        self.error = error
+        self.reads = 0
+        pool = SimpleNamespace(get_size=lambda: in_use, get_idle_size=lambda: 0, waiters=0)
+        self._backend = SimpleNamespace(_pool=pool)
+
+    async def fetch_one(self, query):
+        self.reads += 1
+        if self.error is not None:
+            raise self.error
+        return {"database": self.name}
+
+    fetch_all = fetch_one
+
+
+@pytest.fixture
+def read_replica(monkeypatch):
+    """
+    Pytest fixture configuring one healthy read replica for the endpoints.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+
+    Returns:
+        Replica: The replica, backed by a 'FakeDatabase'.
+    """
+    replica = replicas.Replica(FakeDatabase("replica"), "replica")
+    replica.set_health(True)
+    monkeypatch.setattr(replicas.reads, "replicas", [replica])
+    return replica
+
+
+@pytest.fixture
+def routed_get_cast_by_id(monkeypatch, mock_get_cast_by_id):
+    """
+    Pytest fixture recording where the mocked 'db_manager.get_cast_by_id' would read.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+        mock_get_cast_by_id: Fixture for mocking 'db_manager.get_cast_by_id'.
+
+    Returns:
+        list: For every call, whether the read had to go to the primary database.
+    """
+    calls = []
+    get_cast_by_id = dbm.get_cast_by_id
+
+    async def routed_get_cast_by_id(cast_id: int):
+        calls.append(replicas.reads.scope())
+        return await get_cast_by_id(cast_id)
+    monkeypatch.setattr(dbm, "get_cast_by_id", routed_get_cast_by_id)
+    return calls
+
+
+@pytest.fixture
+def routed_get_all_casts(monkeypatch, mock_get_all_casts):
+    """
+    Pytest fixture recording where the reads of the mocked 'db_manager.get_all_casts'
+    are routed.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+        mock_get_all_casts: Fixture for mocking 'db_manager.get_all_casts'.
+
+    Returns:
+        list: For every call, True when the read went to the primary.
+    """
+    calls = []
+    get_all_casts = dbm.get_all_casts
+
+    async def routed_get_all_casts(after_id=0, limit=None):
+        calls.append(replicas.reads.scope())
+        return await get_all_casts(after_id=after_id, limit=limit)
+    monkeypatch.setattr(dbm, "get_all_casts", routed_get_all_casts)
+    return calls
+
+
+@pytest.fixture
+def routed_get_casts_by_ids(monkeypatch, mock_get_casts_by_ids):
+    """
+    Pytest fixture recording where the mocked 'db_manager.get_casts_by_ids' would read.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+        mock_get_casts_by_ids: Fixture for mocking 'db_manager.get_casts_by_ids'.
+
+    Returns:
+        list: For every call, True when the read went to the primary.
+    """
+    calls = []
+    get_casts_by_ids = dbm.get_casts_by_ids
+
+    async def routed_get_casts_by_ids(cast_ids):
+        calls.append(replicas.reads.scope())
+        return await get_casts_by_ids(cast_ids)
+    monkeypatch.setattr(dbm, "get_casts_by_ids", routed_get_casts_by_ids)
+    return calls
+
+
+@pytest.fixture
+def mock_add_cast_invalidating(monkeypatch):
+    """
+    Pytest fixture for mocking 'db_manager.add_cast' while invalidating the shared
+    cache as the actual function does.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+    """
+    async def mock_add_cast_invalidating(payload):
+        await shared_cache.invalidate("casts")
+        return 1
+    monkeypatch.setattr(dbm, "add_cast", mock_add_cast_invalidating)
+
+
+@pytest.fixture
+def mock_export_casts(monkeypatch):
+    """
+    Pytest fixture for mocking 'db_manager.get_last_cast_id' and 'db_manager.copy_casts'.
+
+    The mocked table holds casts 1 to 5, every odd one without nationality. The copy
+    passes the rows of the requested id window on as PostgreSQL formats them for COPY,
+    in chunks which do not end with the lines, or as rows for arrow.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+
+    Returns:
+        list: The (after_id, until_id) windows copied.
+    """
+    windows = []
+
+    async def mock_get_last_cast_id():
+        return 5
+
+    async def mock_copy_casts(after_id: int, until_id: int, output, output_format: str = "csv"):
+        windows.append((after_id, until_id))
+        updated_at = datetime(2023, 10, 1, 12, 0, tzinfo=timezone.utc)
+        rows = [(cast_id, f"Cast {cast_id}", None if cast_id % 2 else "Polish", 1, updated_at)
+                for cast_id in range(after_id + 1, min(until_id, 5) + 1)]
+        if output_format == "arrow":
+            if rows:
+                await output(rows)
+            return
+        data = "".join(f"{cast_id},{name},{nationality or ''},{version},2023-10-01 12:00:00+00\n"
+                       for cast_id, name, nationality, version, _ in rows).encode()
+        for i in range(0, len(data), 16):
+            await output(data[i:i + 16])
+
+    monkeypatch.setattr(dbm, "get_last_cast_id", mock_get_last_cast_id)
+    monkeypatch.setattr(dbm, "copy_casts", mock_copy_casts)
+    return windows
+
+
+@pytest.fixture
+def mock_get_many_casts(monkeypatch):
+    """
+    Pytest fixture for mocking 'db_manager.get_all_casts' with a table of 200 casts.
+
+    The pages are large enough to be compressed, see 'app.api.compression'.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+    """
+    async def mock_get_many_casts(after_id=0, limit=None):
+        cast_data = [{"name": f"Cast {cast_id}", "nationality": "Polish", "id": cast_id,
+                      "version": 1, "updated_at": UPDATED_AT}
+                     for cast_id in range(after_id + 1, 201)]
+        return cast_data[:limit]
+    monkeypatch.setattr(dbm, "get_all_casts", mock_get_many_casts)
@@ -4,7 +4,9 @@ import random
 
 from fastapi.testclient import TestClient
 
+from app.api import casts as casts_router
 from app.api import db_manager as dbm
+from app.api import serializers
 
 
 class TestEndpointGetAllCast:
@@ -57,15 +59,137 @@ class TestEndpointGetAllCast:
         This test case sends a GET request to the 'get_all_cast' endpoint with an
         invalid query parameter ('invalid_param=123'). It checks that the response
         status code is 400, indicating a bad request, and that the response contains
-        an appropriate error message indicating that the endpoint does not support
-        query parameters.
+        an appropriate error message listing the query parameters that the endpoint
+        does not support.
 
         Args:
             test_app: Pytest fixture providing the FastAPI TestClient.
         """
         response = test_app.get("?invalid_param=123")
         assert response.status_code == 400
-        assert "This endpoint does not support query parameters." in response.text
+        assert "This endpoint does not support query parameters: invalid_param." in response.text
+
+    def test_get_all_casts_first_page(self, test_app, mock_get_all_casts):
+        """
+        Test retrieval of the first page of cast members.
+
+        This test case sends a GET request to the 'get_all_cast' endpoint with a 'limit'
+        smaller than the number of cast members. It checks that only 'limit' members are
+        returned and that the 'X-Next-Cursor' header points to the last returned ID.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_get_all_casts: Fixture for mocking 'db_manager.get_all_casts'.
+        """
+        response = test_app.get("?limit=1")
+
+        assert response.status_code == 200
+        assert [cast["id"] for cast in response.json()] == [1]
+        assert response.headers["X-Next-Cursor"] == "1"
+
+    def test_get_all_casts_last_page(self, test_app, mock_get_all_casts):
+        """
+        Test retrieval of the last page of cast members.
+
+        This test case sends a GET request to the 'get_all_cast' endpoint with an
+        'after_id' cursor pointing at the second to last member. It checks that the
+        remaining member is returned and that no 'X-Next-Cursor' header is set.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_get_all_casts: Fixture for mocking 'db_manager.get_all_casts'.
+        """
+        response = test_app.get("?after_id=1&limit=1")
+
+        assert response.status_code == 200
+        assert [cast["id"] for cast in response.json()] == [2]
+        assert "X-Next-Cursor" not in response.headers
+
+    def test_get_all_casts_with_invalid_limit(self, test_app):
+        """
+        Test retrieval of cast members with a page size out of range.
+
+        This test case sends a GET request to the 'get_all_cast' endpoint with a
+        'limit' of 0 and checks that the response status code is 422 (Unprocessable
+        Entity), indicating a validation failure.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+        """
+        response = test_app.get("?limit=0")
+        assert response.status_code == 422
+
+    def test_get_all_casts_ndjson_stream(self, test_app, mock_get_all_casts):
+        """
+        Test streaming of all cast members as NDJSON.
+
+        This test case sends a GET request to the 'get_all_cast' endpoint with
+        'format=ndjson'. It checks that the response is served as
+        'application/x-ndjson' and that every line holds one cast member.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_get_all_casts: Fixture for mocking 'db_manager.get_all_casts'.
+        """
+        response = test_app.get("?format=ndjson")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = response.text.splitlines()
+        assert [json.loads(line)["id"] for line in lines] == [1, 2]
+
+    def test_get_all_casts_not_modified(self, test_app, mock_get_all_casts):
+        """
+        Test revalidation of a page of cast members with its ETag.
+
+        This test case sends a GET request to the 'get_all_cast' endpoint, then repeats
+        it with the returned ETag in 'If-None-Match'. It checks that the second response
+        is a 304 (Not Modified) without a body, and that a different page gets its own
+        ETag.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_get_all_casts: Fixture for mocking 'db_manager.get_all_casts'.
+        """
+        response = test_app.get("")
+        etag = response.headers["etag"]
+
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == "no-cache"
+
+        response = test_app.get("", headers={"If-None-Match": etag})
+
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+        response = test_app.get("?limit=1", headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+    def test_get_all_casts_validated_output(self, test_app, mock_get_all_casts, monkeypatch):
+        """
+        Test that the trusted serialization matches the response model validation.
+
+        This test case sends the same GET request to the 'get_all_cast' endpoint with
+        and without 'TRUSTED_OUTPUT'. It checks that both return the same JSON list and
+        that columns missing from 'CastOut' (like 'version') are left out of both.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_get_all_casts: Fixture for mocking 'db_manager.get_all_casts'.
+            monkeypatch: Pytest fixture for patching modules and objects during testing.
+        """
+        trusted = test_app.get("?limit=1")
+        monkeypatch.setattr(serializers, "TRUSTED_OUTPUT", False)
+        validated = test_app.get("?limit=1")
+
+        assert trusted.status_code == validated.status_code == 200
+        assert trusted.json() == validated.json() == [
+            {"name": "John Doe", "nationality": "American", "id": 1}
+        ]
+        assert trusted.headers["x-next-cursor"] == validated.headers["x-next-cursor"] == "1"
 
 
 class TestEndpointCreateCast:
@@ -235,10 +359,63 @@ class TestEndpointGetCastById:
         response = test_app.get("z")
         assert response.status_code == 422
 
+    def test_get_cast_by_id_not_modified(self, test_app, mock_get_cast_by_id):
+        """
+        Test revalidation of a cast member with its ETag.
+
+        This test case sends a GET request to the 'get_cast_by_id' endpoint and checks
+        that the response carries the 'ETag', 'Last-Modified' and 'Cache-Control'
+        headers. It then repeats the request with the ETag in 'If-None-Match' (among
+        other, weak, tags) and checks that the response is a 304 (Not Modified).
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_get_cast_by_id: Fixture for mocking 'db_manager.get_cast_by_id'.
+        """
+        response = test_app.get("1/")
+        etag = response.headers["etag"]
+
+        assert response.status_code == 200
+        assert response.headers["last-modified"] == "Sun, 01 Oct 2023 12:00:00 GMT"
+        assert response.headers["cache-control"] == "no-cache"
+
+        response = test_app.get("1/", headers={"If-None-Match": f'"stale", W/{etag}'})
+
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+
+        response = test_app.get("2/", headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+
+    def test_get_cast_by_id_if_modified_since(self, test_app, mock_get_cast_by_id):
+        """
+        Test revalidation of a cast member with its modification date.
+
+        This test case sends GET requests to the 'get_cast_by_id' endpoint with an
+        'If-Modified-Since' header. It checks that a date at or after the last update
+        gives a 304 (Not Modified), while an earlier or malformed date returns the
+        full cast member.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_get_cast_by_id: Fixture for mocking 'db_manager.get_cast_by_id'.
+        """
+        response = test_app.get(
+            "1/", headers={"If-Modified-Since": "Sun, 01 Oct 2023 12:00:00 GMT"})
+        assert response.status_code == 304
+
+        response = test_app.get(
+            "1/", headers={"If-Modified-Since": "Sat, 30 Sep 2023 12:00:00 GMT"})
+        assert response.status_code == 200
+
+        response = test_app.get("1/", headers={"If-Modified-Since": "yesterday"})
+        assert response.status_code == 200
+
 
 class TestEndpointPutCastById:
     # TODO: Add test.
-    def test_update_cast_successful(self, test_app, mock_get_cast_by_id, mock_update_cast):
+    def test_update_cast_successful(self, test_app, mock_update_cast):
         """
         Test successful update of a cast member.
 
@@ -248,7 +425,6 @@ class TestEndpointPutCastById:
 
         Args:
             test_app: Pytest fixture providing the FastAPI TestClient.
-            mock_get_cast_by_id: Fixture for mocking 'db_manager.get_cast_by_id'.
             mock_update_cast: Fixture for mocking 'db_manager.update_cast'.
         """
         cast_id = random.randint(1, 100)
@@ -263,7 +439,28 @@ class TestEndpointPutCastById:
         assert response.status_code == 200
         assert response.json() == updated_payload
 
-    def test_update_cast_not_found(self, test_app, mock_get_cast_by_id_not_found):
+    def test_update_cast_notifies_subscribers(self, test_app, mock_update_cast,
+                                              mock_notify_cast_changed):
+        """
+        Test that a successful update notifies the cast change subscribers.
+
+        This test case updates a cast member and checks that the 'notify_cast_changed'
+        hook was called with the updated cast ID, so that caches of other services can
+        drop the stale entry.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_update_cast: Fixture for mocking 'db_manager.update_cast'.
+            mock_notify_cast_changed: Fixture recording the notified cast IDs.
+        """
+        cast_id = random.randint(1, 100)
+
+        response = test_app.put(f"{cast_id}/", json={"name": "John Doe II"})
+
+        assert response.status_code == 200
+        assert mock_notify_cast_changed == [cast_id]
+
+    def test_update_cast_not_found(self, test_app, mock_update_cast_not_found):
         """
         Test handling of the case when the cast to be updated is not found.
 
@@ -273,7 +470,7 @@ class TestEndpointPutCastById:
 
         Args:
             test_app: Pytest fixture providing the FastAPI TestClient.
-            mock_get_cast_by_id_not_found: Fixture for mocking 'db_manager.get_cast_by_id'
+            mock_update_cast_not_found: Fixture for mocking 'db_manager.update_cast'
                 to simulate a cast not found scenario.
         """
         invalid_cast_id = random.randint(900, 999)
@@ -331,3 +528,419 @@ class TestEndpointPutCastById:
         assert response.status_code == 422
         response = response.json()
         assert "Field required" in response["detail"][0]["msg"]
+
+
+class TestEndpointPatchCastById:
+    """
+    Test class for the 'patch_cast' endpoint.
+
+    This class contains tests related to partially updating a cast member.
+    It uses the FastAPI TestClient to send requests and validate responses.
+    """
+    def test_patch_cast_returns_full_record(self, test_app, mock_update_cast):
+        """
+        Test partial update of a cast member.
+
+        This test case sends a PATCH request with only the 'nationality' field and
+        checks that the response status code is 200 and that the response holds the
+        whole updated record, including the untouched 'name'.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_update_cast: Fixture for mocking 'db_manager.update_cast'.
+        """
+        cast_id = random.randint(1, 100)
+
+        response = test_app.patch(f"{cast_id}/", json={"nationality": "Polish"})
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "id": cast_id,
+            "name": "Jane Doe",
+            "nationality": "Polish"
+        }
+
+    def test_patch_cast_empty_payload(self, test_app, mock_get_cast_by_id):
+        """
+        Test partial update of a cast member with an empty payload.
+
+        This test case sends a PATCH request with an empty JSON payload and checks that
+        the current record is returned unchanged.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_get_cast_by_id: Fixture for mocking 'db_manager.get_cast_by_id'.
+        """
+        cast_id = random.randint(1, 100)
+
+        response = test_app.patch(f"{cast_id}/", json={})
+
+        assert response.status_code == 200
+        assert response.json()["id"] == cast_id
+
+    def test_patch_cast_null_name(self, test_app, mock_update_cast):
+        """
+        Test partial update of a cast member clearing the 'name' field.
+
+        This test case sends a PATCH request with 'name' set to null and checks that the
+        response status code is 422 (Unprocessable Entity), because a cast member must
+        keep a name.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_update_cast: Fixture for mocking 'db_manager.update_cast'.
+        """
+        cast_id = random.randint(1, 100)
+
+        response = test_app.patch(f"{cast_id}/", json={"name": None})
+
+        assert response.status_code == 422
+
+    def test_patch_cast_not_found(self, test_app, mock_update_cast_not_found):
+        """
+        Test partial update of a cast member that does not exist.
+
+        This test case sends a PATCH request for an unknown 'cast_id' and checks that
+        the response status code is 404 with an appropriate error message.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_update_cast_not_found: Fixture for mocking 'db_manager.update_cast'
+                to simulate a cast not found scenario.
+        """
+        invalid_cast_id = random.randint(900, 999)
+
+        response = test_app.patch(f"{invalid_cast_id}/", json={"nationality": "Polish"})
+
+        assert response.status_code == 404
+        assert f"Cast with given id {invalid_cast_id} not found" in response.text
+
+
+class TestEndpointDeleteCastById:
+    """
+    Test class for the 'delete_cast' endpoint.
+
+    This class contains tests related to deleting cast members. It uses the FastAPI
+    TestClient to send requests and validate responses.
+    """
+    def test_delete_cast(self, test_app, mock_delete_cast, mock_notify_cast_changed):
+        """
+        Test successful deletion of a cast member.
+
+        This test case sends a DELETE request for an existing cast member and checks
+        that the response status code is 204 (No Content) with an empty body, and that
+        the cast change subscribers are notified.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_delete_cast: Fixture for mocking 'db_manager.delete_cast'.
+            mock_notify_cast_changed: Fixture recording the notified cast IDs.
+        """
+        response = test_app.delete("2/")
+
+        assert response.status_code == 204
+        assert response.content == b""
+        assert mock_notify_cast_changed == [2]
+
+    def test_delete_cast_not_found(self, test_app, mock_delete_cast,
+                                   mock_notify_cast_changed):
+        """
+        Test deletion of a cast member that does not exist.
+
+        This test case sends a DELETE request for an unknown cast ID and checks that
+        the response status code is 404 with an appropriate error message, and that
+        nobody is notified.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_delete_cast: Fixture for mocking 'db_manager.delete_cast'.
+            mock_notify_cast_changed: Fixture recording the notified cast IDs.
+        """
+        response = test_app.delete("999/")
+
+        assert response.status_code == 404
+        assert "Cast with given id 999 not found" in response.text
+        assert mock_notify_cast_changed == []
+
+
+class TestEndpointGetCastsBatch:
+    """
+    Test class for the 'get_casts_batch' endpoint.
+
+    This class contains tests related to resolving several cast members with a
+    single request. It uses the FastAPI TestClient to send requests and validate
+    responses.
+    """
+    def test_get_casts_batch(self, test_app, mock_get_casts_by_ids):
+        """
+        Test batch retrieval of existing and missing cast members.
+
+        This test case sends a POST request to the 'get_casts_batch' endpoint with a
+        list of IDs where some of them do not exist. It checks that the response
+        status code is 200, that the found cast members are returned and that the
+        unknown IDs are listed as missing.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_get_casts_by_ids: Fixture for mocking 'db_manager.get_casts_by_ids'.
+        """
+        response = test_app.post("_batch", json={"ids": [2, 1, 7, 9]})
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "casts": [
+                {"name": "John Doe", "nationality": "American", "id": 1},
+                {"name": "Jane Smith", "nationality": "British", "id": 2},
+            ],
+            "missing": [7, 9]
+        }
+
+    def test_get_casts_batch_duplicated_ids(self, test_app, mock_get_casts_by_ids):
+        """
+        Test batch retrieval with duplicated IDs.
+
+        This test case sends a POST request to the 'get_casts_batch' endpoint where the
+        same missing ID is repeated. It checks that every missing ID is reported only
+        once.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_get_casts_by_ids: Fixture for mocking 'db_manager.get_casts_by_ids'.
+        """
+        response = test_app.post("_batch", json={"ids": [7, 7, 1]})
+
+        assert response.status_code == 200
+        assert response.json()["missing"] == [7]
+
+    def test_get_casts_batch_with_wrong_data_type(self, test_app):
+        """
+        Test batch retrieval with IDs of an incorrect data type.
+
+        This test case sends a POST request to the 'get_casts_batch' endpoint with a
+        non-integer ID and checks that the response status code is 422 (Unprocessable
+        Entity), indicating a validation failure.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+        """
+        response = test_app.post("_batch", json={"ids": ["z"]})
+        assert response.status_code == 422
+
+
+class TestEndpointGetCastEvents:
+    """
+    Test class for the 'get_cast_events' endpoint.
+
+    This class contains tests related to reading the feed of cast changes other
+    services follow. It uses the FastAPI TestClient to send requests and validate
+    responses.
+    """
+    def test_get_cast_events(self, test_app, mock_get_events):
+        """
+        Test reading the events following a given event ID.
+
+        This test case sends a GET request to the 'get_cast_events' endpoint with an
+        'after_id' cursor and a 'limit'. It checks that the response status code is
+        200 and that only the requested page of events is returned, in order.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_get_events: Fixture for mocking 'db_manager.get_events'.
+        """
+        response = test_app.get("_events", params={"after_id": 1, "limit": 1})
+
+        assert response.status_code == 200
+        assert response.json() == [
+            {"id": 2, "cast_id": 2, "type": "created", "created_at": "2023-10-01T12:00:00Z"},
+        ]
+
+    def test_get_cast_events_with_invalid_limit(self, test_app):
+        """
+        Test reading the events with a page size out of bounds.
+
+        This test case sends a GET request to the 'get_cast_events' endpoint with a
+        'limit' of 0 and checks that the response status code is 422 (Unprocessable
+        Entity).
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+        """
+        response = test_app.get("_events", params={"limit": 0})
+        assert response.status_code == 422
+
+
+class TestEndpointBulkCreateCasts:
+    """
+    Test class for the 'bulk_create_casts' endpoint.
+
+    This class contains tests related to creating many cast members with a single
+    request. It uses the FastAPI TestClient to send requests and validate responses.
+    """
+    def test_bulk_create_casts_json_array(self, test_app, mock_add_casts):
+        """
+        Test bulk creation of cast members sent as a JSON array.
+
+        This test case sends a POST request to the 'bulk_create_casts' endpoint with a
+        JSON array holding valid and invalid cast members. It checks that the valid
+        members are inserted with a single 'add_casts' call, and that the response holds
+        a result for every item in the order of the request.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_add_casts: Fixture for mocking 'db_manager.add_casts'.
+        """
+        payload = [
+            {"name": "Jane Doe", "nationality": "American"},
+            {"nationality": "Polish"},
+            {"name": "John Doe"},
+        ]
+
+        response = test_app.post("_bulk", json=payload)
+
+        assert response.status_code == 200
+        body = response.json()
+        assert body["created"] == 2
+        assert body["failed"] == 1
+        assert [(item["index"], item["status"], item["id"]) for item in body["results"]] == [
+            (0, 201, 1),
+            (1, 422, None),
+            (2, 201, 2),
+        ]
+        assert len(mock_add_casts) == 1
+
+    def test_bulk_create_casts_ndjson(self, test_app, mock_add_casts):
+        """
+        Test bulk creation of cast members sent as NDJSON.
+
+        This test case sends a POST request to the 'bulk_create_casts' endpoint with
+        an NDJSON body where one of the lines is not valid JSON. It checks that the
+        invalid line is reported with status 400 and the other lines are created.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_add_casts: Fixture for mocking 'db_manager.add_casts'.
+        """
+        body = '{"name": "Jane Doe"}\nnot json\n\n{"name": "John Doe"}\n'
+
+        response = test_app.post("_bulk", content=body,
+                                 headers={"Content-Type": "application/x-ndjson"})
+
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [(item["index"], item["status"]) for item in results] == [
+            (0, 201),
+            (1, 400),
+            (2, 201),
+        ]
+
+    def test_bulk_create_casts_mixed_invalid(self, test_app, mock_add_casts_rejecting,
+                                             monkeypatch):
+        """
+        Test bulk creation where some cast members do not fit the table.
+
+        This test case sends, two at a time, cast members with a name longer than the
+        column allows and one the database rejects. It checks that the long name is
+        rejected by validation, that the chunk rejected by the database is retried
+        item by item, and that every other cast member is created.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_add_casts_rejecting: Fixture for mocking 'db_manager.add_casts'.
+            monkeypatch: Pytest fixture for patching modules and objects during testing.
+        """
+        monkeypatch.setattr(casts_router, "BULK_CHUNK_SIZE", 2)
+        payload = [
+            {"name": "Jane Doe"},
+            {"name": "x" * 60},
+            {"name": "John Doe"},
+            {"name": "Rejected"},
+            {"name": "Jan Kowalski", "nationality": "Polish"},
+        ]
+
+        response = test_app.post("_bulk", json=payload)
+
+        assert response.status_code == 200
+        body = response.json()
+        assert (body["created"], body["failed"]) == (3, 2)
+        assert [(item["index"], item["status"]) for item in body["results"]] == [
+            (0, 201),
+            (1, 422),
+            (2, 201),
+            (3, 422),
+            (4, 201),
+        ]
+        assert body["results"][1]["detail"][0]["type"] == "string_too_long"
+        assert [[cast.name for cast in payloads] for payloads in mock_add_casts_rejecting] == [
+            ["Jane Doe"], ["John Doe"], ["Jan Kowalski"],
+        ]
+
+    def test_bulk_create_casts_not_an_array(self, test_app, mock_add_casts):
+        """
+        Test bulk creation with a JSON body that is not an array.
+
+        This test case sends a POST request to the 'bulk_create_casts' endpoint with a
+        single JSON object and checks that the response status code is 400 (Bad
+        Request) and that nothing is inserted.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_add_casts: Fixture for mocking 'db_manager.add_casts'.
+        """
+        response = test_app.post("_bulk", json={"name": "Jane Doe"})
+
+        assert response.status_code == 400
+        assert mock_add_casts == []
+
+
+class TestEndpointMetrics:
+    """
+    Test class for the '/metrics' endpoint.
+
+    This class contains tests related to the Prometheus metrics exposed by the cast
+    service. It uses the FastAPI TestClient to send requests and validate responses.
+    """
+    def test_metrics_expose_database_pool(self, test_app, mock_get_all_casts):
+        """
+        Test that the database pool metrics are exposed.
+
+        This test case sends a GET request to the '/metrics' endpoint and checks that
+        the response status code is 200 and that the pool usage gauges and the acquire
+        wait histogram are present in the Prometheus text format.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_get_all_casts: Fixture for mocking 'db_manager.get_all_casts'.
+        """
+        response = test_app.get("/metrics")
+
+        assert response.status_code == 200
+        assert 'db_pool_connections{state="idle"}' in response.text
+        assert 'db_pool_connections{state="in_use"}' in response.text
+        assert "db_pool_waiters" in response.text
+        assert "db_pool_acquire_seconds_bucket" in response.text
+
+    def test_metrics_expose_request_latency(self, test_app, mock_get_cast_by_id):
+        """
+        Test that handled requests are counted and timed by route.
+
+        This test case sends a GET request for a single cast and checks that the
+        response carries a 'Server-Timing' header with the total duration, and that
+        the '/metrics' endpoint then reports the request under the route path
+        template along with its status code.
+
+        Args:
+            test_app: Pytest fixture providing the FastAPI TestClient.
+            mock_get_cast_by_id: Fixture for mocking 'db_manager.get_cast_by_id'.
+        """
+        response = test_app.get("1/")
+
+        assert response.status_code == 200
+        assert "total;dur=" in response.headers["server-timing"]
+
+        response = test_app.get("/metrics")
+
+        assert response.status_code == 200
+        assert ('http_requests_total{method="GET",route="/api/v1/casts/{cast_id}/",'
+                'status="200"}') in response.text
+        assert "http_request_seconds_bucket" in response.text
+        assert "event_loop_lag_seconds_bucket" in response.text
@@ -0,0 +1,99 @@
+import gzip
+import json
+
+import pytest
+
+from app.api.compression import choose_encoding
+
+
+def test_choose_encoding():
+    """
+    Test the negotiation of the response encoding from 'Accept-Encoding'.
+
+    This test case checks that brotli is preferred when the client weighs both
+    encodings the same, that weights and 'q=0' are honoured and that the identity is
+    chosen when nothing offered is accepted.
+    """
+    pytest.importorskip("brotli")
+
+    assert choose_encoding("gzip, deflate, br") == "br"
+    assert choose_encoding("br;q=0.5, gzip") == "gzip"
+    assert choose_encoding("*, br;q=0") == "gzip"
+    assert choose_encoding("identity") is None
+    assert choose_encoding("") is None
+
+
+class TestResponseCompression:
+    """
+    Test class for the negotiated compression of response bodies.
+    """
+    def test_large_list_gzip(self, test_app, mock_get_many_casts):
+        """
+        Test that a large page of cast members is compressed with gzip.
+
+        This test case requests a page accepting gzip only and checks the encoding,
+        the 'Vary' header, the weakened ETag still answering 'If-None-Match' with a
+        304, and the decoded document.
+        """
+        response = test_app.get("", headers={"Accept-Encoding": "gzip"})
+
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.headers["etag"].startswith('W/"')
+        assert len(json.loads(response.content)) == 100
+
+        response = test_app.get("", headers={"Accept-Encoding": "gzip",
+                                             "If-None-Match": response.headers["etag"]})
+
+        assert response.status_code == 304
+
+    def test_large_list_brotli(self, test_app, mock_get_many_casts):
+        """
+        Test that brotli is preferred by clients accepting it.
+
+        This test case requests a streamed NDJSON list with the 'Accept-Encoding' of
+        a browser and checks that every line survives the brotli decoding.
+        """
+        brotli = pytest.importorskip("brotli")
+
+        with test_app.stream("GET", "?format=ndjson",
+                             headers={"Accept-Encoding": "gzip, deflate, br"}) as response:
+            body = brotli.decompress(b"".join(response.iter_raw()))
+
+        assert response.headers["content-encoding"] == "br"
+        assert "content-length" not in response.headers
+        assert len(body.decode().splitlines()) == 200
+
+    def test_small_body_uncompressed(self, test_app, mock_get_all_casts):
+        """
+        Test that bodies below the minimum size are sent as they are.
+
+        This test case requests a page of two cast members, below the minimum size,
+        and checks that it is sent uncompressed with its strong ETag.
+        """
+        response = test_app.get("", headers={"Accept-Encoding": "gzip, br"})
+
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+        assert not response.headers["etag"].startswith("W/")
+
+    def test_identity_uncompressed(self, test_app, mock_get_many_casts):
+        """
+        Test that clients not accepting any offered encoding get the body as is.
+        """
+        response = test_app.get("", headers={"Accept-Encoding": "identity"})
+
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+        assert int(response.headers["content-length"]) == len(response.content)
+
+    def test_encoded_export_not_compressed_twice(self, test_app, mock_export_casts):
+        """
+        Test that an export compressed by the endpoint is not compressed again.
+        """
+        response = test_app.get("_export?compression=gzip",
+                                headers={"Accept-Encoding": "gzip, br"})
+
+        assert "content-encoding" not in response.headers
+        assert gzip.decompress(response.content).startswith(b"id,name")
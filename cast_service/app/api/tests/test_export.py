@@ -0,0 +1,118 @@
+import asyncio
+import gzip
+from datetime import datetime, timezone
+
+import pytest
+
+from app.api import db_manager as dbm
+from app.api import export
+
+
+class TestEndpointExportCasts:
+    """
+    Test class for the 'export_casts' endpoint, the bulk export of the casts table.
+    """
+    def test_export_csv_in_windows(self, test_app, mock_export_casts, monkeypatch):
+        """
+        Test that the CSV export joins the windows of ids under one header.
+
+        This test case exports the table two ids at a time and checks that every
+        window up to the last id was copied in order, that the header is sent once
+        and that the response names the exported range.
+        """
+        monkeypatch.setattr(export, "EXPORT_WINDOW", 2)
+
+        response = test_app.get("_export")
+
+        assert response.status_code == 200
+        assert mock_export_casts == [(0, 2), (2, 4), (4, 5)]
+        assert response.text.splitlines() == [
+            "id,name,nationality,version,updated_at",
+            *(f"{cast_id},Cast {cast_id},{'' if cast_id % 2 else 'Polish'},1,"
+              f"2023-10-01 12:00:00+00" for cast_id in range(1, 6)),
+        ]
+        assert response.headers["content-type"].startswith("text/csv")
+        assert response.headers["x-export-until-id"] == "5"
+        assert 'filename="casts-0-5.csv"' in response.headers["content-disposition"]
+
+    def test_export_reads_few_chunks_ahead(self, monkeypatch):
+        """
+        Test that an export holds a few chunks of a window, not the whole window.
+
+        This test case streams a window copied in ten chunks and checks that the copy
+        never gets more than EXPORT_READ_AHEAD chunks ahead of the ones sent, and
+        that the body is the header followed by every chunk.
+        """
+        monkeypatch.setattr(export, "EXPORT_READ_AHEAD", 2)
+        passed, ahead = [], []
+
+        async def copy(after_id: int, until_id: int, output):
+            for i in range(10):
+                await output(f"{i}\n".encode())
+                passed.append(i)
+
+        async def run():
+            body = []
+            async for data in export.Export("casts", dbm.CAST_COLUMNS, "csv").stream(copy, 0, 5):
+                body.append(data)
+                ahead.append(len(passed) - (len(body) - 1))
+            return b"".join(body)
+
+        assert asyncio.run(run()).decode().splitlines() == [
+            "id,name,nationality,version,updated_at", *map(str, range(10))]
+        assert max(ahead) <= 2
+
+    def test_export_empty_csv(self, test_app, mock_export_casts, monkeypatch):
+        """
+        Test that an export without rows is still CSV with its header.
+
+        This test case exports an empty table, and a range past the last id, and
+        checks that nothing was copied and that both answers hold the header only.
+        """
+        async def mock_get_last_cast_id():
+            return 0
+        monkeypatch.setattr(dbm, "get_last_cast_id", mock_get_last_cast_id)
+
+        empty_table = test_app.get("_export")
+        past_the_end = test_app.get("_export?after_id=5&until_id=5&compression=gzip")
+
+        assert empty_table.status_code == past_the_end.status_code == 200
+        assert mock_export_casts == []
+        assert empty_table.text == "id,name,nationality,version,updated_at\n"
+        assert gzip.decompress(past_the_end.content) == empty_table.content
+        assert empty_table.headers["x-export-until-id"] == "0"
+
+    def test_export_range_gzip(self, test_app, mock_export_casts):
+        """
+        Test that a range of ids can be exported compressed with gzip.
+
+        This test case resumes an export after id 3 and checks that the gzip body
+        holds the header and the remaining casts only.
+        """
+        response = test_app.get("_export?after_id=3&until_id=5&compression=gzip")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/gzip"
+        assert gzip.decompress(response.content).decode().splitlines()[1:] == [
+            "4,Cast 4,Polish,1,2023-10-01 12:00:00+00",
+            "5,Cast 5,,1,2023-10-01 12:00:00+00",
+        ]
+
+    def test_export_arrow(self, test_app, mock_export_casts):
+        """
+        Test that the Arrow export is a stream of typed columns.
+
+        This test case reads the Arrow IPC stream back and checks the column types,
+        the missing nationalities and the timestamps in UTC.
+        """
+        pa = pytest.importorskip("pyarrow")
+        import pyarrow.ipc
+
+        response = test_app.get("_export?format=arrow")
+        table = pa.ipc.open_stream(response.content).read_all()
+
+        assert response.status_code == 200
+        assert table.schema.field("id").type == pa.int32()
+        assert table.column("nationality").to_pylist() == [None, "Polish", None, "Polish", None]
+        assert table.to_pylist()[0]["updated_at"] == datetime(2023, 10, 1, 12, 0,
+                                                              tzinfo=timezone.utc)
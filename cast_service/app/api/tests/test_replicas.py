@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+from app.api import replicas
+from app.api.replicas import READ_PRIMARY_COOKIE, ReadRouter, Replica, StreamInterrupted
+from app.api.tests.conftest import FakeDatabase
+
+
+class TestReadRouter:
+    """
+    Test class for 'ReadRouter', the routing of reads between the primary and replicas.
+    """
+    @staticmethod
+    def replica(name: str, in_use: int = 0, error: Exception = None) -> Replica:
+        replica = Replica(FakeDatabase(name, in_use, error), name)
+        replica.set_health(True)
+        return replica
+
+    @staticmethod
+    def read(router: ReadRouter, times: int = 1) -> list:
+        async def run():
+            return [(await router.fetch_one(query=None))["database"] for _ in range(times)]
+        return asyncio.run(run())
+
+    def test_reads_go_to_least_busy_replica(self):
+        """
+        Test that reads are shared by the least busy healthy replicas.
+
+        This test case routes reads between a busy replica and two idle ones and
+        checks that the idle replicas take turns, and that the primary answers once
+        no replica is healthy.
+        """
+        replicas = [self.replica("busy", in_use=3), self.replica("a"), self.replica("b")]
+        router = ReadRouter(FakeDatabase("primary"), replicas)
+
+        assert sorted(self.read(router, times=4)) == ["a", "a", "b", "b"]
+
+        for replica in replicas:
+            replica.set_health(False)
+        assert self.read(router) == ["primary"]
+
+    def test_unreachable_replica_falls_back_to_primary(self):
+        """
+        Test that a read failing on an unreachable replica is answered by the primary.
+
+        This test case makes the replica refuse connections and checks that the read
+        is retried on the primary, and that the replica is left out of the next reads.
+        """
+        replica = self.replica("replica", error=ConnectionRefusedError())
+        router = ReadRouter(FakeDatabase("primary"), [replica])
+
+        assert self.read(router, times=2) == ["primary", "primary"]
+        assert not replica.healthy
+        assert replica.database.reads == 1
+
+    def test_stream_falls_back_until_output_passed(self, monkeypatch):
+        """
+        Test that a streamed read is retried on the primary only while it passed nothing.
+
+        This test case copies from a replica failing before its first chunk, then from
+        one failing after it, and checks that the first copy is sent by the primary
+        alone and that the second one fails instead of sending the first chunk twice.
+        """
+        async def mock_copy_query(database, query, output, fail_after):
+            database.reads += 1
+            for i, chunk in enumerate(["1", "2"]):
+                if database.error is not None and i == fail_after:
+                    raise database.error
+                await output((database.name, chunk))
+        monkeypatch.setattr(replicas, "copy_query", mock_copy_query)
+
+        received = []
+
+        async def output(chunk):
+            received.append(chunk)
+
+        def router() -> ReadRouter:
+            return ReadRouter(FakeDatabase("primary"),
+                              [self.replica("replica", error=ConnectionResetError())])
+
+        before_output = router()
+        asyncio.run(before_output.copy("SELECT", output, fail_after=0))
+        assert received == [("primary", "1"), ("primary", "2")]
+
+        received.clear()
+        after_output = router()
+        with pytest.raises(StreamInterrupted):
+            asyncio.run(after_output.copy("SELECT", output, fail_after=1))
+        assert received == [("replica", "1")]
+        assert after_output.primary.reads == 0
+
+
+class TestReadYourWrites:
+    """
+    Test class for the read-your-writes stickiness of a client after its own write.
+    """
+    def test_write_pins_reads_of_client_to_primary(self, test_app, read_replica,
+                                                   routed_get_cast_by_id, mock_add_cast):
+        """
+        Test that the reads following a client's write go to the primary.
+
+        This test case reads a cast, creates one and reads again with the cookie set
+        by the write, then without it. It checks that only the read made with the
+        cookie had to go to the primary.
+        """
+        test_app.get("1/")
+        response = test_app.post("", json={"name": "Jane Doe", "nationality": "American"})
+        test_app.get("1/")
+        test_app.cookies.clear()
+        test_app.get("1/")
+
+        assert response.status_code == 201
+        assert READ_PRIMARY_COOKIE in response.cookies
+        assert routed_get_cast_by_id == [False, True, False]
+
+    def test_write_then_list_not_cached_from_replica(self, test_app, read_replica,
+                                                     memory_cache, routed_get_all_casts,
+                                                     mock_add_cast_invalidating):
+        """
+        Test that the shared cache does not keep a list page read before a write.
+
+        This test case caches a page read from the replica, creates a cast and reads
+        the page again, first as the writing client, then as another client, twice.
+        It checks that the writer's read skips the cache, that the page rebuilt by
+        the other client shortly after the write is read from the primary, where the
+        write is visible, and that this page is then served from the cache.
+        """
+        test_app.get("")
+        response = test_app.post("", json={"name": "Jane Doe"})
+        test_app.get("")
+        test_app.cookies.clear()
+        test_app.get("")
+        test_app.get("")
+
+        assert response.status_code == 201
+        assert routed_get_all_casts == [False, True, True]
+
+    def test_batch_lookup_does_not_pin(self, test_app, read_replica, routed_get_casts_by_ids):
+        """
+        Test that the batch lookup, a POST that only reads, is routed like a GET.
+
+        This test case looks casts up twice without a cookie and checks that both
+        lookups read from the replica and that no read-your-writes cookie is set.
+        """
+        test_app.cookies.clear()
+        responses = [test_app.post("_batch", json={"ids": [1, 3]}) for _ in range(2)]
+
+        assert [response.status_code for response in responses] == [200, 200]
+        assert all(READ_PRIMARY_COOKIE not in response.cookies for response in responses)
+        assert routed_get_casts_by_ids == [False, False]
@@ -0,0 +1,116 @@
+import asyncio
+
+from app.api.serializers import CAST
+from app.api.shared_cache import Entry, MemoryBackend, SharedCache
+
+
+class TestSharedCacheEndpoints:
+    """
+    Test class for the cast endpoints served through the shared cache.
+    """
+    def test_get_cast_by_id_is_served_from_cache(self, test_app, memory_cache,
+                                                 counted_get_cast_by_id):
+        """
+        Test that a cached cast is answered without querying the database.
+
+        This test case requests the same cast twice and checks that the database was
+        queried once, that both responses are identical and that the cached entry
+        still answers conditional requests with 304 (Not Modified).
+        """
+        first = test_app.get("5/")
+        second = test_app.get("5/")
+        not_modified = test_app.get("5/", headers={"If-None-Match": first.headers["etag"]})
+
+        assert counted_get_cast_by_id == [5]
+        assert first.status_code == second.status_code == 200
+        assert first.content == second.content
+        assert first.headers["etag"] == second.headers["etag"]
+        assert first.headers["last-modified"] == second.headers["last-modified"]
+        assert not_modified.status_code == 304
+
+    def test_get_all_casts_is_served_from_cache(self, test_app, memory_cache,
+                                                mock_get_all_casts):
+        """
+        Test that a cached list page keeps its cursor header.
+
+        This test case requests the first page twice and checks that the second
+        response, read from the cache, carries the same body and 'X-Next-Cursor'.
+        """
+        first = test_app.get("?limit=1")
+        second = test_app.get("?limit=1")
+
+        assert first.content == second.content
+        assert first.headers["x-next-cursor"] == second.headers["x-next-cursor"] == "1"
+
+
+class TestSharedCache:
+    """
+    Test class for 'SharedCache' invalidation and stampede protection.
+    """
+    @staticmethod
+    def entry(value: str) -> Entry:
+        return Entry.render(CAST, {"id": 1, "name": value, "nationality": None},
+                            etag=f'"{value}"')
+
+    def test_invalidate_blocks_stale_rebuild(self):
+        """
+        Test that a build which read a record before its update is not stored.
+
+        This test case invalidates a record while its entry is being built and
+        checks that the stale entry is not served to the next reader.
+        """
+        cache = SharedCache(MemoryBackend(), ttl=60, build_timeout=0.2)
+
+        async def run():
+            async def stale_build():
+                await cache.invalidate("casts", 1)
+                return self.entry("old")
+
+            await cache.get_or_build("casts", "casts:1", stale_build)
+
+            async def fresh_build():
+                return self.entry("new")
+            return await cache.get_or_build("casts", "casts:1", fresh_build)
+
+        assert asyncio.run(run()).content["name"] == "new"
+
+    def test_invalidate_moves_lists_to_new_generation(self):
+        """
+        Test that any write makes the cached list pages unreachable.
+        """
+        cache = SharedCache(MemoryBackend())
+
+        async def run():
+            before = await cache.list_key("casts", 0, 100)
+            await cache.invalidate("casts")
+            return before, await cache.list_key("casts", 0, 100)
+
+        before, after = asyncio.run(run())
+        assert before != after
+
+    def test_concurrent_misses_build_once(self):
+        """
+        Test that concurrent misses of one key, from this and other processes, build once.
+
+        This test case shares one backend between two caches, standing for two
+        workers, and misses the same key from both at the same time. It checks that
+        the entry was built once and that every caller got it.
+        """
+        backend = MemoryBackend()
+        workers = [SharedCache(backend, ttl=60, build_timeout=1),
+                   SharedCache(backend, ttl=60, build_timeout=1)]
+        builds = []
+
+        async def build():
+            builds.append(1)
+            await asyncio.sleep(0.05)
+            return self.entry("built")
+
+        async def run():
+            return await asyncio.gather(*(worker.get_or_build("casts", "casts:1", build)
+                                          for worker in workers for _ in range(3)))
+
+        entries = asyncio.run(run())
+
+        assert len(builds) == 1
+        assert {entry.body for entry in entries} == {self.entry("built").body}
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from app.api.metrics import SINGLE_FLIGHT_CALLS
+from app.api.singleflight import SingleFlight
+
+
+class TestSingleFlight:
+    """
+    Test class for 'SingleFlight', the coalescing of identical concurrent calls.
+
+    This class contains tests checking that concurrent callers asking for the same
+    key share one call, and that nothing is shared once the call is over.
+    """
+    def test_concurrent_calls_share_one_call(self):
+        """
+        Test that concurrent calls for the same key run the function once.
+
+        This test case starts five calls for one key and one call for another key
+        at the same time. It checks that every caller gets the result of its key,
+        that the function ran once per key, that the joined calls are counted and
+        that no call is left in flight.
+        """
+        group = SingleFlight("test_do")
+        calls = []
+
+        async def fetch(key):
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return key * 2
+
+        async def run():
+            return await asyncio.gather(*(group.do(1, fetch, 1) for _ in range(5)),
+                                        group.do(2, fetch, 2))
+
+        assert asyncio.run(run()) == [2, 2, 2, 2, 2, 4]
+        assert calls == [1, 2]
+        assert SINGLE_FLIGHT_CALLS.labels(name="test_do", result="coalesced")._value.get() == 4
+        assert len(group) == 0
+
+    def test_do_many_joins_keys_in_flight(self):
+        """
+        Test that a batch call only asks for the keys not already in flight.
+
+        This test case resolves keys 1 and 2 and, while that call is in flight,
+        keys 2 and 3. It checks that the second batch only fetched key 3 and still
+        got the value of key 2.
+        """
+        group = SingleFlight("test_do_many")
+        batches = []
+
+        async def fetch(keys):
+            batches.append(keys)
+            await asyncio.sleep(0.01)
+            return {key: f"value {key}" for key in keys}
+
+        async def run():
+            return await asyncio.gather(group.do_many([1, 2], fetch),
+                                        group.do_many([2, 3, 3], fetch))
+
+        first, second = asyncio.run(run())
+
+        assert batches == [[1, 2], [3]]
+        assert first == {1: "value 1", 2: "value 2"}
+        assert second == {2: "value 2", 3: "value 3"}
+
+    def test_errors_reach_every_caller(self):
+        """
+        Test that a failing call raises in every caller sharing it.
+
+        This test case makes the shared call fail and checks that both concurrent
+        callers get the error and that the next call starts afresh.
+        """
+        group = SingleFlight("test_errors")
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        async def run():
+            return await asyncio.gather(group.do("key", fetch), group.do("key", fetch),
+                                        return_exceptions=True)
+
+        results = asyncio.run(run())
+
+        assert [type(result) for result in results] == [ValueError, ValueError]
+        assert len(calls) == 1
+        with pytest.raises(ValueError):
+            asyncio.run(group.do("key", fetch))
+        assert len(calls) == 2
+
+    def test_forget_starts_a_new_call(self):
+        """
+        Test that a forgotten key is not joined by later callers.
+
+        This test case forgets a key while its call is in flight, as a write does,
+        and checks that a call made afterwards runs the function again.
+        """
+        group = SingleFlight("test_forget")
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            number = len(calls)
+            await asyncio.sleep(0.01)
+            return number
+
+        async def run():
+            first = asyncio.ensure_future(group.do("key", fetch))
+            await asyncio.sleep(0)
+            group.forget("key")
+            second = await group.do("key", fetch)
+            return await first, second
+
+        assert asyncio.run(run()) == (1, 2)
@@ -1,8 +1,12 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from app.api.casts import casts
-from app.api.db import metadata, database, engine
-
-metadata.create_all(engine)
+from app.api.compression import CompressionMiddleware
+from app.api.db import PoolAcquireTimeout, connect_database, database
+from app.api.metrics import (MetricsMiddleware, metrics, start_loop_monitor,
+                             stop_loop_monitor)
+from app.api.replicas import ReadYourWritesMiddleware, reads
+from app.api import service, shared_cache
 
 app = FastAPI(openapi_url="/api/v1/casts/openapi.json",
               docs_url="/api/v1/casts/docs")
@@ -10,11 +14,30 @@ app = FastAPI(openapi_url="/api/v1/casts/openapi.json",
 
 @app.on_event("startup")
 async def startup():
-    await database.connect()
+    await connect_database()
+    await reads.start()
+    await service.open_client()
+    await shared_cache.open_cache()
+    start_loop_monitor()
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    await stop_loop_monitor()
+    await service.close_client()
+    await shared_cache.close_cache()
+    await reads.stop()
     await database.disconnect()
 
+
+@app.exception_handler(PoolAcquireTimeout)
+async def pool_acquire_timeout_handler(request: Request, exc: PoolAcquireTimeout):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
+# The batch lookup is a POST only to carry its ids, it must not pin its caller.
+app.add_middleware(ReadYourWritesMiddleware, read_only_paths={"/api/v1/casts/_batch"})
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_route("/metrics", metrics, include_in_schema=False)
 app.include_router(casts, prefix="/api/v1/casts", tags=["casts"])
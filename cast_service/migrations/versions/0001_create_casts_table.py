@@ -0,0 +1,31 @@
+"""Create casts table
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases created before migrations were introduced already have the table.
+    if sa.inspect(op.get_bind()).has_table('casts'):
+        return
+
+    op.create_table(
+        'casts',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('name', sa.String(50)),
+        sa.Column('nationality', sa.String(20)),
+    )
+
+
+def downgrade():
+    op.drop_table('casts')
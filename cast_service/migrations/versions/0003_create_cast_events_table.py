@@ -0,0 +1,32 @@
+"""Create cast_events outbox table
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 14:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'cast_events',
+        sa.Column('id', sa.BigInteger, primary_key=True),
+        sa.Column('cast_id', sa.Integer, nullable=False),
+        sa.Column('type', sa.String(10), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False,
+                  server_default=sa.func.now()),
+    )
+    # Consumers start from the first event, so existing casts are announced as created.
+    op.execute("INSERT INTO cast_events (cast_id, type) "
+               "SELECT id, 'created' FROM casts ORDER BY id")
+
+
+def downgrade():
+    op.drop_table('cast_events')
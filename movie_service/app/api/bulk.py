@@ -0,0 +1,95 @@
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Tuple, Type
+
+import asyncpg
+from fastapi import HTTPException, Request
+from pydantic import BaseModel, ValidationError
+
+
+NDJSON_MEDIA_TYPES = {"application/x-ndjson", "application/jsonl"}
+
+
+def parse_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError as error:
+        return error
+
+
+async def iter_bulk_items(request: Request) -> AsyncIterator[Any]:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+
+    if content_type in NDJSON_MEDIA_TYPES:
+        buffer = b""
+        async for data in request.stream():
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield parse_line(line)
+        if buffer.strip():
+            yield parse_line(buffer)
+        return
+
+    try:
+        items = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body is not valid JSON.")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400,
+                            detail="Request body must be a JSON array or NDJSON.")
+    for item in items:
+        yield item
+
+
+async def iter_chunks(items: AsyncIterator[Any], size: int) -> AsyncIterator[List[Any]]:
+    chunk = []
+    async for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def validate_chunk(model: Type[BaseModel], chunk: List[Any],
+                   start: int) -> Tuple[List[Tuple[int, BaseModel]], List[dict]]:
+    valid, failed = [], []
+    for index, item in enumerate(chunk, start):
+        if isinstance(item, ValueError):
+            failed.append({"index": index, "status": 400, "detail": f"Invalid JSON: {item}"})
+            continue
+        try:
+            valid.append((index, model.model_validate(item)))
+        except ValidationError as error:
+            failed.append({"index": index, "status": 422,
+                           "detail": error.errors(include_url=False, include_context=False)})
+    return valid, failed
+
+
+def error_status(error: asyncpg.PostgresError) -> int:
+    if isinstance(error, asyncpg.DataError):
+        return 422
+    if isinstance(error, asyncpg.IntegrityConstraintViolationError):
+        return 409
+    return 500
+
+
+async def insert_chunk(insert: Callable[[List[BaseModel]], Awaitable[List[int]]],
+                       items: List[Tuple[int, BaseModel]]) -> List[dict]:
+    """Results of inserting the payloads of ``(index, payload)`` items with one
+    ``insert`` call. When the database rejects the chunk, nothing of it is kept and its
+    items are inserted one by one, so only the rejected ones fail."""
+    try:
+        row_ids = await insert([payload for _, payload in items])
+    except asyncpg.PostgresError as error:
+        if len(items) > 1:
+            results = []
+            for item in items:
+                results.extend(await insert_chunk(insert, [item]))
+            return results
+        return [{"index": items[0][0], "status": error_status(error),
+                 "detail": f"Rejected by the database: {error}"}]
+    return [{"index": index, "status": 201, "id": row_id}
+            for (index, _), row_id in zip(items, row_ids)]
@@ -0,0 +1,102 @@
+"""Invalidation of the cast lookup caches of every worker.
+
+Each worker keeps its own lookup cache (service.cast_cache). A cast change reaches a
+single worker: the one applying the events feed, or the one the change hook of
+cast_service was routed to. It is announced to the others with a PostgreSQL NOTIFY
+on CAST_CHANGES_CHANNEL, sent in the transaction applying the events, and every worker
+LISTENs on a connection of its own, outside its pool, to drop the announced casts.
+
+Notifications sent while a worker does not listen are lost, so its whole cache is
+cleared whenever it starts listening again.
+"""
+import asyncio
+import logging
+import os
+from typing import Optional
+
+import asyncpg
+
+from app.api.cache import TTLCache
+from app.api.db import DATABASE_URL
+from app.api.db_manager import CAST_CHANGES_CHANNEL
+from app.api.service import cast_cache, cast_lookups
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before listening again after the connection was lost, doubled up to
+# MAX_BACKOFF.
+BACKOFF = float(os.environ.get("CAST_CHANGES_BACKOFF", 0.5))
+MAX_BACKOFF = float(os.environ.get("CAST_CHANGES_MAX_BACKOFF", 30.0))
+# Seconds the startup of a worker waits for its listener.
+START_TIMEOUT = float(os.environ.get("CAST_CHANGES_START_TIMEOUT", 5.0))
+
+_listener: Optional["CastChangesListener"] = None
+
+
+class CastChangesListener:
+    def __init__(self, cache: TTLCache):
+        self.cache = cache
+        self.listening = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def on_notification(self, connection, pid: int, channel: str, payload: str):
+        for cast_id in map(int, payload.split(",")):
+            self.cache.invalidate(cast_id)
+            cast_lookups.forget(cast_id)
+
+    async def run(self):
+        backoff = BACKOFF
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(DATABASE_URL)
+                lost = asyncio.Event()
+                connection.add_termination_listener(lambda _: lost.set())
+                await connection.add_listener(CAST_CHANGES_CHANNEL, self.on_notification)
+                self.cache.clear()
+                self.listening.set()
+                backoff = BACKOFF
+                await lost.wait()
+                logger.warning("Lost the cast changes connection, listening again in %.1fs",
+                               backoff)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Listening to cast changes failed, retrying in %.1fs",
+                                 backoff)
+            finally:
+                self.listening.clear()
+                if connection is not None and not connection.is_closed():
+                    connection.terminate()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+    async def start(self):
+        self._task = asyncio.create_task(self.run())
+        try:
+            await asyncio.wait_for(self.listening.wait(), START_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Not listening to cast changes yet, the lookup cache may be stale")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+async def start_listener():
+    global _listener
+    if _listener is None:
+        _listener = CastChangesListener(cast_cache)
+        await _listener.start()
+
+
+async def stop_listener():
+    global _listener
+    if _listener is not None:
+        await _listener.stop()
+        _listener = None
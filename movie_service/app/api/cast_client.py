@@ -0,0 +1,153 @@
+import asyncio
+import os
+import random
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+from app.api.circuit_breaker import CircuitBreaker, CircuitOpen
+from app.api.metrics import HTTP_CLIENT_RETRIES, timed_phase, track_http_call
+
+
+CAST_SERVICE_HOST_URL = "http://localhost:8002/api/v1/casts/"
+url = os.environ.get("CAST_SERVICE_HOST_URL") or CAST_SERVICE_HOST_URL
+
+# Number of cast ids resolved by a single batch call to the cast service.
+BATCH_SIZE = int(os.environ.get("CAST_SERVICE_BATCH_SIZE", 200))
+# Upper bound of concurrent batch calls sent to the cast service for one payload.
+MAX_CONCURRENCY = int(os.environ.get("CAST_SERVICE_MAX_CONCURRENCY", 10))
+# Time budget (seconds) for validating all casts of a single movie request.
+REQUEST_DEADLINE = float(os.environ.get("CAST_SERVICE_DEADLINE", 5.0))
+# Seconds to open a connection to / wait for the answer of a single batch call.
+CONNECT_TIMEOUT = float(os.environ.get("CAST_SERVICE_CONNECT_TIMEOUT", 1.0))
+READ_TIMEOUT = float(os.environ.get("CAST_SERVICE_READ_TIMEOUT", 2.0))
+# Extra attempts of a batch call failing with a connection error, timeout or 5xx, delayed by
+# a random share of RETRY_BACKOFF seconds doubled after every attempt.
+RETRIES = int(os.environ.get("CAST_SERVICE_RETRIES", 2))
+RETRY_BACKOFF = float(os.environ.get("CAST_SERVICE_RETRY_BACKOFF", 0.1))
+# Consecutive failed calls opening the circuit, and seconds before a trial call is let through.
+BREAKER_FAILURES = int(os.environ.get("CAST_SERVICE_BREAKER_FAILURES", 5))
+BREAKER_RESET = float(os.environ.get("CAST_SERVICE_BREAKER_RESET", 30.0))
+
+_client: Optional[httpx.AsyncClient] = None
+breaker = CircuitBreaker("cast_service", BREAKER_FAILURES, BREAKER_RESET)
+
+
+class CastServiceError(Exception):
+    pass
+
+
+class CastServiceUnavailable(CastServiceError):
+    pass
+
+
+class CastServiceTimeout(CastServiceError):
+    pass
+
+
+def new_client(**options) -> httpx.AsyncClient:
+    options.setdefault("base_url", url)
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(REQUEST_DEADLINE, connect=CONNECT_TIMEOUT, read=READ_TIMEOUT),
+        limits=httpx.Limits(max_connections=MAX_CONCURRENCY,
+                            max_keepalive_connections=MAX_CONCURRENCY),
+        # Every call stands on its own: a cookie set by one answer (e.g. the read-your-writes
+        # cookie of cast_service) must not follow the calls made for other requests.
+        cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+        **options,
+    )
+
+
+async def open_client():
+    global _client
+    if _client is None:
+        _client = new_client()
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    if _client is None:
+        raise RuntimeError("Cast service client is not opened.")
+    return _client
+
+
+async def post_batch(cast_ids: List[int]) -> dict:
+    try:
+        breaker.before_call()
+    except CircuitOpen as error:
+        raise CastServiceUnavailable(str(error))
+
+    try:
+        with track_http_call("cast_service"):
+            response = await get_client().post("_batch", json={"ids": cast_ids})
+            response.raise_for_status()
+    except httpx.HTTPStatusError as error:
+        if error.response.status_code < 500:
+            # The service answered, the request itself is wrong and retrying will not help.
+            breaker.record_success()
+            raise CastServiceError(
+                f"Cast service rejected the lookup with {error.response.status_code}")
+        breaker.record_failure()
+        raise
+    except httpx.TransportError:
+        breaker.record_failure()
+        raise
+
+    breaker.record_success()
+    return response.json()
+
+
+async def fetch_batch(cast_ids: List[int],
+                      semaphore: asyncio.Semaphore) -> dict:
+    # The batch lookup only reads, so it is safe to retry even though it is a POST.
+    async with semaphore:
+        for attempt in range(RETRIES + 1):
+            if attempt:
+                HTTP_CLIENT_RETRIES.labels(target="cast_service").inc()
+                await asyncio.sleep(random.uniform(0, RETRY_BACKOFF * 2 ** (attempt - 1)))
+            try:
+                return await post_batch(cast_ids)
+            except (httpx.HTTPStatusError, httpx.TransportError) as error:
+                last_error = error
+
+    raise CastServiceUnavailable(
+        f"Cast service is unavailable ({type(last_error).__name__})")
+
+
+async def get_casts(casts_id: Iterable[int]) -> Dict[int, Optional[dict]]:
+    unique_ids = list(dict.fromkeys(casts_id))
+    if not unique_ids:
+        return {}
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    lookups = [fetch_batch(unique_ids[i:i + BATCH_SIZE], semaphore)
+               for i in range(0, len(unique_ids), BATCH_SIZE)]
+    try:
+        with timed_phase("cast_service"):
+            results = await asyncio.wait_for(asyncio.gather(*lookups),
+                                             timeout=REQUEST_DEADLINE)
+    except asyncio.TimeoutError:
+        raise CastServiceTimeout(
+            f"Cast service did not answer within {REQUEST_DEADLINE}s")
+
+    casts: Dict[int, Optional[dict]] = dict.fromkeys(unique_ids)
+    for batch in results:
+        for cast in batch["casts"]:
+            casts[cast["id"]] = cast
+    return casts
+
+
+async def get_events(after_id: int, limit: int) -> List[dict]:
+    # Polled in the background, failures are left to the consumer and do not trip the breaker.
+    with track_http_call("cast_service"):
+        response = await get_client().get("_events", params={"after_id": after_id,
+                                                             "limit": limit})
+        response.raise_for_status()
+    return response.json()
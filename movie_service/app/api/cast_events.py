@@ -0,0 +1,113 @@
+"""Local replica of the cast ids, kept up to date from cast_service's events feed.
+
+Movie writes check cast ids against ``known_casts`` in a single indexed query and
+only ask cast_service about the ids the replica does not know (yet). A deleted
+cast is removed from the movies referencing it in the transaction applying its event
+and kept in ``known_casts`` as removed, so every worker rejects it from then on,
+whatever its lookup cache holds.
+
+Every worker of every replica runs the consumer, but only the one holding the
+PostgreSQL advisory lock CONSUMER_LOCK polls the feed, the others try again every
+LEADER_RETRY_INTERVAL seconds. The lock is held by the session of the connection the
+consumer reads and writes through, so it is released when that worker stops or loses
+its connection, and another one takes over from the stored cursor.
+"""
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from app.api import cast_client, db_manager
+from app.api.db import database
+from app.api.service import invalidate_cast
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two polls of the events feed once it is drained, 0 disables the consumer.
+POLL_INTERVAL = float(os.environ.get("CAST_EVENTS_POLL_INTERVAL", 1.0))
+# Number of events fetched and applied in one transaction.
+BATCH_SIZE = int(os.environ.get("CAST_EVENTS_BATCH_SIZE", 1000))
+# Seconds to wait before polling again after a failure, doubled up to MAX_BACKOFF.
+BACKOFF = float(os.environ.get("CAST_EVENTS_BACKOFF", 1.0))
+MAX_BACKOFF = float(os.environ.get("CAST_EVENTS_MAX_BACKOFF", 30.0))
+# Seconds between two attempts to become the consumer while another worker is.
+LEADER_RETRY_INTERVAL = float(os.environ.get("CAST_EVENTS_LEADER_RETRY_INTERVAL", 5.0))
+
+CURSOR_NAME = "cast_events"
+# Key of the advisory lock electing the consumer among the workers of movie_service.
+CONSUMER_LOCK = 0x6361737445
+
+_consumer: Optional[asyncio.Task] = None
+
+
+async def apply_events(events: List[dict]):
+    # Only the last event of a cast within the batch decides whether it exists.
+    last_type = {}
+    for event in events:
+        last_type.pop(event["cast_id"], None)
+        last_type[event["cast_id"]] = event["type"]
+
+    present = [cast_id for cast_id, type_ in last_type.items() if type_ != "deleted"]
+    removed = [cast_id for cast_id, type_ in last_type.items() if type_ == "deleted"]
+    await db_manager.apply_cast_events(CURSOR_NAME, present, removed, events[-1]["id"])
+
+    # Cached lookups, negative ones included, may be stale for every cast in the batch.
+    for cast_id in last_type:
+        invalidate_cast(cast_id)
+
+
+@asynccontextmanager
+async def consumer_lock():
+    """Whether this worker holds CONSUMER_LOCK, the queries of the block share the
+    connection holding it."""
+    async with database.connection():
+        locked = await db_manager.try_advisory_lock(CONSUMER_LOCK)
+        try:
+            yield locked
+        finally:
+            if locked:
+                await db_manager.advisory_unlock(CONSUMER_LOCK)
+
+
+async def consume_events():
+    backoff = BACKOFF
+    while True:
+        try:
+            async with consumer_lock() as locked:
+                # Read again on every takeover, another worker may have moved it on.
+                position = await db_manager.get_event_cursor(CURSOR_NAME) if locked else None
+                while locked:
+                    events = await cast_client.get_events(position, BATCH_SIZE)
+                    if events:
+                        await apply_events(events)
+                        position = events[-1]["id"]
+                    backoff = BACKOFF
+                    if len(events) < BATCH_SIZE:
+                        await asyncio.sleep(POLL_INTERVAL)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Applying cast events failed, retrying in %.1fs", backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+            continue
+
+        await asyncio.sleep(LEADER_RETRY_INTERVAL)
+
+
+def start_consumer():
+    global _consumer
+    if POLL_INTERVAL > 0 and _consumer is None:
+        _consumer = asyncio.create_task(consume_events())
+
+
+async def stop_consumer():
+    global _consumer
+    if _consumer is not None:
+        _consumer.cancel()
+        try:
+            await _consumer
+        except asyncio.CancelledError:
+            pass
+        _consumer = None
@@ -0,0 +1,60 @@
+import time
+
+from app.api.metrics import CIRCUIT_BREAKER_REJECTIONS, CIRCUIT_BREAKER_STATE
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Fail calls to a dependency fast once it keeps failing.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and calls are
+    rejected for ``reset_timeout`` seconds. Then a single trial call is let through
+    (half-open): its success closes the circuit, its failure opens it again. When the
+    trial never reports back (e.g. it was cancelled) another one is let through after
+    ``reset_timeout``.
+    """
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+    STATES = (CLOSED, HALF_OPEN, OPEN)
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._retry_at = 0.0
+        self._set_state(self.CLOSED)
+
+    def _set_state(self, state: str):
+        self.state = state
+        CIRCUIT_BREAKER_STATE.labels(target=self.name).set(self.STATES.index(state))
+
+    def before_call(self):
+        if self.state == self.CLOSED:
+            return
+
+        now = time.monotonic()
+        if now < self._retry_at:
+            CIRCUIT_BREAKER_REJECTIONS.labels(target=self.name).inc()
+            raise CircuitOpen(f"Circuit to {self.name} is open")
+        self._retry_at = now + self.reset_timeout
+        self._set_state(self.HALF_OPEN)
+
+    def record_success(self):
+        self.failures = 0
+        if self.state != self.CLOSED:
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self._retry_at = time.monotonic() + self.reset_timeout
+            self._set_state(self.OPEN)
+
+    def retry_after(self) -> float:
+        return max(self._retry_at - time.monotonic(), 0)
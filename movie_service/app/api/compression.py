@@ -0,0 +1,157 @@
+"""Negotiated compression of response bodies.
+
+The encoding is picked from the request's ``Accept-Encoding`` among
+COMPRESSION_ENCODINGS, in that order of preference when the client weighs them the
+same: ``br`` (needs the ``brotli`` package, skipped without it) and ``gzip``. Only
+text and JSON bodies of at least COMPRESSION_MINIMUM_SIZE bytes are compressed,
+streamed bodies chunk by chunk so every chunk still reaches the client as soon as it
+is produced. Bodies already encoded by the endpoint (e.g. a gzip export) are left alone.
+
+A compressed response carries ``Vary: Accept-Encoding`` and its ``ETag`` becomes weak,
+it is not byte for byte the representation the tag was computed for; conditional
+requests compare tags weakly, so ``If-None-Match`` keeps working. A 304 keeps the tag as
+the endpoint set it, whether the full response would have been compressed is not known.
+"""
+import os
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.api.metrics import HTTP_COMPRESSION_BYTES
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Encodings offered, by preference. Empty disables compression (e.g. when the gateway
+# compresses instead).
+COMPRESSION_ENCODINGS = [encoding.strip() for encoding in
+                         os.environ.get("COMPRESSION_ENCODINGS", "br,gzip").split(",")
+                         if encoding.strip() in ("br", "gzip")
+                         and (encoding.strip() != "br" or brotli is not None)]
+# Smaller bodies are sent as they are, compressing them saves less than it costs.
+COMPRESSION_MINIMUM_SIZE = int(os.environ.get("COMPRESSION_MINIMUM_SIZE", 1024))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", 4))
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson",
+                      "application/jsonl")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """The offered encoding the client accepts with the highest weight, ``None`` for
+    the identity."""
+    weights = {}
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.strip()] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in COMPRESSION_ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+class GzipCompressor:
+    def __init__(self):
+        self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class BrotliCompressor:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        data = self._compressor.process(data)
+        return data + (self._compressor.finish() if last else self._compressor.flush())
+
+
+COMPRESSORS = {"gzip": GzipCompressor, "br": BrotliCompressor}
+
+
+class CompressionMiddleware:
+    """Compress response bodies with the encoding the client negotiated, see the
+    module docstring."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        encoding = None
+        if scope["type"] == "http":
+            encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        original_bytes = HTTP_COMPRESSION_BYTES.labels(encoding=encoding, body="original")
+        compressed_bytes = HTTP_COMPRESSION_BYTES.labels(encoding=encoding, body="compressed")
+        # Held back until the first body chunk tells whether to compress.
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if (message["status"] in (204, 304) or "content-encoding" in headers
+                        or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < COMPRESSION_MINIMUM_SIZE:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = COMPRESSORS[encoding]()
+                headers = MutableHeaders(scope=start)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                weaken_etag(headers)
+                del headers["Content-Length"]
+
+            compressed = compressor.compress(body, last=not more_body)
+            original_bytes.inc(len(body))
+            compressed_bytes.inc(len(compressed))
+            if start is not None:
+                if not more_body:
+                    MutableHeaders(scope=start)["Content-Length"] = str(len(compressed))
+                await send(start)
+                start = None
+            await send({"type": "http.response.body", "body": compressed,
+                        "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def weaken_etag(headers: MutableHeaders):
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
@@ -1,34 +1,249 @@
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import ARRAY, Integer, any_, bindparam, func, select
+from sqlalchemy.dialects.postgresql import insert
+
 from app.api.models import MovieIn, MovieOut, MovieUpdate
-from app.api.db import movies, database
+from app.api.metrics import timed_query
+from app.api.db import database, event_cursors, known_casts, movies
+from app.api import export, shared_cache
+from app.api.replicas import reads
+from app.api.singleflight import single_flight
+
+# Columns of a movie record, the search_vector is only used for filtering and ranking.
+MOVIE_COLUMNS = [column for column in movies.c if column.key != "search_vector"]
+
+# Channel announcing changed casts to the lookup caches of every worker (cast_changes.py),
+# and the ids sent per notification, whose payload is limited to 8000 bytes.
+CAST_CHANGES_CHANNEL = "cast_changes"
+CAST_CHANGES_CHUNK = 500
 
 
+@timed_query
 async def add_movie(payload: MovieIn):
     query = movies.insert().values(**payload.dict())
 
-    return await database.execute(query=query)
+    movie_id = await database.execute(query=query)
+    await shared_cache.invalidate("movies")
+    return movie_id
+
+
+@timed_query
+async def add_movies(payloads: List[MovieIn]) -> List[int]:
+    query = (
+        movies
+        .insert()
+        .values([payload.model_dump() for payload in payloads])
+        .returning(movies.c.id)
+    )
+    movie_ids = [row["id"] for row in await database.fetch_all(query=query)]
+    await shared_cache.invalidate("movies")
+    return movie_ids
+
+
+def prefix_bounds(prefix: str) -> Tuple[str, Optional[str]]:
+    """Bounds of the strings starting with ``prefix`` in byte order, the order of the
+    ``text_pattern_ops`` index on name: ``lower <= name < upper``, without upper bound
+    when there is no greater string of the same length."""
+    chars = list(prefix)
+    while chars:
+        code = ord(chars.pop()) + 1
+        if code == 0xD800:  # surrogates can not be encoded
+            code = 0xE000
+        if code <= 0x10FFFF:
+            return prefix, "".join(chars) + chr(code)
+    return prefix, None
+
+
+def filter_movies(query, genre: Optional[str] = None, cast_id: Optional[int] = None,
+                  name_prefix: Optional[str] = None):
+    if genre is not None:
+        query = query.where(movies.c.genres.contains([genre]))
+    if cast_id is not None:
+        query = query.where(movies.c.casts_id.contains([cast_id]))
+    if name_prefix:
+        # A range rather than LIKE: the index serves it with the bounds as parameters,
+        # also in the generic plans of prepared statements, and '%' or '_' mean nothing.
+        lower, upper = prefix_bounds(name_prefix)
+        query = query.where(movies.c.name.op("~>=~")(lower))
+        if upper is not None:
+            query = query.where(movies.c.name.op("~<~")(upper))
+    return query
+
+
+@timed_query
+async def get_all_movies(after_id: int = 0, limit: Optional[int] = None, **filters):
+    query = (
+        filter_movies(select(*MOVIE_COLUMNS), **filters)
+        .where(movies.c.id > after_id)
+        .order_by(movies.c.id)
+        .limit(limit)
+    )
+    return await reads.fetch_all(query=query)
+
+
+async def iterate_movies(after_id: int = 0, chunk_size: int = 500, **filters):
+    while True:
+        chunk = await get_all_movies(after_id=after_id, limit=chunk_size, **filters)
+        for movie in chunk:
+            yield movie
+        if len(chunk) < chunk_size:
+            break
+        after_id = chunk[-1]["id"]
+
+
+@timed_query
+async def search_movies(text: str, offset: int = 0, limit: Optional[int] = None,
+                        genre: Optional[str] = None):
+    ts_query = func.websearch_to_tsquery("english", text)
+    rank = func.ts_rank(movies.c.search_vector, ts_query)
+    query = (
+        filter_movies(select(*MOVIE_COLUMNS), genre=genre)
+        .where(movies.c.search_vector.op("@@")(ts_query))
+        .order_by(rank.desc(), movies.c.id)
+        .offset(offset)
+        .limit(limit)
+    )
+    return await reads.fetch_all(query=query)
+
+
+@timed_query
+async def get_last_movie_id() -> int:
+    return await reads.fetch_val(query=select(func.max(movies.c.id))) or 0
 
 
-async def get_all_movies():
-    query = movies.select()
-    return await database.fetch_all(query=query)
+@timed_query
+async def copy_movies(after_id: int, until_id: int, output: Callable[[Any], Awaitable[Any]],
+                      output_format: str = "csv"):
+    """Pass the movies with ``after_id < id <= until_id`` to ``output`` by id, as CSV
+    without header for csv, as batches of rows for arrow."""
+    query = export.window_query(MOVIE_COLUMNS, after_id, until_id)
+    if output_format == "arrow":
+        await reads.fetch_batches(query, export.EXPORT_BATCH_ROWS, output)
+    else:
+        await reads.copy(query, output, format="csv")
 
 
+@single_flight(scope=reads.scope)
+@timed_query
 async def get_movie(movie_id):
-    query = movies.select(movies.c.id == movie_id)
-    return await database.fetch_one(query=query)
+    query = select(*MOVIE_COLUMNS).where(movies.c.id == movie_id)
+    return await reads.fetch_one(query=query)
 
 
+@timed_query
 async def delete_movie(movie_id: int):
-    query = movies.delete().where(movies.c.id == movie_id)
-    return await database.execute(query=query)
+    query = (
+        movies
+        .delete()
+        .where(movies.c.id == movie_id)
+        .returning(*MOVIE_COLUMNS)
+    )
+    movie = await database.fetch_one(query=query)
+    get_movie.forget(movie_id)
+    await shared_cache.invalidate("movies", movie_id)
+    return movie
 
 
-async def update_movie(movie_id: int, payload: MovieIn):
+@timed_query
+async def update_movie(movie_id: int, update_data: dict):
     query = (
         movies
         .update()
         .where(movies.c.id == movie_id)
-        .values(**payload.dict())
+        .values(**update_data, version=movies.c.version + 1, updated_at=func.now())
+        .returning(*MOVIE_COLUMNS)
+    )
+    movie = await database.fetch_one(query=query)
+    # Reads started before the write must not answer the requests that follow it.
+    get_movie.forget(movie_id)
+    await shared_cache.invalidate("movies", movie_id)
+    return movie
+
+
+async def forget_movies(movie_ids: List[int]):
+    """Drop the reads of ``movie_ids`` in flight and cached, once their write is committed."""
+    for movie_id in movie_ids:
+        get_movie.forget(movie_id)
+    if movie_ids:
+        await shared_cache.invalidate("movies", *movie_ids)
+
+
+async def drop_cast(cast_id: int) -> List[int]:
+    # One set-based statement, the GIN index on casts_id finds the referencing movies.
+    query = (
+        movies
+        .update()
+        .where(movies.c.casts_id.contains([cast_id]))
+        .values(casts_id=func.array_remove(movies.c.casts_id, cast_id),
+                version=movies.c.version + 1, updated_at=func.now())
         .returning(movies.c.id)
     )
-    return await database.execute(query=query)
+    return [row["id"] for row in await database.fetch_all(query=query)]
+
+
+@timed_query
+async def remove_cast_from_movies(cast_id: int) -> List[int]:
+    movie_ids = await drop_cast(cast_id)
+    await forget_movies(movie_ids)
+    return movie_ids
+
+
+# The replica of known casts and the cursor are read from the primary: they decide the
+# writes that follow.
+@timed_query
+async def get_known_casts(cast_ids: List[int]) -> Dict[int, bool]:
+    """The given cast ids the replica knows of, mapped to whether they were deleted."""
+    ids = bindparam("ids", value=cast_ids, type_=ARRAY(Integer))
+    query = known_casts.select().where(known_casts.c.id == any_(ids))
+    return {row["id"]: row["removed"] for row in await database.fetch_all(query=query)}
+
+
+@timed_query
+async def get_event_cursor(name: str) -> int:
+    query = event_cursors.select().where(event_cursors.c.name == name)
+    row = await database.fetch_one(query=query)
+    return row["position"] if row is not None else 0
+
+
+@timed_query
+async def try_advisory_lock(key: int) -> bool:
+    return await database.fetch_val(query=select(func.pg_try_advisory_lock(key)))
+
+
+@timed_query
+async def advisory_unlock(key: int):
+    await database.fetch_val(query=select(func.pg_advisory_unlock(key)))
+
+
+@timed_query
+async def notify_cast_changes(cast_ids: List[int]):
+    """Announce changed casts, inside a transaction only once it commits."""
+    for i in range(0, len(cast_ids), CAST_CHANGES_CHUNK):
+        payload = ",".join(str(cast_id) for cast_id in cast_ids[i:i + CAST_CHANGES_CHUNK])
+        await database.fetch_val(query=select(func.pg_notify(CAST_CHANGES_CHANNEL, payload)))
+
+
+@timed_query
+async def apply_cast_events(name: str, present: Iterable[int], removed: Iterable[int],
+                            position: int):
+    present, removed = list(present), list(removed)
+    cursor = insert(event_cursors).values(name=name, position=position)
+    changed = []
+    async with database.transaction():
+        for cast_ids, is_removed in ((present, False), (removed, True)):
+            if cast_ids:
+                replica = insert(known_casts).values(
+                    [{"id": cast_id, "removed": is_removed} for cast_id in cast_ids])
+                await database.execute(replica.on_conflict_do_update(
+                    index_elements=[known_casts.c.id],
+                    set_={"removed": replica.excluded.removed}))
+        for cast_id in removed:
+            changed.extend(await drop_cast(cast_id))
+        await notify_cast_changes(present + removed)
+        await database.execute(cursor.on_conflict_do_update(
+            index_elements=[event_cursors.c.name],
+            set_={"position": func.greatest(event_cursors.c.position,
+                                            cursor.excluded.position)}))
+    # Only once committed, a rebuild before that would still find the removed casts.
+    await forget_movies(list(dict.fromkeys(changed)))
@@ -0,0 +1,210 @@
+"""Bulk export of a table for analytics consumers.
+
+The table is read in windows of EXPORT_WINDOW ids, each with its own statement: a
+connection is held for one window at a time. What is read is queued for sending as it
+arrives, at most EXPORT_READ_AHEAD chunks ahead, so an export holds a few chunks in
+memory rather than a window, and a slow client slows the reads down.
+
+Formats:
+
+ - ``csv``: PostgreSQL formats the rows itself (``COPY (SELECT ...) TO STDOUT``), the
+   service only passes the bytes along after one header line, arrays as PostgreSQL
+   literals;
+ - ``arrow``: an Arrow IPC stream with one record batch per EXPORT_BATCH_ROWS rows
+   fetched through a cursor, arrays as lists, timestamps in UTC, needs the ``pyarrow``
+   package.
+
+Either can be compressed as a whole with gzip or zstd (``zstandard`` package).
+Windows are sent in id order and rows are ordered by id, an interrupted export is
+resumed by asking for the ids after the last complete row received.
+"""
+import asyncio
+import io
+import os
+import zlib
+from typing import Any, AsyncIterator, Awaitable, Callable, List
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import ARRAY, BigInteger, Column, DateTime, Integer, String, and_, select
+from sqlalchemy.dialects import postgresql
+
+# Ids read per statement.
+EXPORT_WINDOW = int(os.environ.get("EXPORT_WINDOW", 50000))
+# Chunks of COPY output, or batches of rows, read ahead of the one being sent.
+EXPORT_READ_AHEAD = int(os.environ.get("EXPORT_READ_AHEAD", 8))
+# Rows fetched per Arrow record batch.
+EXPORT_BATCH_ROWS = int(os.environ.get("EXPORT_BATCH_ROWS", 10000))
+EXPORT_GZIP_LEVEL = int(os.environ.get("EXPORT_GZIP_LEVEL", 6))
+EXPORT_ZSTD_LEVEL = int(os.environ.get("EXPORT_ZSTD_LEVEL", 3))
+
+MEDIA_TYPES = {"csv": "text/csv", "arrow": "application/vnd.apache.arrow.stream"}
+COMPRESSIONS = {"gzip": ("application/gzip", ".gz"), "zstd": ("application/zstd", ".zst")}
+
+
+def require(module: str, feature: str):
+    try:
+        return __import__(module, fromlist=["_"])
+    except ImportError:
+        raise HTTPException(status_code=501,
+                            detail=f"{feature} needs the {module} package, which is not installed")
+
+
+def window_query(columns: List[Column], after_id: int, until_id: int) -> str:
+    """SELECT of the rows with ``after_id < id <= until_id``, with literal values so
+    COPY can run it without parameters."""
+    id_column = next(column for column in columns if column.primary_key)
+    query = (
+        select(*columns)
+        .where(and_(id_column > after_id, id_column <= until_id))
+        .order_by(id_column)
+    )
+    return str(query.compile(dialect=postgresql.dialect(),
+                             compile_kwargs={"literal_binds": True}))
+
+
+def arrow_type(sql_type):
+    pa = require("pyarrow", "format=arrow")
+    if isinstance(sql_type, ARRAY):
+        return pa.list_(arrow_type(sql_type.item_type))
+    if isinstance(sql_type, BigInteger):
+        return pa.int64()
+    if isinstance(sql_type, Integer):
+        return pa.int32()
+    if isinstance(sql_type, DateTime):
+        return pa.timestamp("us", tz="UTC" if sql_type.timezone else None)
+    if isinstance(sql_type, String):
+        return pa.string()
+    raise TypeError(f"No Arrow type for {sql_type!r}")
+
+
+class CsvEncoder:
+    def __init__(self, columns: List[Column]):
+        # As COPY writes it; the windows are copied without theirs.
+        self.header = ",".join(column.key for column in columns).encode() + b"\n"
+
+    def start(self) -> bytes:
+        return self.header
+
+    def encode(self, chunk: bytes) -> bytes:
+        return chunk
+
+    def close(self) -> bytes:
+        return b""
+
+
+class ArrowEncoder:
+    def __init__(self, columns: List[Column]):
+        self.pa = require("pyarrow", "format=arrow")
+        import pyarrow.ipc
+
+        pa = self.pa
+        self.schema = pa.schema([pa.field(column.key, arrow_type(column.type),
+                                          nullable=column.nullable)
+                                 for column in columns])
+        self.sink = io.BytesIO()
+        self.writer = pa.ipc.new_stream(self.sink, self.schema)
+
+    def _drain(self) -> bytes:
+        data = self.sink.getvalue()
+        self.sink.seek(0)
+        self.sink.truncate()
+        return data
+
+    def start(self) -> bytes:
+        # The schema message, written when the stream is opened.
+        return self._drain()
+
+    def encode(self, rows: List[Any]) -> bytes:
+        # The rows come with the column types already, asyncpg decoded them.
+        arrays = [self.pa.array([row[i] for row in rows], type=field.type)
+                  for i, field in enumerate(self.schema)]
+        self.writer.write_batch(self.pa.record_batch(arrays, schema=self.schema))
+        return self._drain()
+
+    def close(self) -> bytes:
+        self.writer.close()
+        return self._drain()
+
+
+ENCODERS = {"csv": CsvEncoder, "arrow": ArrowEncoder}
+
+
+class Export:
+    """One export response: the windows of ids read by ``read(after_id, until_id,
+    output)``, which passes what it reads to ``output`` (COPY output for CSV, batches
+    of rows for Arrow), encoded and compressed."""
+
+    def __init__(self, name: str, columns: List[Column], output_format: str,
+                 compression: str = "none"):
+        self.name = name
+        self.output_format = output_format
+        self.compression = compression
+        # Built here so a missing package is answered with 501 before streaming starts.
+        self.encoder = ENCODERS[output_format](columns)
+        if compression == "gzip":
+            compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31)
+        elif compression == "zstd":
+            zstandard = require("zstandard", "compression=zstd")
+            compressor = zstandard.ZstdCompressor(level=EXPORT_ZSTD_LEVEL).compressobj()
+        else:
+            compressor = None
+        self.compressor = compressor
+
+    def _compress(self, data: bytes, last: bool = False) -> bytes:
+        if self.compressor is None:
+            return data
+        data = self.compressor.compress(data)
+        return data + self.compressor.flush() if last else data
+
+    def _encode(self, data) -> bytes:
+        return self._compress(self.encoder.encode(data))
+
+    def _close(self) -> bytes:
+        return self._compress(self.encoder.close(), last=True)
+
+    async def stream(self, read: Callable[[int, int, Callable], Awaitable[None]],
+                     after_id: int, until_id: int) -> AsyncIterator[bytes]:
+        # Filled by the reads as they go, they wait while it is full. Ends with None, or
+        # with the error of a read.
+        chunks = asyncio.Queue(maxsize=EXPORT_READ_AHEAD)
+
+        async def read_windows():
+            try:
+                for start in range(after_id, until_id, EXPORT_WINDOW):
+                    await read(start, min(start + EXPORT_WINDOW, until_id), chunks.put)
+            except Exception as error:
+                await chunks.put(error)
+            else:
+                await chunks.put(None)
+
+        reader = asyncio.ensure_future(read_windows())
+        try:
+            data = self._compress(self.encoder.start())
+            if data:
+                yield data
+            while (chunk := await chunks.get()) is not None:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                # Building batches and compressing take CPU time, off the event loop.
+                data = await asyncio.to_thread(self._encode, chunk)
+                if data:
+                    yield data
+            data = await asyncio.to_thread(self._close)
+            if data:
+                yield data
+        finally:
+            reader.cancel()
+
+    def response(self, read: Callable[[int, int, Callable], Awaitable[None]],
+                 after_id: int, until_id: int) -> StreamingResponse:
+        media_type, suffix = COMPRESSIONS.get(self.compression,
+                                              (MEDIA_TYPES[self.output_format], ""))
+        filename = f"{self.name}-{after_id}-{until_id}.{self.output_format}{suffix}"
+        return StreamingResponse(self.stream(read, after_id, until_id),
+                                 media_type=media_type,
+                                 headers={
+                                     "Content-Disposition": f'attachment; filename="{filename}"',
+                                     "Cache-Control": "no-store",
+                                     "X-Export-Until-Id": str(until_id),
+                                 })
@@ -0,0 +1,66 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+
+# Cache-Control sent with every cacheable GET response. The default lets clients and
+# the gateway store responses but makes them revalidate with the ETag before reuse.
+HTTP_CACHE_CONTROL = os.environ.get("HTTP_CACHE_CONTROL", "no-cache")
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def rows_etag(rows: Iterable, *extra) -> str:
+    return make_etag([(row["id"], row["version"]) for row in rows], *extra)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+
+def not_modified_since(if_modified_since: str, last_modified: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    return last_modified.replace(microsecond=0) <= since
+
+
+def conditional_response(request: Request, response: Response, etag: str,
+                         last_modified: Optional[datetime] = None) -> Optional[Response]:
+    """Set the cache validators on ``response``.
+
+    Returns a ``304 Not Modified`` response when the request validators still match,
+    ``None`` when the full representation has to be sent.
+    """
+    headers = {"ETag": etag, "Cache-Control": HTTP_CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc),
+                                                   usegmt=True)
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        modified = not etag_matches(if_none_match, etag)
+    elif if_modified_since is not None and last_modified is not None:
+        modified = not not_modified_since(if_modified_since, last_modified)
+    else:
+        modified = True
+
+    if modified:
+        return None
+    return Response(status_code=304, headers=headers)
@@ -1,10 +1,15 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import Any, List, Optional
+
+
+# Lengths of the movies table columns.
+NAME_LENGTH = 50
+PLOT_LENGTH = 250
 
 
 class MovieIn(BaseModel):
-    name: str
-    plot: str
+    name: str = Field(max_length=NAME_LENGTH)
+    plot: str = Field(max_length=PLOT_LENGTH)
     genres: List[str]
     casts_id: List[int]
 
@@ -13,8 +18,39 @@ class MovieOut(MovieIn):
     id: int
 
 
+class CastSummary(BaseModel):
+    id: int
+    name: str
+    nationality: Optional[str] = None
+
+
+class MovieExpandedOut(MovieOut):
+    casts: List[CastSummary]
+
+
 class MovieUpdate(MovieIn):
-    name: Optional[str] = None
-    plot: Optional[str] = None
+    name: Optional[str] = Field(default=None, max_length=NAME_LENGTH)
+    plot: Optional[str] = Field(default=None, max_length=PLOT_LENGTH)
     genres: Optional[List[str]] = None
     casts_id: Optional[List[int]] = None
+
+
+class MoviePatch(BaseModel):
+    # Omitted fields are left untouched, none of them can be cleared.
+    name: str = Field(default=None, max_length=NAME_LENGTH)
+    plot: str = Field(default=None, max_length=PLOT_LENGTH)
+    genres: List[str] = None
+    casts_id: List[int] = None
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    status: int
+    id: Optional[int] = None
+    detail: Optional[Any] = None
+
+
+class BulkOut(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkItemResult]
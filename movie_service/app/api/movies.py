@@ -1,34 +1,159 @@
-from typing import List
-from fastapi import APIRouter, HTTPException
-
-from app.api.models import MovieIn, MovieOut, MovieUpdate
-from app.api import db_manager
-from app.api.service import is_cast_present
+from datetime import datetime
+from functools import partial
+from typing import List, Literal, Optional, Tuple, Union
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+
+from app.api.models import (BulkOut, MovieExpandedOut, MovieIn, MovieOut, MoviePatch,
+                            MovieUpdate)
+from app.api import db_manager, shared_cache
+from app.api.bulk import insert_chunk, iter_bulk_items, iter_chunks, validate_chunk
+from app.api.export import Export
+from app.api.http_cache import conditional_response, rows_etag
+from app.api.serializers import (MOVIE, MOVIE_EXPANDED, MOVIE_EXPANDED_LIST, MOVIE_LIST,
+                                 as_dict, entry_response, json_response)
+from app.api.shared_cache import Entry
+from app.api.service import (cast_cache, ensure_casts_present, expand_casts,
+                             find_missing_casts, invalidate_cast)
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
+BULK_CHUNK_SIZE = 500
+# Ranked results are sorted as a whole, deep pages cost as much as all pages before them.
+MAX_SEARCH_OFFSET = 10000
 
 movies = APIRouter()
 
 
-@movies.get("/", response_model=List[MovieOut])
-async def get_movies():
-    return await db_manager.get_all_movies()
+async def stream_movies(after_id: int, **filters):
+    async for movie in db_manager.iterate_movies(after_id, STREAM_CHUNK_SIZE, **filters):
+        yield MOVIE.dump_json(as_dict(movie)) + b"\n"
+
+
+async def load_movies_page(after_id: int, limit: int,
+                           filters: dict) -> Tuple[list, Optional[str]]:
+    page = await db_manager.get_all_movies(after_id=after_id, limit=limit + 1, **filters)
+    if len(page) > limit:
+        page = page[:limit]
+        return page, str(page[-1]["id"])
+    return page, None
+
 
+async def render_movies_page(after_id: int, limit: int, filters: dict) -> Entry:
+    page, next_cursor = await load_movies_page(after_id, limit, filters)
+    return Entry.render(MOVIE_LIST, [as_dict(movie) for movie in page],
+                        etag=rows_etag(page, next_cursor), next_cursor=next_cursor)
 
-@movies.get("/{movie_id}/", response_model=MovieOut)
-async def get_movie(movie_id: int):
+
+async def render_movie(movie_id: int) -> Optional[Entry]:
     movie = await db_manager.get_movie(movie_id)
     if not movie:
+        return None
+    return Entry.render(MOVIE, as_dict(movie), etag=rows_etag([movie]),
+                        last_modified=movie["updated_at"].isoformat())
+
+
+@movies.get("/", response_model=List[Union[MovieExpandedOut, MovieOut]])
+async def get_movies(request: Request, response: Response,
+                     after_id: int = Query(default=0, ge=0),
+                     limit: int = Query(default=PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                     output_format: Literal["json", "ndjson"] = Query(default="json",
+                                                                      alias="format"),
+                     genre: Optional[str] = None,
+                     cast_id: Optional[int] = None,
+                     name_prefix: Optional[str] = Query(default=None, max_length=50),
+                     expand: Optional[Literal["casts"]] = None):
+    filters = {"genre": genre, "cast_id": cast_id, "name_prefix": name_prefix}
+
+    if output_format == "ndjson":
+        if expand:
+            raise HTTPException(status_code=400,
+                                detail="expand is not supported with format=ndjson")
+        return StreamingResponse(stream_movies(after_id, **filters),
+                                 media_type="application/x-ndjson")
+
+    if expand == "casts":
+        page, next_cursor = await load_movies_page(after_id, limit, filters)
+        page = await expand_casts(page)
+        entry = Entry.render(MOVIE_EXPANDED_LIST, page, next_cursor=next_cursor,
+                             etag=rows_etag(page, next_cursor,
+                                            [movie["casts"] for movie in page]))
+    else:
+        entry = await shared_cache.get_list("movies", (after_id, limit, *filters.values()),
+                                            lambda: render_movies_page(after_id, limit, filters))
+    if entry.meta["next_cursor"] is not None:
+        response.headers["X-Next-Cursor"] = entry.meta["next_cursor"]
+
+    not_modified = conditional_response(request, response, entry.meta["etag"])
+    if not_modified:
+        return not_modified
+    return entry_response(entry, response)
+
+
+@movies.get("/search", response_model=List[MovieOut])
+async def search_movies(request: Request, response: Response,
+                        q: str = Query(min_length=1, max_length=200),
+                        offset: int = Query(default=0, ge=0, le=MAX_SEARCH_OFFSET),
+                        limit: int = Query(default=PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                        genre: Optional[str] = None):
+    page = await db_manager.search_movies(q, offset=offset, limit=limit + 1, genre=genre)
+    if len(page) > limit:
+        page = page[:limit]
+        response.headers["X-Next-Offset"] = str(offset + limit)
+
+    not_modified = conditional_response(request, response,
+                                        rows_etag(page, response.headers.get("X-Next-Offset")))
+    if not_modified:
+        return not_modified
+    return json_response(MOVIE_LIST, page, response)
+
+
+@movies.get("/_export", response_class=StreamingResponse)
+async def export_movies(output_format: Literal["csv", "arrow"] = Query(default="csv",
+                                                                       alias="format"),
+                        compression: Literal["none", "gzip", "zstd"] = "none",
+                        after_id: int = Query(default=0, ge=0),
+                        until_id: Optional[int] = Query(default=None, ge=1)):
+    export = Export("movies", db_manager.MOVIE_COLUMNS, output_format, compression)
+    if until_id is None:
+        # Fixed when the export starts, an interrupted export is resumed with the same range.
+        until_id = await db_manager.get_last_movie_id()
+    return export.response(partial(db_manager.copy_movies, output_format=output_format),
+                           after_id, until_id)
+
+
+@movies.get("/{movie_id}/", response_model=Union[MovieExpandedOut, MovieOut])
+async def get_movie(request: Request, response: Response, movie_id: int,
+                    expand: Optional[Literal["casts"]] = None):
+    # Cast details are not covered by the movie row, so Last-Modified is only sent,
+    # and the shared cache only used, for the plain representation.
+    if expand == "casts":
+        entry = None
+        movie = await db_manager.get_movie(movie_id)
+        if movie:
+            [movie] = await expand_casts([movie])
+            entry = Entry.render(MOVIE_EXPANDED, movie,
+                                 etag=rows_etag([movie], movie["casts"]))
+    else:
+        entry = await shared_cache.get_record("movies", movie_id,
+                                              lambda: render_movie(movie_id))
+    if entry is None:
         raise HTTPException(status_code=404,
                             detail=f"Movie with given id: {movie_id} not found")
-    return movie
+
+    last_modified = entry.meta.get("last_modified")
+    not_modified = conditional_response(
+        request, response, entry.meta["etag"],
+        last_modified=last_modified and datetime.fromisoformat(last_modified))
+    if not_modified:
+        return not_modified
+    return entry_response(entry, response)
 
 
 @movies.post("/", response_model=MovieOut, status_code=201)
 async def create_movie(payload: MovieIn):
-
-    for cast_id in payload.casts_id:
-        if not is_cast_present(cast_id):
-            raise HTTPException(status_code=404,
-                                detail=f"Cast with given id: {cast_id} not found")
+    await ensure_casts_present(payload.casts_id)
 
     movie_id = await db_manager.add_movie(payload)
 
@@ -37,34 +162,91 @@ async def create_movie(payload: MovieIn):
     return response
 
 
-@movies.put("/{movie_id}/", response_model=MovieOut)
-async def update_movie(movie_id: int, payload: MovieUpdate):
-    movie = await db_manager.get_movie(movie_id)
+@movies.post("/_bulk", response_model=BulkOut)
+async def bulk_create_movies(request: Request):
+    results = []
+    index = 0
+    async for chunk in iter_chunks(iter_bulk_items(request), BULK_CHUNK_SIZE):
+        valid, failed = validate_chunk(MovieIn, chunk, start=index)
+        index += len(chunk)
+        results.extend(failed)
+        if not valid:
+            continue
+
+        try:
+            not_found = await find_missing_casts([cast_id for _, payload in valid
+                                                  for cast_id in payload.casts_id])
+        except HTTPException as error:
+            results.extend({"index": item_index, "status": error.status_code,
+                            "detail": error.detail} for item_index, _ in valid)
+            continue
+
+        to_insert = []
+        for item_index, payload in valid:
+            missing = [str(cast_id) for cast_id in dict.fromkeys(payload.casts_id)
+                       if cast_id in not_found]
+            if missing:
+                results.append({"index": item_index, "status": 404,
+                                "detail": f"Casts with given ids: {', '.join(missing)} not found"})
+            else:
+                to_insert.append((item_index, payload))
+
+        if to_insert:
+            results.extend(await insert_chunk(db_manager.add_movies, to_insert))
+
+    results.sort(key=lambda result: result["index"])
+    created = sum(1 for result in results if result["status"] == 201)
+    return {"created": created, "failed": len(results) - created, "results": results}
+
+
+async def apply_movie_update(movie_id: int, update_data: dict):
+    if "casts_id" in update_data:
+        await ensure_casts_present(update_data["casts_id"])
+
+    if update_data:
+        movie = await db_manager.update_movie(movie_id, update_data)
+    else:
+        movie = await db_manager.get_movie(movie_id)
 
     if not movie:
         raise HTTPException(status_code=404,
                             detail=f"Movie with given id:{movie_id} not found")
+    return movie
 
-    update_data = payload.model_dump(exclude_unset=True)
 
-    if "casts_id" in update_data:
-        for cast_id in payload.casts_id:
-            if not is_cast_present(cast_id):
-                raise HTTPException(status_code=404,
-                                    detail=f"Cast with given id:{cast_id} not found")
-    movie_in_db = MovieIn(**movie)
-    updated_movie = movie_in_db.model_copy(update=update_data)
+@movies.put("/{movie_id}/", response_model=MovieOut)
+async def update_movie(movie_id: int, payload: MovieUpdate):
+    update_data = payload.model_dump(exclude_unset=True)
+    return await apply_movie_update(movie_id, update_data)
 
-    movie_id = await db_manager.update_movie(movie_id, updated_movie)
-    update_data["id"] = movie_id
 
-    return update_data
+@movies.patch("/{movie_id}/", response_model=MovieOut)
+async def patch_movie(movie_id: int, payload: MoviePatch):
+    update_data = payload.model_dump(exclude_unset=True)
+    return await apply_movie_update(movie_id, update_data)
 
 
 @movies.delete("/{movie_id}/", response_model=None)
 async def delete_movie(movie_id: int):
-    movie = await db_manager.get_movie(movie_id)
+    movie = await db_manager.delete_movie(movie_id)
     if not movie:
         raise HTTPException(status_code=404,
                             detail=f"Movie with given id:{movie_id} not found")
-    return await db_manager.delete_movie(movie_id)
+
+
+@movies.delete("/_casts/{cast_id}/")
+async def remove_cast_from_movies(cast_id: int):
+    movie_ids = await db_manager.remove_cast_from_movies(cast_id)
+    return {"updated": len(movie_ids)}
+
+
+@movies.get("/_cache/casts/")
+async def get_cast_cache_stats():
+    return cast_cache.stats()
+
+
+@movies.delete("/_cache/casts/{cast_id}/", status_code=204)
+async def invalidate_cached_cast(cast_id: int):
+    # The hook reaches one worker, the others hear of it through cast_changes.py.
+    invalidate_cast(cast_id)
+    await db_manager.notify_cast_changes([cast_id])
@@ -0,0 +1,77 @@
+import os
+from typing import Any, List, Optional
+
+from fastapi import Response
+from pydantic import TypeAdapter
+from typing_extensions import TypedDict
+
+from app.api.shared_cache import Entry
+
+
+# Rows read from the database already have the column types of the response models, so
+# by default they are serialized straight to JSON by pydantic-core without validation.
+# Set TRUSTED_OUTPUT=0 to validate every response against its response_model again.
+TRUSTED_OUTPUT = os.environ.get("TRUSTED_OUTPUT", "1") == "1"
+
+
+class MovieRow(TypedDict):
+    name: str
+    plot: str
+    genres: List[str]
+    casts_id: List[int]
+    id: int
+
+
+class CastSummaryRow(TypedDict):
+    id: int
+    name: str
+    nationality: Optional[str]
+
+
+class MovieExpandedRow(MovieRow):
+    casts: List[CastSummaryRow]
+
+
+# TypedDict serializers keep only the declared keys, like response_model does.
+MOVIE = TypeAdapter(MovieRow)
+MOVIE_LIST = TypeAdapter(List[MovieRow])
+MOVIE_EXPANDED = TypeAdapter(MovieExpandedRow)
+MOVIE_EXPANDED_LIST = TypeAdapter(List[MovieExpandedRow])
+
+
+def as_dict(row) -> dict:
+    # databases wraps an asyncpg Record, converting that one avoids a Python call per column.
+    return dict(getattr(row, "_mapping", row))
+
+
+def json_response(adapter: TypeAdapter, content: Any, response: Response) -> Any:
+    """Serialize rows returned by a handler, keeping the headers set on ``response``.
+
+    ``content`` is a row or a list of rows (Records or dicts). Without TRUSTED_OUTPUT it is
+    returned unchanged, for FastAPI to validate against the route's response_model.
+    """
+    if not TRUSTED_OUTPUT:
+        return content
+
+    if isinstance(content, list):
+        content = [as_dict(row) for row in content]
+    else:
+        content = as_dict(content)
+    return body_response(adapter.dump_json(content), response)
+
+
+def body_response(body: bytes, response: Response) -> Response:
+    """Send an already serialized JSON body, keeping the headers set on ``response``."""
+    rendered = Response(body, media_type="application/json")
+    rendered.raw_headers.extend(response.raw_headers)
+    return rendered
+
+
+def entry_response(entry: Entry, response: Response) -> Any:
+    """Send a shared cache entry, see ``json_response``.
+
+    Entries read from the cache only hold the serialized body and are sent as they are.
+    """
+    if not TRUSTED_OUTPUT and entry.content is not None:
+        return entry.content
+    return body_response(entry.body, response)
@@ -1,11 +1,97 @@
 import os
-import httpx
+from typing import Dict, List, Optional, Set
 
+from fastapi import HTTPException
 
-CAST_SERVICE_HOST_URL = "http://localhost:8002/api/v1/casts/"
-url = os.environ.get("CAST_SERVICE_HOST_URL") or CAST_SERVICE_HOST_URL
+from app.api import cast_client, db_manager
+from app.api.cache import TTLCache
+from app.api.serializers import as_dict
+from app.api.singleflight import SingleFlight
 
 
-def is_cast_present(cast_id: int):
-    response = httpx.get(f"{url}{cast_id}/")
-    return True if response.status_code == 200 else False
+CAST_CACHE_SIZE = int(os.environ.get("CAST_CACHE_SIZE", 10000))
+CAST_CACHE_TTL = float(os.environ.get("CAST_CACHE_TTL", 300))
+CAST_CACHE_NEGATIVE_TTL = float(os.environ.get("CAST_CACHE_NEGATIVE_TTL", 30))
+
+cast_cache = TTLCache(maxsize=CAST_CACHE_SIZE,
+                      ttl=CAST_CACHE_TTL,
+                      negative_ttl=CAST_CACHE_NEGATIVE_TTL)
+# Lookups of the same cast id by concurrent requests share one call to cast_service.
+cast_lookups = SingleFlight("cast_lookup")
+
+
+async def fetch_casts(casts_id: List[int]) -> Dict[int, Optional[dict]]:
+    fetched = await cast_client.get_casts(casts_id)
+    for cast_id, cast in fetched.items():
+        cast_cache.set(cast_id, cast)
+    return fetched
+
+
+def invalidate_cast(cast_id: int):
+    cast_cache.invalidate(cast_id)
+    cast_lookups.forget(cast_id)
+
+
+async def get_casts(casts_id: List[int]) -> Dict[int, Optional[dict]]:
+    casts = {}
+    to_fetch = []
+    for cast_id in dict.fromkeys(casts_id):
+        found, cast = cast_cache.lookup(cast_id)
+        if found:
+            casts[cast_id] = cast
+        else:
+            to_fetch.append(cast_id)
+
+    if to_fetch:
+        try:
+            fetched = await cast_lookups.do_many(to_fetch, fetch_casts)
+        except cast_client.CastServiceTimeout as error:
+            raise HTTPException(status_code=504, detail=str(error))
+        except cast_client.CastServiceUnavailable as error:
+            retry_after = max(round(cast_client.breaker.retry_after()), 1)
+            raise HTTPException(status_code=503, detail=str(error),
+                                headers={"Retry-After": str(retry_after)})
+        except cast_client.CastServiceError as error:
+            raise HTTPException(status_code=502, detail=str(error))
+
+        casts.update(fetched)
+
+    return casts
+
+
+async def find_missing_casts(casts_id: List[int]) -> Set[int]:
+    unique_ids = list(dict.fromkeys(casts_id))
+    if not unique_ids:
+        return set()
+
+    known = await db_manager.get_known_casts(unique_ids)
+    # Checked before the lookup cache: only the worker applying the events drops a
+    # deleted cast from its own cache, the others may still hold it.
+    removed = {cast_id for cast_id, is_removed in known.items() if is_removed}
+    unknown = [cast_id for cast_id in unique_ids if cast_id not in known]
+    if not unknown:
+        return removed
+
+    # The replica lags behind cast_service, ids it does not know yet may well exist.
+    casts = await get_casts(unknown)
+    return removed | {cast_id for cast_id in unknown if casts[cast_id] is None}
+
+
+async def ensure_casts_present(casts_id: List[int]):
+    found_missing = await find_missing_casts(casts_id)
+
+    missing = [cast_id for cast_id in dict.fromkeys(casts_id) if cast_id in found_missing]
+    if missing:
+        ids = ", ".join(str(cast_id) for cast_id in missing)
+        raise HTTPException(status_code=404,
+                            detail=f"Casts with given ids: {ids} not found")
+
+
+async def expand_casts(movies: list) -> List[dict]:
+    casts = await get_casts([cast_id for movie in movies for cast_id in movie["casts_id"]])
+
+    return [
+        {**as_dict(movie), "casts": [casts[cast_id] for cast_id in movie["casts_id"]
+                            if casts[cast_id] is not None]}
+        for movie in movies
+    ]
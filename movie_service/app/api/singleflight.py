@@ -0,0 +1,103 @@
+"""Coalescing of identical concurrent calls.
+
+While a call for a key is in flight, callers asking for the same key await its
+result instead of starting their own, so a spike of requests for one record
+costs one database query or upstream call. Results are not kept once the call
+is over, caching them is left to the callers.
+"""
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional
+
+from app.api.metrics import SINGLE_FLIGHT_CALLS
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+        self._started = SINGLE_FLIGHT_CALLS.labels(name=name, result="started")
+        self._coalesced = SINGLE_FLIGHT_CALLS.labels(name=name, result="coalesced")
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def _start(self, keys: list, awaitable: Awaitable) -> asyncio.Task:
+        # A task, so a caller going away (e.g. a disconnected client) does not cancel
+        # the call for the others waiting on it.
+        flight = asyncio.ensure_future(awaitable)
+        for key in keys:
+            self._flights[key] = flight
+        self._started.inc(len(keys))
+
+        def done(_):
+            for key in keys:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            if not flight.cancelled():
+                flight.exception()  # retrieved even if every caller went away
+
+        flight.add_done_callback(done)
+        return flight
+
+    async def do(self, key: Hashable, function: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._start([key], function(*args, **kwargs))
+        else:
+            self._coalesced.inc()
+        return await asyncio.shield(flight)
+
+    async def do_many(self, keys: Iterable[Hashable],
+                      function: Callable[[list], Awaitable[Dict[Hashable, Any]]]) -> Dict[Hashable, Any]:
+        """Resolve ``keys`` with ``function(keys) -> {key: value}``, joining the calls
+        already in flight for some of them and calling ``function`` for the rest."""
+        flights = {}
+        to_start = []
+        for key in dict.fromkeys(keys):
+            flight = self._flights.get(key)
+            if flight is None:
+                to_start.append(key)
+            else:
+                flights[key] = flight
+                self._coalesced.inc()
+        if to_start:
+            flight = self._start(to_start, function(to_start))
+            flights.update(dict.fromkeys(to_start, flight))
+
+        unique = list(dict.fromkeys(flights.values()))
+        outcomes = await asyncio.gather(*map(asyncio.shield, unique), return_exceptions=True)
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                raise outcome
+        results = dict(zip(unique, outcomes))
+        return {key: results[flight][key] for key, flight in flights.items()}
+
+    def forget(self, key: Hashable):
+        """Make the next call for ``key`` start afresh, e.g. after the record was written."""
+        self._flights.pop(key, None)
+
+
+def single_flight(function=None, *, scope: Optional[Callable[[], Hashable]] = None):
+    """Coalesce concurrent calls of a coroutine function made with the same arguments.
+
+    ``scope``, when given, is called on every call and only calls made in the same
+    scope are coalesced (e.g. reads that must go to the primary database).
+    """
+    if function is None:
+        return functools.partial(single_flight, scope=scope)
+    group = SingleFlight(function.__name__)
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())), scope() if scope else None)
+        return await group.do(key, function, *args, **kwargs)
+
+    def forget(*args, **kwargs):
+        arguments = (args, tuple(sorted(kwargs.items())))
+        for key in [key for key in group._flights if key[:2] == arguments]:
+            group.forget(key)
+
+    wrapper.forget = forget
+    wrapper.flights = group
+    return wrapper
@@ -0,0 +1,217 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api import cast_changes, cast_client, cast_events, service
+from app.api.db import database, event_cursors, known_casts, movies
+from app.api import db_manager as dbm
+from app.api.circuit_breaker import CircuitBreaker
+
+UPDATED_AT = datetime(2023, 10, 1, 12, 0, tzinfo=timezone.utc)
+MOVIES = [
+    {"id": 1, "name": "First", "plot": "Plot", "genres": ["drama"], "casts_id": [1, 3],
+     "version": 1, "updated_at": UPDATED_AT},
+    {"id": 2, "name": "Second", "plot": "Plot", "genres": ["comedy"], "casts_id": [2, 1],
+     "version": 2, "updated_at": UPDATED_AT},
+]
+
+
+@pytest.fixture(scope="module")
+def test_app():
+    """
+    Pytest fixture providing a TestClient for the FastAPI app.
+
+    This fixture sets up a TestClient for the FastAPI app to simulate HTTP requests
+    during testing. It configures the client to use the specified base URL for API
+    endpoints under '/api/v1/movies/'. The cast events consumer is not started, it is
+    tested on its own.
+
+    Returns:
+        TestClient: A TestClient instance for making HTTP requests to the app.
+    """
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(cast_events, "POLL_INTERVAL", 0)
+        with TestClient(app, base_url="http://localhost:8080/api/v1/movies/") as client:
+            yield client
+
+
+class FakeCastService:
+    """
+    Stand-in for cast_service, answering the cast client through an 'httpx.MockTransport'.
+
+    Batch lookups find the cast members in 'casts', the events feed reads 'events'.
+    While 'failures' is not empty, each request instead gets the next of them: a status
+    code to answer with, or an exception to raise (e.g. 'httpx.ConnectError'). Every
+    answer takes 'delay' seconds and successful ones carry 'headers'. 'max_in_flight'
+    counts the requests handled at the same time, at most.
+
+    Args:
+        casts: The cast members known to the service, by ID.
+    """
+    def __init__(self, casts: dict):
+        self.casts = casts
+        self.events = []
+        self.failures = []
+        self.requests = []
+        self.delay = 0.0
+        self.headers = {}
+        self.in_flight = self.max_in_flight = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await self.answer(request)
+        finally:
+            self.in_flight -= 1
+
+    async def answer(self, request: httpx.Request) -> httpx.Response:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.failures:
+            failure = self.failures.pop(0)
+            if isinstance(failure, Exception):
+                raise failure
+            return httpx.Response(failure, json={"detail": "failure"})
+        if request.url.path.endswith("/_events"):
+            after_id = int(request.url.params["after_id"])
+            events = [event for event in self.events if event["id"] > after_id]
+            return httpx.Response(200, json=events[:int(request.url.params["limit"])],
+                                  headers=self.headers)
+        ids = json.loads(request.content)["ids"]
+        return httpx.Response(200, headers=self.headers, json={
+            "casts": [self.casts[cast_id] for cast_id in ids if cast_id in self.casts],
+            "missing": [cast_id for cast_id in ids if cast_id not in self.casts],
+        })
+
+
+@pytest.fixture
+def cast_service(monkeypatch):
+    """
+    Pytest fixture connecting the cast client to a 'FakeCastService'.
+
+    This fixture replaces the HTTP client of 'app.api.cast_client' with one sending its
+    requests to a fake transport, and starts every test with a closed circuit breaker
+    (3 failures, 30 seconds), an empty cast cache and retries without delay.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+
+    Returns:
+        FakeCastService: The fake service, knowing cast members with IDs 1 and 2.
+    """
+    fake = FakeCastService({
+        1: {"id": 1, "name": "Jane Doe", "nationality": "British"},
+        2: {"id": 2, "name": "John Doe", "nationality": None},
+    })
+    client = cast_client.new_client(transport=httpx.MockTransport(fake.handle),
+                                    base_url="http://cast_service/api/v1/casts/")
+    monkeypatch.setattr(cast_client, "_client", client)
+    monkeypatch.setattr(cast_client, "breaker", CircuitBreaker("cast_service", 3, 30))
+    monkeypatch.setattr(cast_client, "RETRY_BACKOFF", 0)
+    service.cast_cache.clear()
+    yield fake
+    service.cast_cache.clear()
+
+
+@pytest.fixture
+def mock_get_known_casts(monkeypatch):
+    """
+    Pytest fixture for mocking 'db_manager.get_known_casts' with an empty replica.
+
+    Every cast ID is then looked up in cast_service.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+    """
+    async def mock_get_known_casts(cast_ids):
+        return {}
+    monkeypatch.setattr(dbm, "get_known_casts", mock_get_known_casts)
+
+
+@pytest.fixture
+def mock_add_movie(monkeypatch):
+    """
+    Pytest fixture for mocking the 'db_manager.add_movie' function.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+
+    Returns:
+        list: The payloads passed to 'add_movie', each created with ID 1.
+    """
+    added = []
+
+    async def mock_add_movie(payload):
+        added.append(payload)
+        return 1
+    monkeypatch.setattr(dbm, "add_movie", mock_add_movie)
+    return added
+
+
+@pytest.fixture
+def empty_database(test_app):
+    """
+    Pytest fixture emptying the tables of movie_service before and after the test.
+
+    The test database is disposable, tests using this fixture read and write it
+    through the connection pool of the app, on the event loop of the TestClient.
+
+    Args:
+        test_app: Pytest fixture providing the FastAPI TestClient.
+
+    Returns:
+        callable: Runs a coroutine function with its arguments on the loop of the app.
+    """
+    def run(function, *args):
+        return test_app.portal.call(function, *args)
+
+    async def empty():
+        for table in (movies, known_casts, event_cursors):
+            await database.execute(table.delete())
+
+    run(empty)
+    yield run
+    run(empty)
+
+
+@pytest.fixture
+def mock_get_movies(monkeypatch):
+    """
+    Pytest fixture for mocking 'db_manager.get_movie' and 'db_manager.get_all_movies'.
+
+    The mocked table holds two movies: movie 1 with cast members 1 and 3 (unknown to
+    the 'cast_service' fixture), movie 2 with cast members 2 and 1. Filters are ignored.
+
+    Args:
+        monkeypatch: Pytest fixture for patching modules and objects during testing.
+    """
+    async def mock_get_movie(movie_id):
+        return next((movie for movie in MOVIES if movie["id"] == movie_id), None)
+
+    async def mock_get_all_movies(after_id=0, limit=None, **filters):
+        return [movie for movie in MOVIES if movie["id"] > after_id][:limit]
+    monkeypatch.setattr(dbm, "get_movie", mock_get_movie)
+    monkeypatch.setattr(dbm, "get_all_movies", mock_get_all_movies)
+
+
+@pytest.fixture
+def cast_changes_missed(test_app):
+    """
+    Pytest fixture stopping the cast changes listener of the app during the test.
+
+    The worker then misses the cast changes announced by the others, as it does until
+    their notification is delivered.
+
+    Args:
+        test_app: Pytest fixture providing the FastAPI TestClient.
+    """
+    test_app.portal.call(cast_changes.stop_listener)
+    yield
+    test_app.portal.call(cast_changes.start_listener)
@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+from app.api import cache
+from app.api import db_manager as dbm
+from app.api.cache import TTLCache
+from app.api.cast_changes import CastChangesListener
+
+
+async def wait_until(condition, timeout: float = 5):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout)
+
+
+class TestTTLCache:
+    """
+    Test class for 'TTLCache', the bounded LRU cache of cast lookups.
+    """
+    @pytest.fixture
+    def clock(self, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+        return now
+
+    def test_entries_expire(self, clock):
+        """
+        Test that entries expire after their time to live, negative ones sooner.
+
+        This test case caches a cast and a missing one and checks that the missing
+        one expires after the negative TTL while the cast is still served until its
+        own TTL.
+        """
+        casts = TTLCache(maxsize=10, ttl=300, negative_ttl=30)
+        casts.set(1, {"id": 1})
+        casts.set(2, None)
+
+        clock[0] += 30
+        assert casts.lookup(1) == (True, {"id": 1})
+        assert casts.lookup(2) == (False, None)
+
+        clock[0] += 270
+        assert casts.lookup(1) == (False, None)
+        assert casts.stats()["size"] == 0
+
+    def test_least_recently_used_evicted(self, clock):
+        """
+        Test that a full cache evicts the entry looked up least recently.
+        """
+        casts = TTLCache(maxsize=2, ttl=300)
+        casts.set(1, {"id": 1})
+        casts.set(2, {"id": 2})
+        casts.lookup(1)
+        casts.set(3, {"id": 3})
+
+        assert casts.lookup(2) == (False, None)
+        assert casts.lookup(1)[0] and casts.lookup(3)[0]
+        assert casts.stats()["evictions"] == 1
+
+
+class TestCastCacheInvalidation:
+    """
+    Test class for the cast lookup cache of movie writes and its invalidation hook.
+    """
+    payload = {"name": "Movie", "plot": "Plot", "genres": ["drama"], "casts_id": [1]}
+
+    def test_lookups_are_cached(self, test_app, cast_service, mock_get_known_casts,
+                                mock_add_movie):
+        """
+        Test that a cast looked up once is not asked from cast_service again.
+
+        This test case creates two movies with the same cast and checks that
+        cast_service was called once, and that the cache statistics count the hit.
+        """
+        first = test_app.post("", json=self.payload)
+        second = test_app.post("", json=self.payload)
+
+        assert first.status_code == second.status_code == 201
+        assert len(cast_service.requests) == 1
+        assert test_app.get("_cache/casts/").json()["hits"] >= 1
+
+    def test_change_hook_invalidates_cast(self, test_app, cast_service,
+                                          mock_get_known_casts, mock_add_movie):
+        """
+        Test that the change hook of cast_service drops a cached lookup, negative or not.
+
+        This test case looks up a cast missing from cast_service, which is cached as
+        missing, then creates it in cast_service and calls the hook for it. It checks
+        that the movie is rejected until the hook is called and accepted after it.
+        """
+        payload = {**self.payload, "casts_id": [3]}
+
+        missing = test_app.post("", json=payload)
+        cast_service.casts[3] = {"id": 3, "name": "New Cast", "nationality": None}
+        still_missing = test_app.post("", json=payload)
+        hook = test_app.delete("_cache/casts/3/")
+        created = test_app.post("", json=payload)
+
+        assert missing.status_code == still_missing.status_code == 404
+        assert hook.status_code == 204
+        assert created.status_code == 201
+        assert len(cast_service.requests) == 2
+
+    def test_changes_reach_every_worker(self, test_app, empty_database):
+        """
+        Test that a cast change heard by one worker is dropped from the cache of every worker.
+
+        This test case runs the listener of a second worker next to the app, calls
+        the change hook of the app for one cast and applies the events of another.
+        It checks that the second worker dropped both from its own cache, and only them.
+        """
+        other = CastChangesListener(TTLCache(maxsize=10, ttl=300))
+        listening = test_app.portal.start_task_soon(other.run)
+        try:
+            empty_database(wait_until, other.listening.is_set)
+            for cast_id in (1, 2, 3):
+                other.cache.set(cast_id, {"id": cast_id})
+            hook = test_app.delete("_cache/casts/1/")
+            empty_database(dbm.apply_cast_events, "cast_events", [2], [], 1)
+            empty_database(wait_until, lambda: len(other.cache) == 1)
+        finally:
+            listening.cancel()
+
+        assert hook.status_code == 204
+        assert other.cache.lookup(3) == (True, {"id": 3})
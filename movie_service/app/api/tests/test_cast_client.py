@@ -0,0 +1,265 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app.api import cast_client, circuit_breaker, service
+from app.api.circuit_breaker import CircuitBreaker, CircuitOpen
+
+
+class TestCircuitBreaker:
+    """
+    Test class for 'CircuitBreaker', the transitions between closed, open and half-open.
+    """
+    @pytest.fixture
+    def clock(self, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: now[0])
+        return now
+
+    def test_opens_after_consecutive_failures(self, clock):
+        """
+        Test that only consecutive failures open the circuit.
+
+        This test case records failures interrupted by a success, then as many
+        consecutive failures as the threshold. It checks that the circuit stays closed
+        until then, and that calls are rejected once it is open.
+        """
+        breaker = CircuitBreaker("cast_service", failure_threshold=3, reset_timeout=30)
+
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpen):
+            breaker.before_call()
+        assert breaker.retry_after() == 30
+
+    def test_half_open_trial(self, clock):
+        """
+        Test that a single trial call is let through once the reset timeout is over.
+
+        This test case opens the circuit and lets the reset timeout pass. It checks
+        that one trial call is let through while the others are rejected, that a
+        failed trial opens the circuit again and that a successful one closes it.
+        """
+        breaker = CircuitBreaker("cast_service", failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+
+        clock[0] += 30
+        breaker.before_call()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(CircuitOpen):
+            breaker.before_call()
+
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpen):
+            breaker.before_call()
+
+        clock[0] += 30
+        breaker.before_call()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.before_call()
+
+
+class TestCastClient:
+    """
+    Test class for the batch lookups of 'cast_client' against a fake cast_service.
+    """
+    def test_retries_with_bounded_backoff(self, cast_service, monkeypatch):
+        """
+        Test that failed lookups are retried after a jittered, doubling delay.
+
+        This test case fails the first two attempts with a 503 and a connection
+        error. It checks that the third attempt answers the lookup, and that the
+        delays before the retries are drawn below RETRY_BACKOFF, then twice that.
+        """
+        delays, bounds = [], []
+        monkeypatch.setattr(cast_client, "RETRY_BACKOFF", 0.1)
+        monkeypatch.setattr(cast_client.random, "uniform",
+                            lambda low, high: bounds.append((low, high)) or high / 2)
+
+        async def sleep(delay):
+            delays.append(delay)
+        monkeypatch.setattr(cast_client.asyncio, "sleep", sleep)
+        cast_service.failures = [503, httpx.ConnectError("refused")]
+
+        casts = asyncio.run(cast_client.get_casts([1, 3]))
+
+        assert casts == {1: cast_service.casts[1], 3: None}
+        assert len(cast_service.requests) == 3
+        assert bounds == [(0, 0.1), (0, 0.2)]
+        assert delays == [0.05, 0.1]
+        assert cast_client.breaker.state == CircuitBreaker.CLOSED
+
+    def test_gives_up_and_opens_circuit(self, cast_service):
+        """
+        Test that a lookup fails after its retries and that failures open the circuit.
+
+        This test case makes every call fail and checks that a lookup gives up after
+        RETRIES + 1 attempts, and that once the breaker opened no request is sent.
+        """
+        cast_service.failures = [502] * 10
+
+        with pytest.raises(cast_client.CastServiceUnavailable):
+            asyncio.run(cast_client.get_casts([1]))
+
+        assert len(cast_service.requests) == 3
+        assert cast_client.breaker.state == CircuitBreaker.OPEN
+
+        with pytest.raises(cast_client.CastServiceUnavailable):
+            asyncio.run(cast_client.get_casts([1]))
+        assert len(cast_service.requests) == 3
+
+    def test_cookies_are_not_kept(self, cast_service):
+        """
+        Test that a cookie set by cast_service is not sent back on later calls.
+
+        This test case answers a lookup with the read-your-writes cookie and checks
+        that the events poll that follows is sent without it.
+        """
+        cast_service.headers = {"set-cookie": "read_primary_until=9999999999; Path=/"}
+
+        async def run():
+            await cast_client.get_casts([1])
+            await cast_client.get_events(0, 10)
+        asyncio.run(run())
+
+        assert "cookie" not in cast_service.requests[1].headers
+        assert not cast_client.get_client().cookies
+
+    def test_client_error_is_not_retried(self, cast_service):
+        """
+        Test that a 4xx answer is reported at once and does not count as a failure.
+        """
+        cast_service.failures = [422]
+
+        with pytest.raises(cast_client.CastServiceError):
+            asyncio.run(cast_client.get_casts([1]))
+
+        assert len(cast_service.requests) == 1
+        assert cast_client.breaker.failures == 0
+
+
+class TestGetCasts:
+    """
+    Test class for 'service.get_casts', the cast lookups of movie requests.
+    """
+    def test_batches_sent_concurrently(self, cast_service, monkeypatch):
+        """
+        Test that the lookups of many casts are split in batches sent concurrently.
+
+        This test case looks up five casts two per batch with at most two concurrent
+        calls, and checks that three batches were sent through the shared client,
+        two at a time, and that their answers are merged.
+        """
+        monkeypatch.setattr(cast_client, "BATCH_SIZE", 2)
+        monkeypatch.setattr(cast_client, "MAX_CONCURRENCY", 2)
+        cast_service.delay = 0.05
+
+        casts = asyncio.run(service.get_casts([1, 2, 3, 4, 5, 1]))
+
+        assert casts == {1: cast_service.casts[1], 2: cast_service.casts[2],
+                         3: None, 4: None, 5: None}
+        assert [json.loads(request.content)["ids"] for request in cast_service.requests] == [
+            [1, 2], [3, 4], [5]]
+        assert cast_service.max_in_flight == 2
+
+    @pytest.mark.parametrize("failures, status", [
+        ([400], 502),
+        ([503] * 3, 503),
+        ([httpx.ConnectError("refused")] * 3, 503),
+    ])
+    def test_failures(self, cast_service, failures, status):
+        """
+        Test the status answered when cast_service rejects the lookup or is unavailable.
+        """
+        cast_service.failures = failures
+
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(service.get_casts([1]))
+
+        assert error.value.status_code == status
+        if status == 503:
+            assert error.value.headers == {"Retry-After": "30"}
+
+    def test_timeout(self, cast_service, monkeypatch):
+        """
+        Test that a lookup exceeding the request deadline answers 504 (Gateway Timeout).
+        """
+        monkeypatch.setattr(cast_client, "REQUEST_DEADLINE", 0.05)
+        cast_service.delay = 1
+
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(service.get_casts([1]))
+
+        assert error.value.status_code == 504
+
+
+class TestCastValidationErrors:
+    """
+    Test class for the statuses of movie writes when cast_service fails.
+    """
+    payload = {"name": "Movie", "plot": "Plot", "genres": ["drama"], "casts_id": [1, 3]}
+
+    def test_missing_cast(self, test_app, cast_service, mock_get_known_casts,
+                          mock_add_movie):
+        """
+        Test that a movie with a cast member unknown to cast_service is rejected with 404.
+        """
+        response = test_app.post("", json=self.payload)
+
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Casts with given ids: 3 not found"
+        assert mock_add_movie == []
+
+    def test_cast_service_rejects_lookup(self, test_app, cast_service, mock_get_known_casts,
+                                         mock_add_movie):
+        """
+        Test that a lookup rejected by cast_service answers 502 (Bad Gateway).
+        """
+        cast_service.failures = [400]
+
+        response = test_app.post("", json=self.payload)
+
+        assert response.status_code == 502
+
+    def test_cast_service_unavailable(self, test_app, cast_service, mock_get_known_casts,
+                                      mock_add_movie):
+        """
+        Test that an unavailable cast_service answers 503 with 'Retry-After'.
+
+        This test case fails every call and checks the first response, once the
+        retries are exhausted, and the next one, rejected by the open circuit with
+        the time left until the trial call.
+        """
+        cast_service.failures = [503] * 10
+
+        first = test_app.post("", json=self.payload)
+        second = test_app.post("", json=self.payload)
+
+        assert first.status_code == second.status_code == 503
+        assert len(cast_service.requests) == 3
+        assert second.headers["retry-after"] == "30"
+        assert mock_add_movie == []
+
+    def test_cast_service_timeout(self, test_app, cast_service, mock_get_known_casts,
+                                  mock_add_movie, monkeypatch):
+        """
+        Test that a lookup exceeding the request deadline answers 504 (Gateway Timeout).
+        """
+        monkeypatch.setattr(cast_client, "REQUEST_DEADLINE", 0.05)
+        cast_service.delay = 1
+
+        response = test_app.post("", json=self.payload)
+
+        assert response.status_code == 504
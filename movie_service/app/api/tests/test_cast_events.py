@@ -0,0 +1,198 @@
+import asyncio
+
+from sqlalchemy import select
+
+from app.api import cast_events, service, shared_cache
+from app.api import db_manager as dbm
+from app.api.db import database, known_casts, movies
+from app.api.models import MovieIn
+from app.api.cache import TTLCache
+from app.api.service import cast_cache
+
+
+def event(event_id: int, cast_id: int, type_: str) -> dict:
+    return {"id": event_id, "cast_id": cast_id, "type": type_,
+            "created_at": "2023-10-01T12:00:00Z"}
+
+
+async def add_movie(casts_id: list) -> int:
+    return await dbm.add_movie(MovieIn(name="Movie", plot="Plot", genres=["drama"],
+                                       casts_id=casts_id))
+
+
+async def read_state() -> dict:
+    rows = await database.fetch_all(select(movies.c.id, movies.c.casts_id)
+                                    .order_by(movies.c.id))
+    replica = await database.fetch_all(known_casts.select().order_by(known_casts.c.id))
+    return {
+        "casts_id": [row["casts_id"] for row in rows],
+        "known": [row["id"] for row in replica if not row["removed"]],
+        "removed": [row["id"] for row in replica if row["removed"]],
+        "cursor": await dbm.get_event_cursor(cast_events.CURSOR_NAME),
+    }
+
+
+class TestApplyEvents:
+    """
+    Test class for applying a batch of cast events to the local replica.
+    """
+    def test_last_event_of_cast_wins(self, monkeypatch):
+        """
+        Test that only the last event of a cast within a batch decides whether it exists.
+
+        This test case applies a batch where a cast is created then deleted and
+        another one deleted then created again. It checks what is passed on to the
+        database and that cached lookups of every cast in the batch are dropped.
+        """
+        applied = []
+
+        async def mock_apply_cast_events(name, present, removed, position):
+            applied.append((name, list(present), list(removed), position))
+        monkeypatch.setattr(dbm, "apply_cast_events", mock_apply_cast_events)
+        cast_cache.set(1, {"id": 1, "name": "Jane Doe", "nationality": None})
+        cast_cache.set(2, None)
+
+        asyncio.run(cast_events.apply_events([
+            event(1, 1, "created"), event(2, 2, "deleted"), event(3, 1, "deleted"),
+            event(4, 2, "created"), event(5, 3, "updated"),
+        ]))
+
+        assert applied == [("cast_events", [2, 3], [1], 5)]
+        assert cast_cache.lookup(1) == (False, None)
+        assert cast_cache.lookup(2) == (False, None)
+
+    def test_apply_cast_events(self, empty_database, monkeypatch):
+        """
+        Test that applying events updates the replica, the movies and the cursor at once.
+
+        This test case removes a cast referenced by two movies and checks that it is
+        dropped from them and kept in the replica as removed, that the cursor never
+        moves back and that the changed movies are invalidated only once the
+        transaction committed.
+        """
+        invalidated = []
+
+        async def invalidate(namespace, *record_ids):
+            committed = not database.connection()._transaction_stack
+            invalidated.append((namespace, sorted(record_ids), committed))
+        monkeypatch.setattr(shared_cache, "invalidate", invalidate)
+
+        async def run():
+            first = await add_movie([1, 2])
+            await add_movie([2])
+            third = await add_movie([1])
+            await dbm.apply_cast_events("cast_events", [1, 2], [], 3)
+            invalidated.clear()
+            await dbm.apply_cast_events("cast_events", [3], [1], 7)
+            await dbm.apply_cast_events("cast_events", [], [], 5)
+            return [first, third], await read_state()
+
+        changed, state = empty_database(run)
+
+        assert state == {"casts_id": [[2], [2], []], "known": [2, 3], "removed": [1],
+                         "cursor": 7}
+        assert invalidated == [("movies", changed, True)]
+
+    def test_other_workers_reject_deleted_cast(self, test_app, empty_database, cast_service,
+                                               cast_changes_missed, monkeypatch):
+        """
+        Test that a cast deleted by the consumer is rejected by the workers not running it.
+
+        This test case creates a movie through a worker, which caches the cast it
+        looked up, then applies the deletion of that cast with the cache of another
+        worker, the consumer, before the first worker heard of the change. It checks
+        that the first worker, still caching the cast, rejects it without asking
+        cast_service, and that it was dropped from the movie.
+        """
+        payload = {"name": "Movie", "plot": "Plot", "genres": ["drama"], "casts_id": [1]}
+        worker_cache = service.cast_cache
+
+        created = test_app.post("", json=payload)
+        monkeypatch.setattr(service, "cast_cache", TTLCache(maxsize=10, ttl=300))
+        empty_database(cast_events.apply_events, [event(1, 1, "deleted")])
+        monkeypatch.setattr(service, "cast_cache", worker_cache)
+        rejected = test_app.post("", json=payload)
+
+        assert created.status_code == 201
+        assert worker_cache.lookup(1) == (True, cast_service.casts[1])
+        assert rejected.status_code == 404
+        assert len(cast_service.requests) == 1
+        assert empty_database(read_state)["casts_id"] == [[]]
+
+
+class TestConsumer:
+    """
+    Test class for the background consumer of the cast events feed.
+    """
+    @staticmethod
+    async def consume_until(position: int, timeout: float = 5) -> dict:
+        consumer = asyncio.create_task(cast_events.consume_events())
+        try:
+            async def reached():
+                while await dbm.get_event_cursor(cast_events.CURSOR_NAME) < position:
+                    await asyncio.sleep(0.01)
+            await asyncio.wait_for(reached(), timeout)
+        finally:
+            consumer.cancel()
+            await asyncio.gather(consumer, return_exceptions=True)
+        return await read_state()
+
+    def test_follows_feed(self, empty_database, cast_service, monkeypatch):
+        """
+        Test that the consumer applies the feed in batches from the stored cursor.
+
+        This test case stores a cursor after the first event, then lets the consumer
+        read the feed two events at a time, and poll on without delay once drained. It
+        checks that the events after the cursor were applied, the deleted cast removed
+        from its movie, and the lock released.
+        """
+        monkeypatch.setattr(cast_events, "BATCH_SIZE", 2)
+        cast_service.events = [event(1, 9, "created"), event(2, 1, "created"),
+                               event(3, 2, "created"), event(4, 1, "deleted")]
+
+        async def run():
+            await add_movie([1, 2])
+            await dbm.apply_cast_events("cast_events", [], [], 1)
+            state = await self.consume_until(4)
+            async with cast_events.consumer_lock() as locked:
+                return state, locked
+
+        state, locked = empty_database(run)
+
+        assert state == {"casts_id": [[2]], "known": [2], "removed": [1], "cursor": 4}
+        polls = [request.url.params["after_id"] for request in cast_service.requests]
+        assert polls[:2] == ["1", "3"]
+        assert locked
+
+    def test_one_consumer_per_service(self, empty_database, cast_service, monkeypatch):
+        """
+        Test that a worker leaves the feed to the one holding the consumer lock.
+
+        This test case holds the consumer lock, as another worker would, while the
+        consumer runs. It checks that the feed is not read until the lock is released,
+        and that the consumer then takes over.
+        """
+        monkeypatch.setattr(cast_events, "LEADER_RETRY_INTERVAL", 0.05)
+        cast_service.events = [event(1, 1, "created")]
+
+        async def run():
+            release = asyncio.Event()
+
+            async def other_worker():
+                async with cast_events.consumer_lock() as locked:
+                    assert locked
+                    await release.wait()
+
+            holder = asyncio.create_task(other_worker())
+            await asyncio.sleep(0.05)
+            consumer = asyncio.create_task(self.consume_until(1))
+            await asyncio.sleep(0.2)
+            requests_while_held = len(cast_service.requests)
+            release.set()
+            await holder
+            return requests_while_held, await consumer
+
+        requests_while_held, state = empty_database(run)
+
+        assert requests_while_held == 0
+        assert state["known"] == [1]
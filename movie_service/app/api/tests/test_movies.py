@@ -0,0 +1,521 @@
+import json
+
+import pytest
+from sqlalchemy import select
+
+from app.api import db_manager as dbm
+from app.api import shared_cache
+from app.api.db import database, movies
+from app.api.models import MovieIn
+
+
+async def add_movies(*movies: dict) -> list:
+    return [await dbm.add_movie(MovieIn(**{"plot": "Plot", "genres": ["drama"],
+                                           "casts_id": [], **movie}))
+            for movie in movies]
+
+
+def names(response) -> list:
+    return [movie["name"] for movie in response.json()]
+
+
+async def stored_names() -> list:
+    rows = await database.fetch_all(select(movies.c.name).order_by(movies.c.id))
+    return [row["name"] for row in rows]
+
+
+class TestEndpointExpandCasts:
+    """
+    Test class for embedding cast details in movie responses with '?expand=casts'.
+    """
+    def test_get_movie_expand_casts(self, test_app, cast_service, mock_get_movies):
+        """
+        Test that a movie embeds the details of its existing cast members.
+
+        This test case requests a movie referencing a cast member unknown to
+        cast_service and checks that only the known one is embedded, that 'casts_id'
+        is left as stored, and that without 'expand' the movie has no 'casts'.
+        """
+        response = test_app.get("1/?expand=casts")
+        plain = test_app.get("1/")
+
+        assert response.status_code == 200
+        movie = response.json()
+        assert movie["casts_id"] == [1, 3]
+        assert movie["casts"] == [cast_service.casts[1]]
+        assert "last-modified" not in response.headers
+        assert "casts" not in plain.json()
+        assert plain.headers["etag"] != response.headers["etag"]
+
+    def test_etag_follows_cast_details(self, test_app, cast_service, mock_get_movies):
+        """
+        Test that the ETag of an expanded movie changes with the embedded cast details.
+
+        This test case revalidates an expanded movie before and after a cast member
+        was renamed and its cached lookup dropped by the change hook. It checks the
+        304 (Not Modified) and then the full response with the new name.
+        """
+        etag = test_app.get("2/?expand=casts").headers["etag"]
+        not_modified = test_app.get("2/?expand=casts", headers={"If-None-Match": etag})
+        cast_service.casts[2] = {**cast_service.casts[2], "name": "Renamed"}
+        test_app.delete("_cache/casts/2/")
+        changed = test_app.get("2/?expand=casts", headers={"If-None-Match": etag})
+
+        assert not_modified.status_code == 304
+        assert changed.status_code == 200
+        assert changed.json()["casts"][0]["name"] == "Renamed"
+
+    def test_get_movies_expand_casts(self, test_app, cast_service, mock_get_movies):
+        """
+        Test that a page of movies looks up all of its cast members in one call.
+
+        This test case requests a page of movies sharing a cast member and checks
+        that cast_service was asked once for every distinct ID, and that each movie
+        embeds its own cast members in the order of 'casts_id'.
+        """
+        response = test_app.get("?expand=casts")
+
+        assert response.status_code == 200
+        assert [[cast["id"] for cast in movie["casts"]] for movie in response.json()] == [
+            [1], [2, 1]]
+        assert len(cast_service.requests) == 1
+        assert json.loads(cast_service.requests[0].content) == {"ids": [1, 3, 2]}
+
+    def test_expand_with_ndjson(self, test_app, mock_get_movies):
+        """
+        Test that 'expand' is rejected for the streamed NDJSON list.
+        """
+        response = test_app.get("?expand=casts&format=ndjson")
+
+        assert response.status_code == 400
+
+    def test_expand_cast_service_unavailable(self, test_app, cast_service, mock_get_movies):
+        """
+        Test that an expanded movie answers 503 when cast_service can not be reached.
+        """
+        cast_service.failures = [503] * 3
+
+        response = test_app.get("1/?expand=casts")
+
+        assert response.status_code == 503
+        assert "retry-after" in response.headers
+
+
+class TestEndpointSearchMovies:
+    """
+    Test class for the 'search_movies' endpoint, the full-text search over names and plots.
+    """
+    @pytest.fixture
+    def searched_movies(self, empty_database):
+        empty_database(add_movies,
+                       {"name": "Ocean Drift", "plot": "A quiet story."},
+                       {"name": "Quiet Harbor", "plot": "Fishermen sail the ocean every day."},
+                       {"name": "Summit", "plot": "Oceans of snow.", "genres": ["documentary"]},
+                       {"name": "City", "plot": "Nothing to see."})
+
+    def test_search_ranks_name_first(self, test_app, searched_movies):
+        """
+        Test that matches in the name rank above matches in the plot.
+
+        This test case searches a word found in a name, in a plot and, stemmed, in
+        another plot. It checks that the name match comes first, then the plot
+        matches by id, and that movies without the word are left out.
+        """
+        response = test_app.get("search?q=ocean")
+
+        assert response.status_code == 200
+        assert names(response) == ["Ocean Drift", "Quiet Harbor", "Summit"]
+        assert "x-next-offset" not in response.headers
+
+    def test_search_web_syntax(self, test_app, searched_movies):
+        """
+        Test that phrases, excluded words and 'or' follow the web search syntax.
+        """
+        assert names(test_app.get("search", params={"q": '"sail the ocean"'})) == [
+            "Quiet Harbor"]
+        assert names(test_app.get("search", params={"q": "ocean -quiet"})) == ["Summit"]
+        assert names(test_app.get("search", params={"q": "snow or nothing"})) == [
+            "Summit", "City"]
+
+    def test_search_pages(self, test_app, searched_movies):
+        """
+        Test that the results are paged with 'limit' and 'offset' in rank order.
+
+        This test case reads the results two at a time and checks that the first
+        page points to the offset of the second one, which is the last page.
+        """
+        first = test_app.get("search?q=ocean&limit=2")
+        second = test_app.get(f"search?q=ocean&limit=2&offset={first.headers['x-next-offset']}")
+
+        assert names(first) == ["Ocean Drift", "Quiet Harbor"]
+        assert first.headers["x-next-offset"] == "2"
+        assert names(second) == ["Summit"]
+        assert "x-next-offset" not in second.headers
+
+    def test_search_genre(self, test_app, searched_movies):
+        """
+        Test that 'genre' narrows the results down.
+        """
+        response = test_app.get("search?q=ocean&genre=documentary")
+
+        assert names(response) == ["Summit"]
+
+    def test_search_empty_query(self, test_app, searched_movies):
+        """
+        Test that an empty query is rejected and one without searchable words finds nothing.
+        """
+        assert test_app.get("search?q=").status_code == 422
+
+        response = test_app.get("search", params={"q": "the of and"})
+
+        assert response.status_code == 200
+        assert response.json() == []
+
+    @pytest.mark.parametrize("q, found", [
+        ('"ocean', ["Ocean Drift", "Quiet Harbor", "Summit"]),
+        ("ocean & | ! ( ) :*", ["Ocean Drift", "Quiet Harbor", "Summit"]),
+        ("ocean <-> drift", ["Ocean Drift"]),
+        ("ocean or", ["Ocean Drift", "Quiet Harbor", "Summit"]),
+        ("-ocean", ["City"]),
+        ("'; DROP TABLE movies; --", []),
+        ("\\", []),
+        ("\u00e9t\u00e9", []),
+    ])
+    def test_search_special_characters(self, test_app, searched_movies, q, found):
+        """
+        Test that characters meaningful to tsquery are taken as text, not as a syntax.
+
+        This test case searches queries that 'to_tsquery' would reject and checks
+        that the search answers them, finding the movies of the words they contain.
+        """
+        response = test_app.get("search", params={"q": q})
+
+        assert response.status_code == 200
+        assert names(response) == found
+
+
+class TestEndpointFilterMovies:
+    """
+    Test class for the 'genre', 'cast_id' and 'name_prefix' filters of the 'get_movies' endpoint.
+    """
+    @pytest.fixture
+    def filtered_movies(self, empty_database):
+        empty_database(add_movies,
+                       {"name": "Star Wars", "genres": ["scifi", "action"], "casts_id": [1, 2]},
+                       {"name": "Stardust", "genres": ["fantasy"], "casts_id": [2]},
+                       {"name": "star", "genres": ["scifi"], "casts_id": [2]},
+                       {"name": "100% Love", "genres": ["romance"]},
+                       {"name": "1000 Days", "genres": ["romance"]},
+                       {"name": "A_B", "casts_id": [2]},
+                       {"name": "AxB", "casts_id": [2]},
+                       {"name": "St\u00e9phane", "casts_id": [2]})
+
+    @pytest.mark.parametrize("params, found", [
+        ({"genre": "scifi"}, ["Star Wars", "star"]),
+        ({"genre": "western"}, []),
+        ({"cast_id": 1}, ["Star Wars"]),
+        ({"name_prefix": "Star"}, ["Star Wars", "Stardust"]),
+        ({"name_prefix": "St\u00e9"}, ["St\u00e9phane"]),
+        ({"name_prefix": "100%"}, ["100% Love"]),
+        ({"name_prefix": "A_"}, ["A_B"]),
+        ({"genre": "scifi", "cast_id": 2, "name_prefix": "Star"}, ["Star Wars"]),
+    ])
+    def test_filters(self, test_app, filtered_movies, params, found):
+        """
+        Test that the filters select matching movies only, and combine with each other.
+
+        This test case filters by genre, cast member and name prefix, alone and
+        together. It checks that the prefix is case sensitive and that '%' and '_'
+        are matched literally rather than as wildcards.
+        """
+        response = test_app.get("", params=params)
+
+        assert response.status_code == 200
+        assert names(response) == found
+
+    def test_filters_with_keyset_pagination(self, test_app, filtered_movies):
+        """
+        Test that filtered results are paged with the 'after_id' cursor.
+
+        This test case lists the movies of a cast member three at a time, following
+        'X-Next-Cursor', and checks that pages hold filtered movies only, in id order,
+        until a last page without cursor.
+        """
+        pages, params = [], {"cast_id": 2, "limit": 3}
+        while True:
+            response = test_app.get("", params=params)
+            pages.append(names(response))
+            if "x-next-cursor" not in response.headers:
+                break
+            params["after_id"] = response.headers["x-next-cursor"]
+
+        assert pages == [["Star Wars", "Stardust", "star"], ["A_B", "AxB", "St\u00e9phane"]]
+
+    @pytest.mark.parametrize("prefix, bounds", [
+        ("Sta", ("Sta", "Stb")),
+        ("a\U0010ffff", ("a\U0010ffff", "b")),
+        ("\U0010ffff", ("\U0010ffff", None)),
+        ("\ud7ff", ("\ud7ff", "\ue000")),
+    ])
+    def test_prefix_bounds(self, prefix, bounds):
+        """
+        Test the bounds of the names starting with a prefix, at the end of the code points.
+        """
+        assert dbm.prefix_bounds(prefix) == bounds
+
+
+class TestEndpointBulkCreateMovies:
+    """
+    Test class for the 'bulk_create_movies' endpoint.
+    """
+    @staticmethod
+    def movie(name: str, casts_id: list) -> dict:
+        return {"name": name, "plot": "Plot", "genres": ["drama"], "casts_id": casts_id}
+
+    def test_bulk_create_checks_casts_once(self, test_app, empty_database, cast_service,
+                                           mock_get_known_casts):
+        """
+        Test that the casts of a whole request are checked with a single lookup.
+
+        This test case creates movies sharing cast members, some of which do not
+        exist. It checks that cast_service was asked once for every distinct ID,
+        that a movie missing several cast members gets one 404 listing all of them,
+        and that only the other movies were stored.
+        """
+        response = test_app.post("_bulk", json=[
+            self.movie("First", [1, 2]),
+            self.movie("Second", [3, 2, 4, 3]),
+            self.movie("Third", [1]),
+            self.movie("Fourth", [4]),
+        ])
+
+        assert response.status_code == 200
+        body = response.json()
+        assert (body["created"], body["failed"]) == (2, 2)
+        assert [result["status"] for result in body["results"]] == [201, 404, 201, 404]
+        assert body["results"][1]["detail"] == "Casts with given ids: 3, 4 not found"
+        assert len(cast_service.requests) == 1
+        assert json.loads(cast_service.requests[0].content) == {"ids": [1, 2, 3, 4]}
+        assert empty_database(stored_names) == ["First", "Third"]
+
+    def test_bulk_create_rejected_rows(self, test_app, empty_database, cast_service,
+                                       mock_get_known_casts):
+        """
+        Test that a row rejected by the database only fails its own item.
+
+        This test case sends NDJSON with a line that is not JSON, a movie failing
+        validation and one the database rejects (a NUL character). It checks that
+        the rejected chunk is retried item by item, so the other movies are stored
+        once each, and that every failure is reported at its index.
+        """
+        lines = [json.dumps(self.movie("First", [1])), "{not json",
+                 json.dumps(self.movie("x" * 51, [1])),
+                 json.dumps(self.movie("Nul\u0000", [1])),
+                 json.dumps(self.movie("Fifth", [2]))]
+
+        response = test_app.post("_bulk", content="\n".join(lines),
+                                 headers={"Content-Type": "application/x-ndjson"})
+
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [result["status"] for result in results] == [201, 400, 422, 422, 201]
+        assert results[3]["detail"].startswith("Rejected by the database")
+        assert empty_database(stored_names) == ["First", "Fifth"]
+
+    def test_bulk_create_cast_service_unavailable(self, test_app, empty_database,
+                                                  cast_service, mock_get_known_casts):
+        """
+        Test that the movies of a chunk fail with 503 when their casts can not be checked.
+        """
+        cast_service.failures = [503] * 3
+
+        response = test_app.post("_bulk", json=[self.movie("First", [1]),
+                                                self.movie("Second", [2])])
+
+        assert [result["status"] for result in response.json()["results"]] == [503, 503]
+        assert empty_database(stored_names) == []
+
+
+class TestEndpointUpdateMovie:
+    """
+    Test class for the 'update_movie', 'patch_movie' and 'delete_movie' endpoints.
+    """
+    @pytest.fixture
+    def writes(self, monkeypatch):
+        """
+        Record the statements sent to the database and the reads and cached entries
+        dropped by the endpoints.
+        """
+        recorded = {"statements": 0, "forgotten": [], "invalidated": []}
+        for method in ("fetch_one", "fetch_all", "fetch_val", "execute"):
+            def counted(*args, _method=getattr(database, method), **kwargs):
+                recorded["statements"] += 1
+                return _method(*args, **kwargs)
+            monkeypatch.setattr(database, method, counted)
+        monkeypatch.setattr(dbm.get_movie, "forget", recorded["forgotten"].append)
+
+        async def invalidate(namespace, *record_ids):
+            recorded["invalidated"].append((namespace, *record_ids))
+        monkeypatch.setattr(shared_cache, "invalidate", invalidate)
+        return recorded
+
+    @pytest.fixture
+    def movie_id(self, empty_database):
+        [movie_id] = empty_database(add_movies, {"name": "Movie", "plot": "Plot"})
+        return movie_id
+
+    def test_update_movie(self, test_app, empty_database, movie_id, writes):
+        """
+        Test that PUT and PATCH update the movie with a single statement each.
+
+        This test case updates a movie with PUT, then PATCH. It checks that every
+        update bumps the version and the modification time in the same statement
+        that returns the movie, and that the movie is dropped from the in-flight
+        reads and the shared cache.
+        """
+        row = select(movies.c.version, movies.c.updated_at).where(movies.c.id == movie_id)
+        before = empty_database(database.fetch_one, row)
+        writes["statements"] = 0
+
+        put = test_app.put(f"{movie_id}/", json={"name": "Renamed"})
+        patch = test_app.patch(f"{movie_id}/", json={"plot": "New plot"})
+
+        assert put.status_code == patch.status_code == 200
+        assert patch.json() == {"id": movie_id, "name": "Renamed", "plot": "New plot",
+                                "genres": ["drama"], "casts_id": []}
+        assert writes["statements"] == 2
+        assert writes["forgotten"] == [movie_id, movie_id]
+        assert writes["invalidated"] == [("movies", movie_id), ("movies", movie_id)]
+        after = empty_database(database.fetch_one, row)
+        assert after["version"] == before["version"] + 2
+        assert after["updated_at"] > before["updated_at"]
+
+    @pytest.mark.parametrize("method", ["put", "patch", "delete"])
+    def test_missing_movie(self, test_app, movie_id, writes, method):
+        """
+        Test that writing a missing movie answers 404 after a single statement.
+        """
+        response = test_app.request(method, f"{movie_id + 1}/",
+                                    json=None if method == "delete" else {"name": "Renamed"})
+
+        assert response.status_code == 404
+        assert writes["statements"] == 1
+
+    def test_delete_movie(self, test_app, movie_id, writes):
+        """
+        Test that a deleted movie is gone and dropped from the reads and the shared cache.
+        """
+        response = test_app.delete(f"{movie_id}/")
+
+        assert response.status_code == 200
+        assert writes["statements"] == 1
+        assert writes["forgotten"] == [movie_id]
+        assert writes["invalidated"] == [("movies", movie_id)]
+        assert test_app.get(f"{movie_id}/").status_code == 404
+
+
+class TestEndpointConditionalGet:
+    """
+    Test class for conditional GETs of movies with 'ETag' and 'Last-Modified'.
+    """
+    @pytest.fixture
+    def movie_ids(self, empty_database):
+        return empty_database(add_movies, {"name": "First"}, {"name": "Second"})
+
+    def test_get_movie_not_modified(self, test_app, movie_ids):
+        """
+        Test revalidation of a movie with its ETag.
+
+        This test case reads a movie and checks its validators, then repeats the
+        request with the ETag in 'If-None-Match' (among other, weak, tags). It checks
+        that the answer is a 304 (Not Modified) without a body, and that another
+        movie does not match the ETag.
+        """
+        first, second = movie_ids
+        response = test_app.get(f"{first}/")
+        etag = response.headers["etag"]
+
+        assert response.status_code == 200
+        assert response.headers["last-modified"].endswith(" GMT")
+        assert response.headers["cache-control"] == "no-cache"
+
+        not_modified = test_app.get(f"{first}/", headers={"If-None-Match": f'"stale", W/{etag}'})
+        other = test_app.get(f"{second}/", headers={"If-None-Match": etag})
+
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+        assert not_modified.headers["etag"] == etag
+        assert other.status_code == 200
+
+    def test_get_movie_if_modified_since(self, test_app, movie_ids):
+        """
+        Test revalidation of a movie with its modification date.
+
+        This test case checks that the date of the last update gives a 304 (Not
+        Modified), that an earlier or malformed date returns the movie, and that
+        'If-None-Match' decides when both are sent.
+        """
+        last_modified = test_app.get(f"{movie_ids[0]}/").headers["last-modified"]
+
+        def get(**headers):
+            return test_app.get(f"{movie_ids[0]}/", headers=headers).status_code
+
+        assert get(**{"If-Modified-Since": last_modified}) == 304
+        assert get(**{"If-Modified-Since": "Sat, 30 Sep 2023 12:00:00 GMT"}) == 200
+        assert get(**{"If-Modified-Since": "yesterday"}) == 200
+        assert get(**{"If-Modified-Since": last_modified, "If-None-Match": '"stale"'}) == 200
+
+    def test_etag_changes_after_update(self, test_app, movie_ids):
+        """
+        Test that the ETags of a movie and of the pages listing it change when it is updated.
+
+        This test case revalidates a movie and the first page of movies after a PUT of
+        the movie and checks that both are sent again, with new ETags.
+        """
+        movie_id = movie_ids[0]
+        movie = test_app.get(f"{movie_id}/")
+        page = test_app.get("")
+        assert test_app.get("", headers={"If-None-Match": page.headers["etag"]}).status_code == 304
+
+        test_app.put(f"{movie_id}/", json={"name": "Renamed"})
+        movie_after = test_app.get(f"{movie_id}/",
+                                   headers={"If-None-Match": movie.headers["etag"]})
+        page_after = test_app.get("", headers={"If-None-Match": page.headers["etag"]})
+
+        assert movie_after.status_code == page_after.status_code == 200
+        assert movie_after.json()["name"] == "Renamed"
+        assert movie_after.headers["etag"] != movie.headers["etag"]
+        assert page_after.headers["etag"] != page.headers["etag"]
+
+
+class TestEndpointRemoveCastFromMovies:
+    """
+    Test class for the 'remove_cast_from_movies' endpoint, the set-based cleanup of a cast.
+    """
+    def test_remove_cast_from_movies(self, test_app, empty_database, monkeypatch):
+        """
+        Test that a cast is removed from every movie referencing it, and only from them.
+
+        This test case removes a cast referenced by two movies, once of them twice,
+        and checks that it is gone from both while their other casts stay in order,
+        that only their versions were bumped and their cached entries dropped.
+        """
+        movie_ids = empty_database(add_movies,
+                                   {"name": "First", "casts_id": [1, 7, 2, 7]},
+                                   {"name": "Second", "casts_id": [3]},
+                                   {"name": "Third", "casts_id": [7]})
+        invalidated = []
+
+        async def invalidate(namespace, *record_ids):
+            invalidated.append((namespace, *record_ids))
+        monkeypatch.setattr(shared_cache, "invalidate", invalidate)
+
+        response = test_app.delete("_casts/7/")
+
+        assert response.status_code == 200
+        assert response.json() == {"updated": 2}
+        rows = empty_database(database.fetch_all, select(movies.c.casts_id, movies.c.version)
+                              .order_by(movies.c.id))
+        assert [(row["casts_id"], row["version"]) for row in rows] == [
+            ([1, 2], 2), ([3], 1), ([], 2)]
+        assert invalidated == [("movies", movie_ids[0], movie_ids[2])]
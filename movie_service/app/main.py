@@ -1,20 +1,46 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from app.api.movies import movies
-from app.api.db import metadata, database, engine
+from app.api.compression import CompressionMiddleware
+from app.api.db import PoolAcquireTimeout, connect_database, database
+from app.api.metrics import (MetricsMiddleware, metrics, start_loop_monitor,
+                             stop_loop_monitor)
+from app.api.replicas import ReadYourWritesMiddleware, reads
+from app.api import cast_changes, cast_client, cast_events, shared_cache
 
-metadata.create_all(engine)
 app = FastAPI(openapi_url="/api/v1/movies/openapi.json",
               docs_url="/api/v1/movies/docs")
 
 
 @app.on_event("startup")
 async def startup():
-    await database.connect()
+    await connect_database()
+    await reads.start()
+    await cast_client.open_client()
+    await shared_cache.open_cache()
+    start_loop_monitor()
+    await cast_changes.start_listener()
+    cast_events.start_consumer()
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    await stop_loop_monitor()
+    await cast_events.stop_consumer()
+    await cast_changes.stop_listener()
+    await cast_client.close_client()
+    await shared_cache.close_cache()
+    await reads.stop()
     await database.disconnect()
 
 
+@app.exception_handler(PoolAcquireTimeout)
+async def pool_acquire_timeout_handler(request: Request, exc: PoolAcquireTimeout):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_route("/metrics", metrics, include_in_schema=False)
 app.include_router(movies, prefix='/api/v1/movies', tags=['movies'])
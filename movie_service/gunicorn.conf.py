@@ -0,0 +1,38 @@
+"""gunicorn settings of the production run mode.
+
+Start with ``gunicorn app.main:app`` from the service directory; every setting
+can be overridden from the environment.
+"""
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+# One event loop per CPU, the workers are asynchronous so more would only compete for it.
+workers = int(os.environ.get("GUNICORN_WORKERS") or len(os.sched_getaffinity(0)))
+# The uvicorn worker picks uvloop and httptools, both are in requirements.txt.
+worker_class = "uvicorn.workers.UvicornWorker"
+# Seconds in-flight requests get to finish on SIGTERM before the worker is killed,
+# the application shutdown closes the outbound HTTP client and the database pool.
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 75))
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+
+# The workers size their database pool from the number of workers (app/api/db.py).
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+
+def on_starting(server):
+    # Metrics of the workers are aggregated through files, drop those of a previous run.
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,47 @@
+"""Create movies table
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    # Databases created before migrations were introduced already have the table.
+    if not inspector.has_table('movies'):
+        op.create_table(
+            'movies',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('name', sa.String(50)),
+            sa.Column('plot', sa.String(250)),
+            sa.Column('genres', postgresql.ARRAY(sa.String)),
+            sa.Column('casts_id', postgresql.ARRAY(sa.Integer)),
+        )
+        existing_indexes = set()
+    else:
+        existing_indexes = {index['name'] for index in inspector.get_indexes('movies')}
+
+    if 'ix_movies_genres' not in existing_indexes:
+        op.create_index('ix_movies_genres', 'movies', ['genres'],
+                        postgresql_using='gin')
+    if 'ix_movies_casts_id' not in existing_indexes:
+        op.create_index('ix_movies_casts_id', 'movies', ['casts_id'],
+                        postgresql_using='gin')
+    if 'ix_movies_name_prefix' not in existing_indexes:
+        op.create_index('ix_movies_name_prefix', 'movies', ['name'],
+                        postgresql_ops={'name': 'text_pattern_ops'})
+
+
+def downgrade():
+    op.drop_table('movies')
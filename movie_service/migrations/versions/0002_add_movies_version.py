@@ -0,0 +1,26 @@
+"""Add version and updated_at to movies
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 13:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('movies', sa.Column('version', sa.Integer, nullable=False,
+                                      server_default='1'))
+    op.add_column('movies', sa.Column('updated_at', sa.DateTime(timezone=True),
+                                      nullable=False, server_default=sa.func.now()))
+
+
+def downgrade():
+    op.drop_column('movies', 'updated_at')
+    op.drop_column('movies', 'version')
@@ -0,0 +1,31 @@
+"""Create known_casts replica and event_cursors tables
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 14:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'known_casts',
+        sa.Column('id', sa.Integer, primary_key=True),
+    )
+    op.create_table(
+        'event_cursors',
+        sa.Column('name', sa.String(50), primary_key=True),
+        sa.Column('position', sa.BigInteger, nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table('event_cursors')
+    op.drop_table('known_casts')
@@ -0,0 +1,31 @@
+"""Add full-text search_vector to movies
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 15:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+SEARCH_VECTOR = ("setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+                 "setweight(to_tsvector('english', coalesce(plot, '')), 'B')")
+
+
+def upgrade():
+    # A stored generated column rewrites the table once and is kept up to date by PostgreSQL.
+    op.add_column('movies', sa.Column('search_vector', postgresql.TSVECTOR,
+                                      sa.Computed(SEARCH_VECTOR, persisted=True)))
+    op.create_index('ix_movies_search_vector', 'movies', ['search_vector'],
+                    postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_movies_search_vector', table_name='movies')
+    op.drop_column('movies', 'search_vector')
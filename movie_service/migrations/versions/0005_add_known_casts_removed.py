@@ -0,0 +1,24 @@
+"""Keep deleted casts in known_casts as tombstones
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 10:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('known_casts', sa.Column('removed', sa.Boolean, nullable=False,
+                                           server_default=sa.false()))
+
+
+def downgrade():
+    op.execute("DELETE FROM known_casts WHERE removed")
+    op.drop_column('known_casts', 'removed')